@@ -1,8 +1,55 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-from io import BytesIO
 from datetime import datetime
+from functools import partial
+import hashlib
+import uuid
+
+from motor_sugerido import (
+    HOJA_TIENDAS,
+    HOJA_BODEGA,
+    HOJA_PARAMETROS,
+    HOJA_EXCEPCIONES,
+    HOJA_CAPACIDAD,
+    HOJA_ASIGNACION,
+    COBERTURA_DIAS,
+    ESTADOS,
+    MODO_MINIMO,
+    MODO_VELOCIDAD,
+    NIVEL_ERROR,
+    PESO_ULTIMA_SEMANA,
+    REPARTO_PROPORCIONAL,
+    REPARTO_SECUENCIAL,
+    VERSION_MOTOR,
+    CacheLRU,
+    calcular_resumenes,
+    crear_template_descargable,
+    filtrar_resultados,
+    formatear_razon,
+    generar_reporte_descargable,
+    generar_reporte_parquet,
+    leer_entradas,
+    resumir_errores,
+    validar_capacidades,
+    validar_entradas,
+    validar_excepciones,
+)
+from sugerido_almacen import AlmacenDatos, stock_a_tabla, tabla_a_stock
+from sugerido_escenarios import barrer_escenarios
+from sugerido_historial import HistorialCorridas
+from sugerido_incremental import RecalculoIncremental
+from sugerido_metricas import RegistroRendimiento, configurar_log_json
+from sugerido_multibodega import (
+    ETAPA_BODEGAS,
+    ETAPA_RESPALDO,
+    calcular_resumenes_multibodega,
+    calcular_sugerido_multibodega,
+    revisar_bodegas,
+    stock_por_sku,
+    validar_asignacion,
+)
+from sugerido_picking import FORMATOS_PICKING, generar_listas_picking
+from sugerido_tareas import CANCELADA, ERROR, TERMINADA, GestorTareas, calcular_sugerido_por_bloques
 
 # Configuración de página
 st.set_page_config(
@@ -70,252 +117,302 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# ==================== FUNCIONES AUXILIARES ====================
+# ==================== RENDIMIENTO ====================
 
-def crear_template_descargable():
-    """Crea un template Excel descargable con estructura actualizada"""
-    output = BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Hoja 1: Stock Tiendas (CON PRIORIDAD)
-        df_tiendas = pd.DataFrame({
-            'tienda_id': ['T001', 'T001', 'T001', 'T002', 'T002', 'T003', 'T003'],
-            'sku': ['SKU-001', 'SKU-002', 'SKU-003', 'SKU-001', 'SKU-002', 'SKU-001', 'SKU-003'],
-            'producto': ['Producto A', 'Producto B', 'Producto C', 'Producto A', 'Producto B', 'Producto A', 'Producto C'],
-            'stock_actual': [8, 0, 5, 3, 12, 1, 0],
-            'venta_ultima_semana': [5, 0, 2, 4, 6, 3, 0],
-            'venta_4_semanas': [22, 0, 8, 18, 24, 12, 0],
-            'tipo_carga': ['reposicion', 'inicial', 'reposicion', 'reposicion', 'reposicion', 'reposicion', 'inicial'],
-            'prioridad_tienda': [1, 1, 1, 2, 2, 3, 3]
-        })
-        df_tiendas.to_excel(writer, sheet_name='Stock Tiendas', index=False)
-        
-        # Hoja 2: Stock Disponible Bodega
-        df_bodega = pd.DataFrame({
-            'sku': ['SKU-001', 'SKU-002', 'SKU-003'],
-            'producto': ['Producto A', 'Producto B', 'Producto C'],
-            'stock_bodega': [150, 80, 45]
-        })
-        df_bodega.to_excel(writer, sheet_name='Stock Bodega', index=False)
-        
-        # Hoja 3: Parámetros
-        df_params = pd.DataFrame({
-            'parametro': ['Carga Mínima (reposición)', 'Carga Inicial (productos nuevos)', 'Máximo por SKU/Tienda'],
-            'valor': [2, 8, 20],
-            'descripcion': ['Mínimo de unidades por tienda', 'Unidades iniciales para nuevos productos', 'Máximo de unidades por SKU en una tienda']
-        })
-        df_params.to_excel(writer, sheet_name='Parámetros', index=False)
-        
-        # Hoja 4: Instrucciones
-        df_instrucciones = pd.DataFrame({
-            'Campo': ['tienda_id', 'sku', 'producto', 'stock_actual', 'venta_ultima_semana', 'venta_4_semanas', 'tipo_carga', 'prioridad_tienda'],
-            'Descripción': [
-                'ID único de la tienda (ej: T001)',
-                'Código único del SKU (ej: SKU-001)',
-                'Nombre del producto (opcional)',
-                'Unidades actuales en tienda',
-                'Venta en últimos 7 días',
-                'Venta en últimas 4 semanas',
-                'Marca como "reposicion" o "inicial"',
-                'Orden de carga: 1=primero, 5=último'
-            ],
-            'Ejemplo': ['T001', 'SKU-001', 'Producto A', '8', '5', '22', 'reposicion', '1']
-        })
-        df_instrucciones.to_excel(writer, sheet_name='Instrucciones', index=False)
-        
-        writer.close()
-    
-    output.seek(0)
-    return output
+@st.cache_resource
+def configurar_logs():
+    """Activa (una vez por proceso) las líneas JSON de métricas por etapa en stderr"""
+    return configurar_log_json()
+
+def obtener_registro():
+    """Registro de rendimiento de la sesión"""
+    if 'rendimiento' not in st.session_state:
+        st.session_state['rendimiento'] = RegistroRendimiento()
+    return st.session_state['rendimiento']
+
+def id_sesion():
+    """Identificador de la sesión, para las tareas de fondo que espera"""
+    if 'id_sesion' not in st.session_state:
+        st.session_state['id_sesion'] = uuid.uuid4().hex
+    return st.session_state['id_sesion']
+
+configurar_logs()
+registro = obtener_registro()
+
+# ==================== CACHÉ DE RESULTADOS ====================
 
-def calcular_sugerido_con_prioridad(df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima):
+@st.cache_resource
+def obtener_cache_sugerido():
+    """Caché compartida de sugeridos y reportes, indexada por hash de entradas y parámetros"""
+    return CacheLRU(max_entradas=8)
+
+@st.cache_resource
+def obtener_almacen():
+    """Almacén compartido de entradas y resultados por hash, con presupuesto de memoria y expulsión a Parquet"""
+    return AlmacenDatos()
+
+def datos_sesion(nombre):
+    """DataFrame de la sesión ('tiendas', 'bodega', 'resultados', ...) desde el almacén compartido, o None"""
+    clave = st.session_state.get(f'hash_{nombre}')
+    return obtener_almacen().obtener(clave) if clave is not None else None
+
+def clave_almacen(tipo, clave):
     """
-    Calcula el sugerido de carga respetando:
-    1. PRIORIDAD de tiendas
-    2. MÁXIMO de carga por SKU/tienda
+    Clave en el almacén de un resultado: lo determinan las entradas y parámetros de su clave
+    y VERSION_MOTOR (tras una actualización no se reutilizan resultados guardados en disco)
     """
-    
-    # Crear copia mutable del stock bodega
-    stock_bodega_disponible = df_bodega.set_index('sku')['stock_bodega'].to_dict()
-    
-    # Ordenar por prioridad_tienda
-    df_tiendas_ordenadas = df_tiendas.sort_values(['prioridad_tienda', 'tienda_id', 'sku']).reset_index(drop=True)
-    
-    resultados = []
-    orden_carga = 0
-    
-    for idx, row in df_tiendas_ordenadas.iterrows():
-        orden_carga += 1
-        
-        sku = row['sku']
-        tienda = row['tienda_id']
-        stock_actual = row['stock_actual']
-        tipo_carga = row['tipo_carga']
-        prioridad = row['prioridad_tienda']
-        
-        # Obtener stock disponible en bodega
-        stock_bodega = stock_bodega_disponible.get(sku, 0)
-        
-        # Determinar cantidad sugerida
-        if tipo_carga.lower() == 'inicial':
-            cantidad_sugerida = carga_inicial
-            razon = f"Carga inicial (nuevo producto)"
-        else:  # reposición
-            cantidad_sugerida = max(0, carga_minima - stock_actual)
-            if cantidad_sugerida == 0:
-                razon = "Tienda en nivel mínimo"
-            else:
-                razon = f"Reposición a mínimo ({carga_minima} unidades)"
-        
-        # APLICAR MÁXIMO DE CARGA por SKU/tienda
-        cantidad_sugerida = min(cantidad_sugerida, carga_maxima)
-        
-        # Ajustar por disponibilidad en bodega
-        cantidad_real = min(cantidad_sugerida, stock_bodega)
-        
-        if cantidad_real < cantidad_sugerida and cantidad_sugerida > 0:
-            estado = "Parcialmente cargada"
-            razon += f" (solo {cantidad_real} de {cantidad_sugerida} disponibles)"
-        elif cantidad_real == 0 and cantidad_sugerida > 0:
-            estado = "No cargada"
-            razon += " (bodega insuficiente)"
+    return f"{tipo}-{VERSION_MOTOR}-{hashlib.sha1(repr(clave).encode()).hexdigest()}"
+
+def stock_final_sesion():
+    """stock_bodega_final de la sesión como dict por SKU"""
+    return tabla_a_stock(datos_sesion('stock_final'))
+
+@st.cache_resource
+def obtener_tareas():
+    """Tareas de cálculo en segundo plano, compartidas por las sesiones (una por clave de entradas y parámetros)"""
+    return GestorTareas()
+
+def calcular_en_fondo(progreso, clave, df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, almacen, cache,
+                      rendimiento, recalculo=None, opciones=None, df_asignacion=None):
+    """
+    Cuerpo de la tarea de fondo del Paso 4: calcula el sugerido (informando los SKU
+    procesados en progreso), sus resumenes y el reporte, y los deja en la caché.
+    Corre en un hilo sin contexto de Streamlit: el almacén, la caché y el registro de
+    rendimiento (de la sesión que la inició) llegan resueltos como argumentos.
+    opciones (modo de demanda, reparto, excepciones y capacidades) se pasa al cálculo y debe estar incluida en la clave.
+    Con un RecalculoIncremental solo se recalculan los SKU que cambiaron desde su última corrida.
+    Con df_asignacion se calcula por bodega (sin recálculo incremental) y se informan las bodegas calculadas.
+    Retorna el número de SKU recalculados.
+    """
+    stock_bodegas = None
+    with rendimiento.etapa('calculo', filas=len(df_tiendas)) as medicion:
+        if df_asignacion is not None:
+            df_resultados, resumen_tiendas, stock_bodega_final, stock_bodegas = calcular_sugerido_multibodega(
+                df_tiendas, df_bodega, df_asignacion, carga_minima, carga_inicial, carga_maxima,
+                procesos=1, progreso=progreso, **(opciones or {})
+            )
+            skus_recalculados = df_resultados['sku'].nunique()
+        elif recalculo is not None:
+            # Con las mismas claves que abajo: el detalle y el stock final quedan una sola vez en el almacén
+            df_resultados, resumen_tiendas, stock_bodega_final, skus_recalculados = recalculo.calcular(
+                df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, progreso=progreso,
+                claves={tipo: clave_almacen(tipo, clave) for tipo in ('resultados', 'stock_final')}, **(opciones or {})
+            )
         else:
-            estado = "Completa" if cantidad_sugerida > 0 else "Sin necesidad"
-        
-        # Actualizar stock bodega
-        stock_bodega_disponible[sku] = stock_bodega - cantidad_real
-        disponible_despues = stock_bodega_disponible[sku]
-        stock_despues = stock_actual + cantidad_real
-        
-        resultados.append({
-            'tienda_id': tienda,
-            'sku': sku,
-            'producto': row.get('producto', sku),
-            'prioridad': prioridad,
-            'stock_antes': stock_actual,
-            'stock_despues': stock_despues,
-            'cantidad_a_despachar': cantidad_real,
-            'razon': razon,
-            'venta_ultima_semana': row.get('venta_ultima_semana', 0),
-            'venta_4_semanas': row.get('venta_4_semanas', 0),
-            'stock_bodega_disponible': stock_bodega,
-            'stock_bodega_despues': disponible_despues,
-            'tipo_carga': tipo_carga,
-            'orden_carga': orden_carga,
-            'estado': estado,
-            'carga_maxima_aplicada': carga_maxima
-        })
-    
-    df_resultados = pd.DataFrame(resultados)
-    
-    # Calcular resumen de completitud por tienda
-    resumen_tiendas = df_resultados.groupby('tienda_id').agg({
-        'estado': lambda x: (x == 'Completa').sum() / len(x),
-        'prioridad': 'first'
-    }).reset_index()
-    resumen_tiendas.columns = ['tienda_id', 'porcentaje_carga', 'prioridad']
+            df_resultados, resumen_tiendas, stock_bodega_final = calcular_sugerido_por_bloques(
+                df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, progreso=progreso, **(opciones or {})
+            )
+            skus_recalculados = df_resultados['sku'].nunique()
+        medicion['skus_recalculados'] = int(skus_recalculados)
+    progreso.actualizar('resumenes')
+    with rendimiento.etapa('resumenes', filas=len(df_resultados)):
+        if stock_bodegas is not None:
+            resumenes = calcular_resumenes_multibodega(df_resultados, df_bodega, stock_bodega_final, stock_bodegas)
+            df_bodega = stock_por_sku(df_bodega)
+        else:
+            resumenes = calcular_resumenes(df_resultados, df_bodega, stock_bodega_final)
+    # El detalle, el stock final (y por bodega) van al almacén compartido; la caché guarda sus claves y los resumenes
+    claves_almacen = (
+        almacen.guardar(df_resultados, clave=clave_almacen('resultados', clave)),
+        almacen.guardar(stock_a_tabla(stock_bodega_final), clave=clave_almacen('stock_final', clave)),
+        almacen.guardar(stock_bodegas, clave=clave_almacen('stock_bodegas', clave)) if stock_bodegas is not None else None
+    )
+    cache.guardar(('sugerido',) + clave, (claves_almacen, resumenes))
     
-    return df_resultados, resumen_tiendas, stock_bodega_disponible
+    # El reporte del Paso 5 queda listo en la misma tarea
+    progreso.actualizar('reporte')
+    generar_reporte_cacheado(clave, df_resultados, df_bodega, stock_bodega_final, resumenes=resumenes, cache=cache,
+                             rendimiento=rendimiento)
+    return int(skus_recalculados)
 
-def generar_reporte_descargable(df_resultados, df_bodega, stock_bodega_final):
-    """Genera un archivo Excel con los reportes de carga y bodega"""
-    output = BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Hoja 1: Resumen ejecutivo
-        total_unidades = df_resultados['cantidad_a_despachar'].sum()
-        tiendas_completas = (df_resultados.groupby('tienda_id')['estado'].apply(lambda x: (x == 'Completa').all())).sum()
-        tiendas_parciales = (df_resultados.groupby('tienda_id')['estado'].apply(lambda x: ((x == 'Parcialmente cargada').any() and (x != 'Completa').any()))).sum()
-        tiendas_no_cargadas = (df_resultados.groupby('tienda_id')['estado'].apply(lambda x: (x == 'No cargada').all())).sum()
-        
-        carga_maxima = df_resultados['carga_maxima_aplicada'].iloc[0] if len(df_resultados) > 0 else 0
-        
-        resumen = pd.DataFrame({
-            'Métrica': [
-                'Total unidades a despachar',
-                'Total SKUs a reponer',
-                'Tiendas completamente cargadas',
-                'Tiendas parcialmente cargadas',
-                'Tiendas no cargadas',
-                'Stock bodega inicial',
-                'Stock bodega final',
-                'Stock bodega usado',
-                'Máximo por SKU/Tienda (aplicado)'
-            ],
-            'Valor': [
-                total_unidades,
-                df_resultados['sku'].nunique(),
-                tiendas_completas,
-                tiendas_parciales,
-                tiendas_no_cargadas,
-                df_bodega['stock_bodega'].sum(),
-                sum(stock_bodega_final.values()),
-                df_bodega['stock_bodega'].sum() - sum(stock_bodega_final.values()),
-                carga_maxima
-            ]
-        })
-        resumen.to_excel(writer, sheet_name='Resumen', index=False)
-        
-        # Hoja 2: Detalle por tienda (en orden de prioridad)
-        df_por_tienda = df_resultados[['orden_carga', 'tienda_id', 'prioridad', 'sku', 'producto', 'stock_antes', 
-                                        'stock_despues', 'cantidad_a_despachar', 'tipo_carga', 'estado']].copy()
-        df_por_tienda = df_por_tienda.sort_values(['orden_carga', 'tienda_id', 'sku'])
-        df_por_tienda.to_excel(writer, sheet_name='Detalle Tiendas', index=False)
-        
-        # Hoja 3: Carga por Prioridad
-        df_prioridad = df_resultados.groupby(['prioridad', 'tienda_id']).agg({
-            'cantidad_a_despachar': 'sum',
-            'estado': lambda x: 'Completa' if (x == 'Completa').all() else ('Parcial' if (x == 'Parcialmente cargada').any() else 'No cargada')
-        }).reset_index()
-        df_prioridad = df_prioridad.rename(columns={
-            'prioridad': 'Prioridad',
-            'tienda_id': 'Tienda',
-            'cantidad_a_despachar': 'Total Despachar',
-            'estado': 'Estado'
-        })
-        df_prioridad.to_excel(writer, sheet_name='Carga por Prioridad', index=False)
-        
-        # Hoja 4: Impacto bodega
-        df_bodega_impacto = df_resultados.groupby('sku').agg({
-            'cantidad_a_despachar': 'sum',
-            'stock_bodega_disponible': 'first',
-            'stock_bodega_despues': 'first'
-        }).reset_index()
-        df_bodega_impacto['stock_bodega_final'] = df_bodega_impacto['sku'].map(stock_bodega_final)
-        df_bodega_impacto = df_bodega_impacto.rename(columns={
-            'sku': 'SKU',
-            'cantidad_a_despachar': 'Total Despachar',
-            'stock_bodega_disponible': 'Stock Antes',
-            'stock_bodega_despues': 'Stock Después (calculado)',
-            'stock_bodega_final': 'Stock Final (real)'
-        })
-        df_bodega_impacto.to_excel(writer, sheet_name='Impacto Bodega', index=False)
-        
-        # Hoja 5: Antes vs Después (agrupado por tienda)
-        pivot_antes_despues = df_resultados.groupby('tienda_id').agg({
-            'stock_antes': 'sum',
-            'stock_despues': 'sum',
-            'cantidad_a_despachar': 'sum',
-            'estado': lambda x: 'Completa' if (x == 'Completa').all() else ('Parcial' if (x == 'Parcialmente cargada').any() else 'No cargada'),
-            'prioridad': 'first'
-        }).reset_index()
-        pivot_antes_despues['diferencia'] = pivot_antes_despues['stock_despues'] - pivot_antes_despues['stock_antes']
-        pivot_antes_despues = pivot_antes_despues.rename(columns={
-            'tienda_id': 'Tienda',
-            'stock_antes': 'Stock Antes',
-            'stock_despues': 'Stock Después',
-            'cantidad_a_despachar': 'Despachar',
-            'diferencia': 'Cambio',
-            'estado': 'Estado',
-            'prioridad': 'Prioridad'
-        })
-        pivot_antes_despues = pivot_antes_despues[['Prioridad', 'Tienda', 'Stock Antes', 'Stock Después', 'Cambio', 'Despachar', 'Estado']]
-        pivot_antes_despues.to_excel(writer, sheet_name='Antes vs Después', index=False)
-        
-        writer.close()
+def tarea_sugerido(clave):
+    """Función de la tarea de fondo con los datos y parámetros actuales de la sesión"""
+    if 'recalculo' not in st.session_state:
+        # La corrida anterior queda en el almacén compartido; la sesión solo guarda sus claves
+        st.session_state['recalculo'] = RecalculoIncremental(almacen=obtener_almacen())
+    return partial(
+        calcular_en_fondo,
+        clave=clave,
+        df_tiendas=datos_sesion('tiendas'),
+        df_bodega=datos_sesion('bodega'),
+        carga_minima=st.session_state['carga_minima'],
+        carga_inicial=st.session_state['carga_inicial'],
+        carga_maxima=st.session_state['carga_maxima'],
+        almacen=obtener_almacen(),
+        cache=obtener_cache_sugerido(),
+        rendimiento=registro,
+        recalculo=st.session_state['recalculo'],
+        opciones={
+            **opciones_calculo(),
+            'excepciones': datos_sesion('excepciones'),
+            'capacidades': datos_sesion('capacidad')
+        },
+        df_asignacion=datos_sesion('asignacion')
+    )
+
+def resumenes_sesion():
+    """
+    Resumenes del sugerido de la sesión desde la caché. Si fueron expulsados, con varias
+    bodegas se recalculan con el stock por bodega; con una sola se retorna None y el
+    reporte los vuelve a calcular.
+    """
+    resultado = obtener_cache_sugerido().obtener(('sugerido',) + st.session_state['clave_sugerido'])
+    if resultado is not None:
+        return resultado[1]
+    if st.session_state.get('hash_stock_bodegas') is not None:
+        return calcular_resumenes_multibodega(
+            datos_sesion('resultados'), datos_sesion('bodega'), stock_final_sesion(), datos_sesion('stock_bodegas')
+        )
+    return None
+
+def bodega_red():
+    """'Stock Bodega' de la sesión; con varias bodegas, el stock de la red sumado por SKU"""
+    if st.session_state.get('hash_asignacion') is not None:
+        return stock_por_sku(datos_sesion('bodega'))
+    return datos_sesion('bodega')
+
+ETAPAS_TAREA = {
+    'calculo': "Calculando sugerido",
+    ETAPA_BODEGAS: "Calculando sugerido por bodega",
+    ETAPA_RESPALDO: "Completando desde bodegas de respaldo",
+    'resumenes': "Armando resumenes",
+    'reporte': "Generando reporte"
+}
+
+# Unidades del avance de las etapas que informan hechos de un total
+UNIDADES_TAREA = {'calculo': "SKUs", ETAPA_BODEGAS: "bodegas"}
+
+@st.fragment(run_every=1.0)
+def mostrar_avance(clave):
+    """Avance de la tarea de fondo; se actualiza cada segundo y recarga la página al terminar"""
+    tarea = obtener_tareas().obtener(clave)
+    if tarea is None or not tarea.activa:
+        st.rerun()
+    progreso = tarea.progreso
+    texto = ETAPAS_TAREA.get(progreso.etapa, "Preparando")
+    if progreso.etapa in UNIDADES_TAREA and progreso.total:
+        texto += f": {progreso.hechos:,} de {progreso.total:,} {UNIDADES_TAREA[progreso.etapa]}"
+    st.progress(progreso.fraccion(), text=f"⏳ {texto} ({tarea.segundos():.0f}s)")
+    # El reporte se escribe de una vez: solo el cálculo se puede cancelar
+    if progreso.cancelado:
+        st.caption("Cancelando en el siguiente bloque…")
+    elif progreso.etapa in (None, *UNIDADES_TAREA) and st.button("⏹️ Cancelar", key=f"cancelar_{hash(clave)}"):
+        # Cancela para esta sesión: si otra sesión espera la misma tarea, sigue corriendo para ella
+        tarea.cancelar(id_sesion())
+        st.session_state['tarea_cancelada'] = clave
+        st.rerun()
+
+def mostrar_tarea(clave, tarea):
+    """Estado de una tarea de fondo sin resultado todavía: avance, cancelada (para esta sesión) o con error"""
+    espera = tarea.espera(id_sesion())
+    if tarea.activa and espera:
+        st.info("⏳ El cálculo corre en segundo plano: puedes cambiar de paso sin interrumpirlo")
+        mostrar_avance(clave)
+        return
+    if tarea.estado == CANCELADA or not espera:
+        st.warning("⏹️ Cálculo cancelado")
+    elif tarea.estado == ERROR:
+        st.markdown(f'<div class="error-box"><strong>❌ Error al calcular:</strong> {tarea.error}</div>', unsafe_allow_html=True)
+    if st.button("🔄 Volver a calcular", use_container_width=True):
+        st.session_state.pop('tarea_cancelada', None)
+        if tarea.activa:
+            # Sigue corriendo para otra sesión: esta vuelve a esperarla
+            tarea.unir(id_sesion())
+        else:
+            obtener_tareas().descartar(clave)
+        st.rerun()
+
+def opciones_calculo():
+    """Modo de demanda y reparto configurados en el Paso 3 (por defecto carga mínima y reparto secuencial)"""
+    # La capacidad por tienda solo admite reparto secuencial
+    reparto = st.session_state.get('reparto', REPARTO_SECUENCIAL)
+    if st.session_state.get('hash_capacidad') is not None:
+        reparto = REPARTO_SECUENCIAL
+    return {
+        'modo': st.session_state.get('modo', MODO_MINIMO),
+        'cobertura_dias': st.session_state.get('cobertura_dias', COBERTURA_DIAS),
+        'peso_ultima_semana': st.session_state.get('peso_ultima_semana', PESO_ULTIMA_SEMANA),
+        'reparto': reparto
+    }
+
+def generar_reporte_cacheado(clave, df_resultados, df_bodega, stock_bodega_final, resumenes=None, cache=None,
+                             rendimiento=None):
+    """
+    Devuelve los bytes del reporte desde caché o lo genera y lo guarda.
+    Desde la tarea de fondo la caché y el registro de rendimiento se pasan resueltos.
+    """
+    cache = obtener_cache_sugerido() if cache is None else cache
+    rendimiento = registro if rendimiento is None else rendimiento
+    reporte = cache.obtener(('reporte',) + clave)
+    if reporte is None:
+        with rendimiento.etapa('reporte', filas=len(df_resultados)) as medicion:
+            reporte = generar_reporte_descargable(
+                df_resultados, df_bodega, stock_bodega_final, resumenes=resumenes
+            ).getvalue()
+            medicion['bytes'] = len(reporte)
+        cache.guardar(('reporte',) + clave, reporte)
+    return reporte
+
+def generar_reporte_parquet_cacheado(clave, df_resultados, df_bodega, stock_bodega_final, resumenes=None):
+    """Devuelve los bytes del reporte Parquet (zip) desde caché o lo genera y lo guarda"""
+    cache = obtener_cache_sugerido()
+    reporte = cache.obtener(('reporte_parquet',) + clave)
+    if reporte is None:
+        with registro.etapa('reporte_parquet', filas=len(df_resultados)) as medicion:
+            reporte = generar_reporte_parquet(df_resultados, df_bodega, stock_bodega_final, resumenes=resumenes).getvalue()
+            medicion['bytes'] = len(reporte)
+        cache.guardar(('reporte_parquet',) + clave, reporte)
+    return reporte
+
+def generar_picking_cacheado(clave, df_resultados, formato):
+    """Devuelve los bytes del zip de listas de picking desde caché o lo genera y lo guarda"""
+    cache = obtener_cache_sugerido()
+    listas = cache.obtener(('picking', formato) + clave)
+    if listas is None:
+        with registro.etapa('picking', filas=len(df_resultados), formato=formato) as medicion:
+            # En proceso: el servidor de Streamlit tiene hilos y no debe hacer fork (el pool queda para la CLI)
+            listas = generar_listas_picking(df_resultados, formato, procesos=1).getvalue()
+            medicion['bytes'] = len(listas)
+        cache.guardar(('picking', formato) + clave, listas)
+    return listas
+
+@st.cache_resource
+def obtener_historial():
+    """Historial de corridas compartido por las sesiones (archivo SQLite local)"""
+    return HistorialCorridas()
+
+# ==================== VISTAS PAGINADAS ====================
+
+TAMANOS_PAGINA = [50, 100, 500, 1000]
+ICONOS_ESTADO = {
+    'Completa': '🟢',
+    'Parcialmente cargada': '🟡',
+    'No cargada': '❌',
+    'Sin necesidad': '⚪'
+}
+
+def mostrar_pagina(df, clave, preparar):
+    """
+    Muestra una página de df en un solo st.dataframe. preparar(pagina) arma las
+    columnas visibles solo para las filas de la página. Retorna la página mostrada.
+    """
+    total = len(df)
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        tamano = st.selectbox("Filas por página", TAMANOS_PAGINA, index=1, key=f"tamano_{clave}")
+    n_paginas = max(1, -(-total // tamano))
+    # Si los filtros achicaron la tabla, la página guardada puede quedar fuera de rango
+    if st.session_state.get(f"pagina_{clave}", 1) > n_paginas:
+        st.session_state[f"pagina_{clave}"] = n_paginas
+    with col2:
+        pagina = st.number_input(f"Página (de {n_paginas:,})", min_value=1, max_value=n_paginas, key=f"pagina_{clave}")
     
-    output.seek(0)
-    return output
+    inicio = (pagina - 1) * tamano
+    df_pagina = preparar(df.iloc[inicio:inicio + tamano])
+    with col3:
+        st.caption(f"Filas {min(inicio + 1, total):,}–{min(inicio + tamano, total):,} de {total:,}")
+    st.dataframe(df_pagina, use_container_width=True, hide_index=True)
+    return df_pagina
 
 # ==================== INTERFAZ PRINCIPAL ====================
 
@@ -331,7 +428,8 @@ with st.sidebar:
                      "2️⃣ Cargar Datos",
                      "3️⃣ Configurar Parámetros",
                      "4️⃣ Generar Sugerido",
-                     "5️⃣ Descargar Reporte"],
+                     "5️⃣ Descargar Reporte",
+                     "6️⃣ Historial"],
                     label_visibility="collapsed")
 
 # PASO 1: Descargar Template
@@ -362,27 +460,57 @@ if "1️⃣" in step:
             use_container_width=True
         )
     
-    st.markdown('<div class="warning-box"><strong>💡 Tip:</strong> El template tiene 4 hojas. La columna <strong>prioridad_tienda</strong> determina el orden de carga (1→2→3).</div>', unsafe_allow_html=True)
+    st.markdown('<div class="warning-box"><strong>💡 Tip:</strong> El template tiene 6 hojas (<strong>Excepciones</strong> y <strong>Capacidad</strong> son opcionales). Para varias bodegas agrega la hoja <strong>Asignación</strong> y la columna <strong>bodega_id</strong> en Stock Bodega. La columna <strong>prioridad_tienda</strong> determina el orden de carga (1→2→3).</div>', unsafe_allow_html=True)
 
 # PASO 2: Cargar Datos
 elif "2️⃣" in step:
     st.markdown('<div class="step-header">Paso 2: Cargar Datos</div>', unsafe_allow_html=True)
     
-    uploaded_file = st.file_uploader("📥 Carga tu archivo Excel", type=['xlsx', 'xls'])
+    uploaded_files = st.file_uploader(
+        "📥 Carga tu archivo Excel, o CSV/Parquet por hoja (también en .zip)",
+        type=['xlsx', 'xls', 'csv', 'parquet', 'zip'],
+        accept_multiple_files=True
+    )
     
-    if uploaded_file is not None:
+    if uploaded_files:
         try:
-            # Leer las hojas
-            df_tiendas = pd.read_excel(uploaded_file, sheet_name='Stock Tiendas')
-            df_bodega = pd.read_excel(uploaded_file, sheet_name='Stock Bodega')
-            df_params = pd.read_excel(uploaded_file, sheet_name='Parámetros')
+            # Leer todas las hojas en una pasada
+            registro.contexto['centro'] = ', '.join(archivo.name for archivo in uploaded_files)
+            with registro.etapa('lectura') as lectura:
+                hojas = leer_entradas(uploaded_files)
+                lectura['filas'] = len(hojas[HOJA_TIENDAS])
+            with registro.etapa('validacion', filas=len(hojas[HOJA_TIENDAS])):
+                df_tiendas, df_bodega, df_errores = validar_entradas(hojas[HOJA_TIENDAS], hojas[HOJA_BODEGA])
+            df_params = hojas[HOJA_PARAMETROS]
+            if not df_errores.empty:
+                resumen_errores = resumir_errores(df_errores)
+                con_error = df_errores['nivel'] == NIVEL_ERROR
+                if con_error.any():
+                    st.error(f"❌ {int(con_error.sum()):,} problema(s) en los datos: corrige el archivo y vuelve a cargarlo")
+                    st.dataframe(resumen_errores, use_container_width=True, hide_index=True)
+                    st.dataframe(df_errores[con_error].head(100), use_container_width=True, hide_index=True)
+                    st.stop()
+                with st.expander(f"⚠️ {len(df_errores):,} aviso(s) en los datos (se puede calcular igual)"):
+                    st.dataframe(resumen_errores, use_container_width=True, hide_index=True)
+            df_excepciones = validar_excepciones(hojas.get(HOJA_EXCEPCIONES))
+            capacidad = validar_capacidades(hojas.get(HOJA_CAPACIDAD))
+            df_capacidad = capacidad.reset_index() if capacidad is not None else None
+            df_asignacion = validar_asignacion(hojas.get(HOJA_ASIGNACION))
+            if df_asignacion is not None:
+                revisar_bodegas(df_asignacion, df_tiendas, df_bodega)
+                if df_capacidad is not None:
+                    raise ValueError("La capacidad por tienda no se puede combinar con varias bodegas")
             
-            # Guardar en session state
-            st.session_state['df_tiendas'] = df_tiendas
-            st.session_state['df_bodega'] = df_bodega
-            st.session_state['df_params'] = df_params
+            # Guardar en el almacén compartido; la sesión solo guarda los hash
+            almacen = obtener_almacen()
+            with registro.etapa('hash', filas=len(df_tiendas)):
+                for nombre, df in (('tiendas', df_tiendas), ('bodega', df_bodega), ('params', df_params),
+                                   ('excepciones', df_excepciones), ('capacidad', df_capacidad),
+                                   ('asignacion', df_asignacion)):
+                    st.session_state[f'hash_{nombre}'] = almacen.guardar(df) if df is not None else None
             
             st.markdown('<div class="success-box"><strong>✅ Datos cargados correctamente!</strong></div>', unsafe_allow_html=True)
+            st.caption(f"⏱️ Lectura: {lectura['segundos']:.2f} s ({len(df_tiendas):,} filas de tiendas)")
             
             # Mostrar preview
             st.markdown("**Preview de datos:**")
@@ -396,15 +524,29 @@ elif "2️⃣" in step:
                 st.markdown("**Stock Bodega:**")
                 st.dataframe(df_bodega, use_container_width=True)
             
+            if df_excepciones is not None:
+                st.markdown(f"**Excepciones de parámetros:** {len(df_excepciones):,} (tienda+SKU > SKU > tienda > general)")
+                st.dataframe(df_excepciones.head(10), use_container_width=True)
+            if df_capacidad is not None:
+                st.markdown(f"**Capacidad por tienda:** {len(df_capacidad):,} tienda(s) con límite de despacho")
+                st.dataframe(df_capacidad.head(10), use_container_width=True)
+            if df_asignacion is not None:
+                con_respaldo = int(df_asignacion['bodega_respaldo'].notna().sum())
+                st.markdown(f"**Varias bodegas:** {df_bodega['bodega_id'].nunique():,} bodega(s) para {len(df_asignacion):,} "
+                            f"tienda(s), {con_respaldo:,} con bodega de respaldo")
+                st.dataframe(df_asignacion.head(10), use_container_width=True)
+        
         except Exception as e:
             st.error(f"❌ Error al cargar archivo: {e}")
-            st.info("Asegúrate que el archivo tiene las hojas: 'Stock Tiendas', 'Stock Bodega' y 'Parámetros'")
+            st.info("Asegúrate que el archivo tiene las hojas: 'Stock Tiendas', 'Stock Bodega' y 'Parámetros' "
+                    "(y opcionalmente 'Excepciones', 'Capacidad' y 'Asignación'). "
+                    "Si usas CSV/Parquet, nombra cada archivo con su hoja (ej: stock_tiendas.csv, stock_bodega.parquet)")
 
 # PASO 3: Configurar Parámetros
 elif "3️⃣" in step:
     st.markdown('<div class="step-header">Paso 3: Configurar Parámetros</div>', unsafe_allow_html=True)
     
-    if 'df_tiendas' not in st.session_state:
+    if 'hash_tiendas' not in st.session_state:
         st.warning("⚠️ Primero carga los datos en el Paso 2")
     else:
         st.markdown("""
@@ -443,6 +585,46 @@ elif "3️⃣" in step:
             )
             st.markdown('<div class="metric-box"><strong>Ejemplo:</strong> Máximo 20 unidades por SKU en una tienda</div>', unsafe_allow_html=True)
         
+        # Modo de demanda: reposición a carga mínima o por velocidad de venta
+        modo_velocidad = st.toggle(
+            "📈 Reposición por velocidad de venta",
+            help="Repone hasta cubrir los días indicados con la venta diaria ponderada (última semana y 4 semanas), "
+                 "sin bajar de la carga mínima ni superar el máximo"
+        )
+        cobertura_dias, peso_ultima_semana = COBERTURA_DIAS, PESO_ULTIMA_SEMANA
+        if modo_velocidad:
+            col1, col2 = st.columns(2)
+            with col1:
+                cobertura_dias = st.number_input(
+                    "📅 Días de cobertura",
+                    min_value=1,
+                    max_value=90,
+                    value=COBERTURA_DIAS,
+                    help="Días de venta que debe cubrir el stock de la tienda"
+                )
+            with col2:
+                peso_ultima_semana = st.slider(
+                    "⚖️ Peso de la última semana",
+                    min_value=0.0,
+                    max_value=1.0,
+                    value=PESO_ULTIMA_SEMANA,
+                    step=0.05,
+                    help="1 = solo la última semana, 0 = solo el promedio de 4 semanas"
+                )
+            st.markdown(f'<div class="metric-box"><strong>Ejemplo:</strong> Si vende 7 unidades la última semana y 28 en 4 semanas, '
+                        f'el objetivo es {cobertura_dias} unidades (1 diaria x {cobertura_dias} días)</div>', unsafe_allow_html=True)
+        
+        # Reparto de la bodega escasa entre tiendas de la misma prioridad
+        reparto_proporcional = st.toggle(
+            "⚖️ Reparto proporcional dentro de cada prioridad",
+            help="Si la bodega no alcanza para todas las tiendas de una prioridad, reparte el stock en proporción "
+                 "a la demanda de cada una en vez de cargarlas por orden de tienda (no disponible con capacidad por tienda)",
+            disabled=st.session_state.get('hash_capacidad') is not None
+        )
+        if reparto_proporcional:
+            st.markdown('<div class="metric-box"><strong>Ejemplo:</strong> Con 10 unidades en bodega y dos tiendas de '
+                        'prioridad 1 que piden 10 y 5, reciben 7 y 3 (en vez de 10 y 0)</div>', unsafe_allow_html=True)
+        
         st.divider()
         
         # Tabla de restricciones
@@ -457,6 +639,29 @@ elif "3️⃣" in step:
                 'No puede superar bodega'
             ]
         })
+        if modo_velocidad:
+            restricciones.loc[len(restricciones)] = [
+                'Objetivo por venta', f'{cobertura_dias} días de cobertura', 'Venta diaria ponderada, entre mínimo y máximo'
+            ]
+        if st.session_state.get('hash_excepciones') is not None:
+            restricciones.loc[len(restricciones)] = [
+                'Excepciones', f"{len(datos_sesion('excepciones')):,} tienda/SKU",
+                'Reemplazan los valores generales (tienda+SKU > SKU > tienda)'
+            ]
+        if st.session_state.get('hash_capacidad') is not None:
+            restricciones.loc[len(restricciones)] = [
+                'Capacidad por tienda', f"{len(datos_sesion('capacidad')):,} tienda(s)",
+                'Se llena en orden de carga; lo que no cabe no se despacha'
+            ]
+        if st.session_state.get('hash_asignacion') is not None:
+            restricciones.loc[len(restricciones)] = [
+                'Varias bodegas', f"{datos_sesion('bodega')['bodega_id'].nunique():,} bodega(s)",
+                'Cada tienda carga de su bodega principal; lo que falte, de su bodega de respaldo'
+            ]
+        if reparto_proporcional:
+            restricciones.loc[len(restricciones)] = [
+                'Reparto', 'Proporcional', 'Bodega escasa repartida según demanda dentro de cada prioridad'
+            ]
         st.dataframe(restricciones, use_container_width=True)
         
         # Validación de parámetros
@@ -470,51 +675,128 @@ elif "3️⃣" in step:
         st.session_state['carga_minima'] = carga_minima
         st.session_state['carga_inicial'] = carga_inicial
         st.session_state['carga_maxima'] = carga_maxima
+        st.session_state['modo'] = MODO_VELOCIDAD if modo_velocidad else MODO_MINIMO
+        st.session_state['cobertura_dias'] = cobertura_dias
+        st.session_state['peso_ultima_semana'] = peso_ultima_semana
+        st.session_state['reparto'] = REPARTO_PROPORCIONAL if reparto_proporcional else REPARTO_SECUENCIAL
         
         st.success("✅ Parámetros configurados")
+        
+        # Análisis what-if: grilla de parámetros evaluada en paralelo
+        with st.expander("🔬 Comparar escenarios (what-if)"):
+            st.markdown("Evalúa todas las combinaciones de los rangos sobre los datos cargados, sin recalcular el Paso 4 en cada una.")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                rango_minima = st.slider("Carga Mínima", 1, 20, (1, 5))
+            with col2:
+                rango_inicial = st.slider("Carga Inicial", 1, 30, (4, 12))
+            with col3:
+                rango_maxima = st.slider("Máximo por SKU/Tienda", 5, 100, (10, 30))
+            paso = st.number_input("Paso entre valores", min_value=1, max_value=20, value=2)
+            
+            valores_minima = range(rango_minima[0], rango_minima[1] + 1, paso)
+            valores_inicial = range(rango_inicial[0], rango_inicial[1] + 1, paso)
+            valores_maxima = range(rango_maxima[0], rango_maxima[1] + 1, paso)
+            n_escenarios = len(valores_minima) * len(valores_inicial) * len(valores_maxima)
+            
+            # Los escenarios se evalúan con una sola bodega
+            varias_bodegas = st.session_state.get('hash_asignacion') is not None
+            if varias_bodegas:
+                st.caption("No disponible con varias bodegas (hoja Asignación)")
+            if st.button(f"▶️ Evaluar {n_escenarios} escenarios", disabled=varias_bodegas):
+                with st.spinner("Evaluando escenarios..."), \
+                        registro.etapa('escenarios', filas=len(datos_sesion('tiendas')), escenarios=n_escenarios):
+                    st.session_state['df_escenarios'] = barrer_escenarios(
+                        datos_sesion('tiendas'),
+                        datos_sesion('bodega'),
+                        valores_minima,
+                        valores_inicial,
+                        valores_maxima,
+                        excepciones=datos_sesion('excepciones'),
+                        capacidades=datos_sesion('capacidad'),
+                        **opciones_calculo()
+                    )
+            
+            if 'df_escenarios' in st.session_state:
+                st.dataframe(st.session_state['df_escenarios'].rename(columns={
+                    'carga_minima': 'Carga Mínima',
+                    'carga_inicial': 'Carga Inicial',
+                    'carga_maxima': 'Máximo',
+                    'total_sugerido': 'Total Sugerido',
+                    'total_unidades': 'Total Despachar',
+                    'stock_bodega_usado': 'Bodega Usado',
+                    'uso_bodega_pct': 'Uso Bodega (%)',
+                    'tiendas_completas': 'Tiendas Completas',
+                    'tiendas_parciales': 'Tiendas Parciales',
+                    'tiendas_no_cargadas': 'Tiendas No Cargadas'
+                }), use_container_width=True, hide_index=True)
 
 # PASO 4: Generar Sugerido
 elif "4️⃣" in step:
     st.markdown('<div class="step-header">Paso 4: Generar Sugerido</div>', unsafe_allow_html=True)
     
-    if 'df_tiendas' not in st.session_state or 'carga_minima' not in st.session_state:
+    resultado = None
+    if 'hash_tiendas' not in st.session_state or 'carga_minima' not in st.session_state:
         st.warning("⚠️ Completa los pasos anteriores primero (cargar datos y parámetros)")
     else:
-        # Calcular sugerido con prioridad y máximo
-        df_resultados, resumen_tiendas, stock_bodega_final = calcular_sugerido_con_prioridad(
-            st.session_state['df_tiendas'],
-            st.session_state['df_bodega'],
+        # Calcular sugerido con prioridad y máximo en segundo plano (reutiliza caché si nada cambió)
+        clave_sugerido = (
+            st.session_state['hash_tiendas'],
+            st.session_state['hash_bodega'],
+            st.session_state.get('hash_excepciones'),
+            st.session_state.get('hash_capacidad'),
+            st.session_state.get('hash_asignacion'),
             st.session_state['carga_minima'],
             st.session_state['carga_inicial'],
-            st.session_state['carga_maxima']
+            st.session_state['carga_maxima'],
+            tuple(opciones_calculo().items())
         )
+        tareas = obtener_tareas()
+        tarea = tareas.obtener(clave_sugerido)
+        resultado = obtener_cache_sugerido().obtener(('sugerido',) + clave_sugerido)
+        if resultado is None:
+            if tarea is None or tarea.estado == TERMINADA:
+                # Sin tarea, o su resultado ya salió de la caché: se calcula en segundo plano
+                tareas.descartar(clave_sugerido)
+                tarea = tareas.iniciar(clave_sugerido, tarea_sugerido(clave_sugerido), interesado=id_sesion())
+            elif tarea.activa and st.session_state.get('tarea_cancelada') != clave_sugerido:
+                # Otra sesión ya la está calculando con las mismas entradas: esta también la espera
+                tarea.unir(id_sesion())
+            mostrar_tarea(clave_sugerido, tarea)
+        elif tarea is not None and tarea.estado == TERMINADA:
+            st.session_state['skus_recalculados'] = tarea.resultado
+    
+    if resultado is not None:
+        (hash_resultados, hash_stock_final, hash_stock_bodegas), resumenes = resultado
+        st.session_state['hash_resultados'] = hash_resultados
+        st.session_state['hash_stock_final'] = hash_stock_final
+        st.session_state['hash_stock_bodegas'] = hash_stock_bodegas
+        st.session_state['clave_sugerido'] = clave_sugerido
+        df_resultados = datos_sesion('resultados')
         
-        st.session_state['df_resultados'] = df_resultados
-        st.session_state['stock_bodega_final'] = stock_bodega_final
+        if 'skus_recalculados' in st.session_state:
+            st.caption(f"♻️ Última corrida: {st.session_state['skus_recalculados']:,} de {resumenes['total_skus']:,} SKUs recalculados")
         
         # Resumen ejecutivo
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("📦 Total a Despachar", f"{df_resultados['cantidad_a_despachar'].sum()} unidades")
+            st.metric("📦 Total a Despachar", f"{resumenes['total_unidades']} unidades")
         
         with col2:
-            tiendas_completas = (df_resultados.groupby('tienda_id')['estado'].apply(lambda x: (x == 'Completa').all())).sum()
-            st.metric("✅ Tiendas Completas", tiendas_completas)
+            st.metric("✅ Tiendas Completas", resumenes['tiendas_completas'])
         
         with col3:
-            st.metric("📊 SKUs", df_resultados['sku'].nunique())
+            st.metric("📊 SKUs", resumenes['total_skus'])
         
         with col4:
-            bodega_usado = st.session_state['df_bodega']['stock_bodega'].sum() - sum(stock_bodega_final.values())
-            bodega_total = st.session_state['df_bodega']['stock_bodega'].sum()
-            st.metric("🏭 Bodega Usado", f"{bodega_usado}/{bodega_total}")
+            st.metric("🏭 Bodega Usado", f"{resumenes['stock_bodega_usado']}/{resumenes['stock_bodega_inicial']}")
         
         st.divider()
         
         # Alertas de completitud
-        tiendas_parciales = (df_resultados.groupby('tienda_id')['estado'].apply(lambda x: ((x == 'Parcialmente cargada').any() or (x == 'No cargada').any()))).sum()
-        tiendas_no_cargadas = (df_resultados.groupby('tienda_id')['estado'].apply(lambda x: (x == 'No cargada').all())).sum()
+        tiendas_parciales = resumenes['tiendas_con_faltante']
+        tiendas_no_cargadas = resumenes['tiendas_no_cargadas']
         
         if tiendas_no_cargadas > 0:
             st.markdown(f'<div class="error-box"><strong>🔴 Bodega insuficiente:</strong> {tiendas_no_cargadas} tienda(s) no se cargó/cargaron (bodega agotada)</div>', unsafe_allow_html=True)
@@ -532,121 +814,310 @@ elif "4️⃣" in step:
             st.info(f"🆕 **Carga Inicial:** {st.session_state['carga_inicial']} unidades")
         with col3:
             st.info(f"📊 **Máximo:** {st.session_state['carga_maxima']} unidades")
+        if opciones_calculo()['modo'] == MODO_VELOCIDAD:
+            st.info(f"📈 **Reposición por velocidad de venta:** {st.session_state['cobertura_dias']} días de cobertura "
+                    f"(peso última semana {st.session_state['peso_ultima_semana']:.2f})")
+        if st.session_state.get('hash_excepciones') is not None:
+            st.info(f"🎯 **Excepciones:** {len(datos_sesion('excepciones')):,} tienda/SKU con parámetros propios "
+                    "(los valores de arriba rigen para el resto)")
+        if st.session_state.get('hash_capacidad') is not None:
+            st.info(f"🚚 **Capacidad por tienda:** {len(datos_sesion('capacidad')):,} tienda(s) con límite, "
+                    "llenadas en orden de carga")
+        if opciones_calculo()['reparto'] == REPARTO_PROPORCIONAL:
+            st.info("⚖️ **Reparto proporcional:** la bodega escasa se reparte según la demanda de cada tienda dentro de su prioridad")
+        if resumenes.get('por_bodega') is not None:
+            st.info(f"🏭 **Varias bodegas:** {resumenes['por_bodega']['bodega_id'].nunique():,} bodega(s); "
+                    f"{int(resumenes['por_bodega']['despacho_respaldo'].sum()):,} unidades salen de bodegas de respaldo")
         
         st.divider()
         
-        # Tabs para diferentes vistas
-        tab1, tab2, tab3, tab4 = st.tabs(["📋 Detalle Completo", "🏪 Por Tienda", "🏭 Impacto Bodega", "📍 Orden de Carga"])
-        
-        with tab1:
-            st.markdown("**Detalle completo de la carga recomendada:**")
-            df_display = df_resultados[['orden_carga', 'tienda_id', 'sku', 'producto', 'stock_antes', 
-                                        'stock_despues', 'cantidad_a_despachar', 'razon', 'tipo_carga', 'estado']].copy()
-            df_display = df_display.rename(columns={
-                'orden_carga': 'Orden',
-                'tienda_id': 'Tienda',
-                'sku': 'SKU',
-                'producto': 'Producto',
-                'stock_antes': 'Stock Antes',
-                'stock_despues': 'Stock Después',
-                'cantidad_a_despachar': 'Despachar',
-                'razon': 'Razón',
-                'tipo_carga': 'Tipo',
-                'estado': 'Estado'
-            })
-            st.dataframe(df_display, use_container_width=True)
-        
-        with tab2:
-            st.markdown("**Resumen antes vs después por tienda:**")
-            df_por_tienda = df_resultados.groupby('tienda_id').agg({
-                'prioridad': 'first',
-                'stock_antes': 'sum',
-                'stock_despues': 'sum',
-                'cantidad_a_despachar': 'sum'
-            }).reset_index()
-            df_por_tienda['cambio'] = df_por_tienda['stock_despues'] - df_por_tienda['stock_antes']
-            df_por_tienda = df_por_tienda.rename(columns={
-                'tienda_id': 'Tienda',
-                'prioridad': 'Prioridad',
-                'stock_antes': 'Stock Antes',
-                'stock_despues': 'Stock Después',
-                'cantidad_a_despachar': 'Total Despachar',
-                'cambio': 'Cambio'
-            })
-            st.dataframe(df_por_tienda, use_container_width=True)
-            
-            # Gráfico
-            col1, col2 = st.columns(2)
+        # Filtros (se aplican en el servidor; solo se envía al navegador la página visible)
+        with st.expander("🔎 Filtros"):
+            col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.bar_chart(df_por_tienda.set_index('Tienda')[['Stock Antes', 'Stock Después']])
+                filtro_prioridades = st.multiselect("Prioridad", sorted(resumenes['por_tienda']['prioridad'].unique()))
             with col2:
-                st.bar_chart(df_por_tienda.set_index('Tienda')['Total Despachar'])
-        
-        with tab3:
-            st.markdown("**Impacto en el stock de bodega:**")
-            df_bodega_impacto = df_resultados.groupby('sku').agg({
-                'cantidad_a_despachar': 'sum',
-                'stock_bodega_disponible': 'first',
-                'stock_bodega_despues': 'first'
-            }).reset_index()
-            df_bodega_impacto = df_bodega_impacto.rename(columns={
-                'sku': 'SKU',
-                'cantidad_a_despachar': 'Total Despachar',
-                'stock_bodega_disponible': 'Stock Antes',
-                'stock_bodega_despues': 'Stock Después'
-            })
-            st.dataframe(df_bodega_impacto, use_container_width=True)
-        
-        with tab4:
-            st.markdown("**Orden de carga por prioridad de tienda:**")
-            df_orden = df_resultados[['orden_carga', 'prioridad', 'tienda_id', 'sku', 'producto', 'cantidad_a_despachar', 'estado']].copy()
-            df_orden = df_orden[df_orden['cantidad_a_despachar'] > 0].drop_duplicates(subset=['orden_carga', 'tienda_id', 'sku'])
-            df_orden = df_orden.sort_values('orden_carga')
-            df_orden = df_orden.rename(columns={
-                'orden_carga': 'Orden de Carga',
-                'prioridad': 'Prioridad',
-                'tienda_id': 'Tienda',
-                'sku': 'SKU',
-                'producto': 'Producto',
-                'cantidad_a_despachar': 'Cantidad',
-                'estado': 'Estado'
-            })
-            st.dataframe(df_orden, use_container_width=True)
-            
-            st.markdown("**Secuencia:**")
-            for idx, row in df_orden.iterrows():
-                if row['Estado'] == 'Completa':
-                    color = "🟢"
-                elif row['Estado'] == 'Parcialmente cargada':
-                    color = "🟡"
-                else:
-                    color = "❌"
-                st.markdown(f"{color} **Orden {row['Orden de Carga']}:** {row['Tienda']} (Prio {row['Prioridad']}) - {row['SKU']} - {row['Cantidad']} unidades")
+                filtro_tiendas = st.multiselect("Tienda", resumenes['por_tienda']['tienda_id'])
+            with col3:
+                filtro_sku = st.text_input("SKU contiene")
+            with col4:
+                filtro_estados = st.multiselect("Estado", ESTADOS)
+        filtros = dict(prioridades=filtro_prioridades, tiendas=filtro_tiendas, texto_sku=filtro_sku.strip())
+        
+        # Solo la vista activa arma su tabla
+        vista = st.radio(
+            "Vista",
+            ["📋 Detalle Completo", "🏪 Por Tienda", "🏭 Impacto Bodega", "📍 Orden de Carga"],
+            horizontal=True,
+            label_visibility="collapsed"
+        )
+        
+        if vista == "📋 Detalle Completo":
+            with registro.etapa('render_detalle') as medicion:
+                st.markdown("**Detalle completo de la carga recomendada:**")
+                df_detalle = filtrar_resultados(df_resultados, estados=filtro_estados, **filtros)
+                medicion['filas'] = len(df_detalle)
+                mostrar_pagina(df_detalle, 'detalle', lambda pagina: pagina[[
+                    'orden_carga', 'tienda_id', 'sku', 'producto', 'stock_antes', 'stock_despues', 'cantidad_a_despachar'
+                ]].assign(
+                    razon=formatear_razon(pagina), tipo_carga=pagina['tipo_carga'], estado=pagina['estado']
+                ).rename(columns={
+                    'orden_carga': 'Orden',
+                    'tienda_id': 'Tienda',
+                    'sku': 'SKU',
+                    'producto': 'Producto',
+                    'stock_antes': 'Stock Antes',
+                    'stock_despues': 'Stock Después',
+                    'cantidad_a_despachar': 'Despachar',
+                    'razon': 'Razón',
+                    'tipo_carga': 'Tipo',
+                    'estado': 'Estado'
+                }))
+        
+        elif vista == "🏪 Por Tienda":
+            with registro.etapa('render_por_tienda') as medicion:
+                st.markdown("**Resumen antes vs después por tienda:**")
+                df_tiendas_vista = filtrar_resultados(resumenes['por_tienda'], **filtros)
+                medicion['filas'] = len(df_tiendas_vista)
+                df_por_tienda = mostrar_pagina(df_tiendas_vista, 'por_tienda', lambda pagina: pagina[[
+                    'tienda_id', 'prioridad', 'stock_antes', 'stock_despues', 'cantidad_a_despachar'
+                ]].assign(cambio=pagina['stock_despues'] - pagina['stock_antes']).rename(columns={
+                    'tienda_id': 'Tienda',
+                    'prioridad': 'Prioridad',
+                    'stock_antes': 'Stock Antes',
+                    'stock_despues': 'Stock Después',
+                    'cantidad_a_despachar': 'Total Despachar',
+                    'cambio': 'Cambio'
+                }))
+                
+                # Gráfico (tiendas de la página visible)
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.bar_chart(df_por_tienda.set_index('Tienda')[['Stock Antes', 'Stock Después']])
+                with col2:
+                    st.bar_chart(df_por_tienda.set_index('Tienda')['Total Despachar'])
+        
+        elif vista == "🏭 Impacto Bodega":
+            with registro.etapa('render_bodega') as medicion:
+                st.markdown("**Impacto en el stock de bodega:**")
+                df_bodega_vista = filtrar_resultados(resumenes['por_sku'], texto_sku=filtros['texto_sku'])
+                medicion['filas'] = len(df_bodega_vista)
+                mostrar_pagina(df_bodega_vista, 'bodega', lambda pagina: pagina[[
+                    'sku', 'cantidad_a_despachar', 'stock_bodega_disponible', 'stock_bodega_despues'
+                ]].rename(columns={
+                    'sku': 'SKU',
+                    'cantidad_a_despachar': 'Total Despachar',
+                    'stock_bodega_disponible': 'Stock Antes',
+                    'stock_bodega_despues': 'Stock Después'
+                }))
+                if resumenes.get('por_bodega') is not None:
+                    st.markdown("**Stock por bodega:**")
+                    df_por_bodega = filtrar_resultados(resumenes['por_bodega'], texto_sku=filtros['texto_sku'])
+                    mostrar_pagina(df_por_bodega, 'por_bodega', lambda pagina: pagina.rename(columns={
+                        'bodega_id': 'Bodega',
+                        'sku': 'SKU',
+                        'stock_bodega': 'Stock Inicial',
+                        'despacho_principal': 'Despacho Principal',
+                        'despacho_respaldo': 'Despacho Respaldo',
+                        'stock_bodega_final': 'Stock Final'
+                    }))
+        
+        else:
+            with registro.etapa('render_secuencia') as medicion:
+                # Secuencia de carga en una sola tabla: los resultados ya vienen en orden_carga
+                st.markdown("**Orden de carga por prioridad de tienda:**")
+                df_orden = filtrar_resultados(df_resultados, estados=filtro_estados, **filtros)
+                df_orden = df_orden[df_orden['cantidad_a_despachar'].to_numpy() > 0]
+                medicion['filas'] = len(df_orden)
+                mostrar_pagina(df_orden, 'secuencia', lambda pagina: pd.DataFrame({
+                    '': pagina['estado'].map(ICONOS_ESTADO),
+                    'Orden de Carga': pagina['orden_carga'],
+                    'Prioridad': pagina['prioridad'],
+                    'Tienda': pagina['tienda_id'],
+                    'SKU': pagina['sku'],
+                    'Producto': pagina['producto'],
+                    'Cantidad': pagina['cantidad_a_despachar'],
+                    'Estado': pagina['estado']
+                }))
 
 # PASO 5: Descargar Reporte
 elif "5️⃣" in step:
     st.markdown('<div class="step-header">Paso 5: Descargar Reporte</div>', unsafe_allow_html=True)
     
-    if 'df_resultados' not in st.session_state:
+    if 'hash_resultados' not in st.session_state:
         st.warning("⚠️ Primero genera el sugerido en el Paso 4")
     else:
         st.info("📌 Descarga el reporte con todos los detalles de la carga")
         
-        reporte = generar_reporte_descargable(
-            st.session_state['df_resultados'],
-            st.session_state['df_bodega'],
-            st.session_state['stock_bodega_final']
-        )
+        # Si la tarea de fondo sigue generando el reporte, se espera a que termine
+        tarea = obtener_tareas().obtener(st.session_state['clave_sugerido'])
+        if tarea is not None and tarea.activa:
+            mostrar_avance(st.session_state['clave_sugerido'])
+        else:
+            resumenes = resumenes_sesion()
+            reporte = generar_reporte_cacheado(
+                st.session_state['clave_sugerido'],
+                datos_sesion('resultados'),
+                bodega_red(),
+                stock_final_sesion(),
+                resumenes=resumenes
+            )
+            
+            st.download_button(
+                label="⬇️ Descargar Reporte Excel",
+                data=reporte,
+                file_name=f"SugeridoAutomatico_Reporte_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
+            
+            # Mismas hojas en Parquet para herramientas de BI: se generan solo cuando se piden
+            if st.session_state.get('parquet_pedido') == st.session_state['clave_sugerido']:
+                reporte_parquet = generar_reporte_parquet_cacheado(
+                    st.session_state['clave_sugerido'],
+                    datos_sesion('resultados'),
+                    bodega_red(),
+                    stock_final_sesion(),
+                    resumenes=resumenes
+                )
+                st.download_button(
+                    label="⬇️ Descargar Reporte Parquet (zip, para BI)",
+                    data=reporte_parquet,
+                    file_name=f"SugeridoAutomatico_Reporte_{datetime.now().strftime('%Y%m%d_%H%M%S')}_parquet.zip",
+                    mime="application/zip",
+                    use_container_width=True
+                )
+            elif st.button("Preparar reporte Parquet (para BI)", use_container_width=True):
+                st.session_state['parquet_pedido'] = st.session_state['clave_sugerido']
+                st.rerun()
         
-        st.download_button(
-            label="⬇️ Descargar Reporte Excel",
-            data=reporte,
-            file_name=f"SugeridoAutomatico_Reporte_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
-        )
+        st.markdown('<div class="success-box"><strong>✅ El reporte incluye:</strong><br>• Resumen ejecutivo<br>• Detalle por tienda<br>• Carga por prioridad<br>• Impacto en bodega<br>• Antes vs Después'
+                    + ('<br>• Stock por bodega' if st.session_state.get('hash_asignacion') is not None else '')
+                    + '</div>', unsafe_allow_html=True)
         
-        st.markdown('<div class="success-box"><strong>✅ El reporte incluye:</strong><br>• Resumen ejecutivo<br>• Detalle por tienda<br>• Carga por prioridad<br>• Impacto en bodega<br>• Antes vs Después</div>', unsafe_allow_html=True)
+        # Listas de picking: un archivo por tienda, se generan solo cuando se piden
+        st.markdown("**🧾 Listas de picking por tienda:**")
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            formato_picking = st.selectbox("Formato", FORMATOS_PICKING, format_func=str.upper, label_visibility="collapsed")
+        with col2:
+            if st.button("Preparar listas de picking", use_container_width=True):
+                st.session_state['picking_pedido'] = (st.session_state['clave_sugerido'], formato_picking)
+        if st.session_state.get('picking_pedido') == (st.session_state['clave_sugerido'], formato_picking):
+            listas = generar_picking_cacheado(st.session_state['clave_sugerido'], datos_sesion('resultados'), formato_picking)
+            st.download_button(
+                label=f"⬇️ Descargar listas de picking ({formato_picking.upper()}, zip)",
+                data=listas,
+                file_name=f"SugeridoAutomatico_Picking_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
+        
+        # Guardar la corrida para compararla después en el Paso 6 (una vez por resultado)
+        if st.session_state.get('clave_historial') == st.session_state['clave_sugerido']:
+            st.caption(f"🗂️ Corrida guardada en el historial (#{st.session_state['corrida_historial']})")
+        elif st.button("🗂️ Guardar corrida en historial", use_container_width=True):
+            df_resultados = datos_sesion('resultados')
+            with registro.etapa('historial_guardar', filas=len(df_resultados)):
+                corrida_id = obtener_historial().guardar(
+                    df_resultados,
+                    bodega_red(),
+                    stock_final_sesion(),
+                    centro=registro.contexto.get('centro'),
+                    parametros={
+                        'hash_tiendas': st.session_state['hash_tiendas'],
+                        'hash_bodega': st.session_state['hash_bodega'],
+                        'hash_excepciones': st.session_state.get('hash_excepciones'),
+                        'hash_capacidad': st.session_state.get('hash_capacidad'),
+                        'hash_asignacion': st.session_state.get('hash_asignacion')
+                    }
+                )
+            st.session_state['clave_historial'] = st.session_state['clave_sugerido']
+            st.session_state['corrida_historial'] = corrida_id
+            st.rerun()
+
+# PASO 6: Historial de corridas
+elif "6️⃣" in step:
+    st.markdown('<div class="step-header">Paso 6: Historial de Corridas</div>', unsafe_allow_html=True)
+    
+    historial = obtener_historial()
+    df_corridas = historial.corridas()
+    if df_corridas.empty:
+        st.warning("⚠️ Aún no hay corridas guardadas (guárdalas desde el Paso 5)")
+    else:
+        st.dataframe(df_corridas.drop(columns='parametros').rename(columns={
+            'corrida_id': 'Corrida',
+            'fecha': 'Fecha',
+            'centro': 'Centro',
+            'filas': 'Filas',
+            'total_sugerido': 'Total Sugerido',
+            'total_unidades': 'Total Despachado'
+        }), use_container_width=True, hide_index=True)
+        
+        st.markdown("**Comparar dos corridas:**")
+        ids = df_corridas['corrida_id'].tolist()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            corrida_a = st.selectbox("Corrida base", ids, index=min(1, len(ids) - 1))
+        with col2:
+            corrida_b = st.selectbox("Corrida nueva", ids, index=0)
+        with col3:
+            nivel = st.radio("Nivel", ['sku', 'tienda', 'tienda_sku'], horizontal=True,
+                             format_func={'sku': 'SKU', 'tienda': 'Tienda', 'tienda_sku': 'Tienda + SKU'}.get)
+        with col4:
+            umbral_pct = st.number_input("Cambio mayor a (%)", min_value=0.0, value=10.0, step=5.0)
+        
+        with registro.etapa('historial_cambios', nivel=nivel) as medicion:
+            df_cambios = historial.cambios(corrida_a, corrida_b, nivel=nivel, umbral_pct=umbral_pct)
+            medicion['filas'] = len(df_cambios)
+        if df_cambios.empty:
+            st.markdown('<div class="success-box"><strong>🟢 Sin cambios</strong> por sobre el umbral entre las dos corridas</div>', unsafe_allow_html=True)
+        else:
+            st.caption(f"{len(df_cambios):,} cambio(s) por sobre {umbral_pct:g}% (los nuevos o eliminados se incluyen siempre)")
+            mostrar_pagina(df_cambios, 'cambios', lambda pagina: pagina.rename(columns={
+                'tienda_id': 'Tienda',
+                'sku': 'SKU',
+                'despacho_a': f'Despacho #{corrida_a}',
+                'despacho_b': f'Despacho #{corrida_b}',
+                'diferencia': 'Diferencia',
+                'variacion_pct': 'Variación %'
+            }))
+        
+        st.markdown("**Historia de un SKU:**")
+        sku_historia = st.text_input("SKU").strip()
+        if sku_historia:
+            df_historia = historial.historia_sku(sku_historia)
+            if df_historia.empty:
+                st.caption("El SKU no aparece en las corridas guardadas")
+            else:
+                st.dataframe(df_historia.rename(columns={
+                    'corrida_id': 'Corrida',
+                    'fecha': 'Fecha',
+                    'centro': 'Centro',
+                    'n_tiendas': 'Tiendas',
+                    'cantidad_sugerida': 'Sugerido',
+                    'cantidad_a_despachar': 'Despachado',
+                    'stock_bodega': 'Stock Bodega'
+                }), use_container_width=True, hide_index=True)
+
+# Panel de rendimiento (al final, para incluir las etapas de esta ejecución)
+with st.sidebar:
+    st.divider()
+    if st.toggle("⏱️ Rendimiento", help="Tiempo, memoria y filas de cada etapa en esta sesión"):
+        almacen = obtener_almacen().estado()
+        st.caption(f"🗄️ Almacén compartido: {almacen['mb_en_memoria']:,.0f} de {almacen['max_mb']:,.0f} MB en memoria "
+                   f"({almacen['en_memoria']} tabla(s), {almacen['solo_en_disco']} en disco, {almacen['recargas']} recarga(s))")
+        tabla_rendimiento = registro.tabla()
+        if tabla_rendimiento.empty:
+            st.caption("Aún no hay etapas medidas")
+        else:
+            st.dataframe(tabla_rendimiento[['etapa', 'segundos', 'rss_pico_mb', 'rss_delta_mb', 'filas']].rename(columns={
+                'etapa': 'Etapa',
+                'segundos': 'Segundos',
+                'rss_pico_mb': 'Memoria pico (MB)',
+                'rss_delta_mb': 'Δ Memoria (MB)',
+                'filas': 'Filas'
+            }), use_container_width=True, hide_index=True)
 
 # Footer
 st.divider()
@@ -0,0 +1,1377 @@
+"""
+Motor del Sugerido Automático: lectura de entradas, cálculo del sugerido con
+prioridad, resumenes y generación de reportes. No depende de Streamlit, así
+que puede usarse desde la app, la línea de comandos o procesos programados.
+"""
+import hashlib
+import threading
+import unicodedata
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import xlsxwriter
+
+try:
+    import python_calamine  # noqa: F401
+    MOTOR_EXCEL = 'calamine'
+except ImportError:
+    MOTOR_EXCEL = 'openpyxl'
+
+# Versión del cálculo: se sube cada vez que cambian los resultados para las mismas entradas.
+# Forma parte de las claves de resultados guardados, así un almacén en disco no entrega los de una versión anterior.
+VERSION_MOTOR = '2.2'
+
+# Hojas de entrada y tipos declarados para evitar la inferencia al leer
+HOJA_TIENDAS = 'Stock Tiendas'
+HOJA_BODEGA = 'Stock Bodega'
+HOJA_PARAMETROS = 'Parámetros'
+HOJA_EXCEPCIONES = 'Excepciones'
+HOJA_CAPACIDAD = 'Capacidad'
+HOJA_ASIGNACION = 'Asignación'
+
+TIPOS_ENTRADA = {
+    'tienda_id': 'str',
+    'sku': 'str',
+    'producto': 'str',
+    'stock_actual': 'int64',
+    'venta_ultima_semana': 'int64',
+    'venta_4_semanas': 'int64',
+    'tipo_carga': 'str',
+    'prioridad_tienda': 'int64',
+    'stock_bodega': 'int64',
+    'volumen': 'float64',
+    'capacidad': 'float64',
+    'bodega_id': 'str',
+    'bodega_principal': 'str',
+    'bodega_respaldo': 'str',
+    'carga_minima': 'Int64',
+    'carga_inicial': 'Int64',
+    'carga_maxima': 'Int64'
+}
+
+# Al leer, los enteros admiten vacíos para que validar_entradas los informe por fila en vez de fallar la lectura
+TIPOS_LECTURA = {col: 'Int64' if tipo == 'int64' else tipo for col, tipo in TIPOS_ENTRADA.items()}
+
+def hoja_desde_nombre(nombre_archivo):
+    """Identifica la hoja a la que corresponde un archivo CSV/Parquet por su nombre"""
+    nombre = unicodedata.normalize('NFKD', nombre_archivo.rsplit('/', 1)[-1].lower())
+    nombre = nombre.encode('ascii', 'ignore').decode()
+    # Antes que 'tienda' y 'bodega': la asignación se suele llamar 'asignacion_bodegas_tiendas'
+    if 'asignac' in nombre:
+        return HOJA_ASIGNACION
+    if 'tienda' in nombre:
+        return HOJA_TIENDAS
+    if 'bodega' in nombre:
+        return HOJA_BODEGA
+    if 'param' in nombre:
+        return HOJA_PARAMETROS
+    if 'excepc' in nombre:
+        return HOJA_EXCEPCIONES
+    if 'capacidad' in nombre:
+        return HOJA_CAPACIDAD
+    return None
+
+def _leer_tabla(contenido, nombre_archivo):
+    """Lee un archivo CSV o Parquet con los tipos declarados"""
+    if nombre_archivo.lower().endswith('.parquet'):
+        df = pd.read_parquet(contenido)
+        tipos = {col: tipo for col, tipo in TIPOS_LECTURA.items() if col in df.columns}
+        return df.astype(tipos)
+    return pd.read_csv(contenido, dtype=TIPOS_LECTURA)
+
+def leer_entradas(archivos):
+    """
+    Lee las hojas de entrada desde un Excel, archivos CSV/Parquet (uno por hoja) o un zip con ellos.
+    El Excel se abre una sola vez y se leen todas sus hojas en la misma pasada.
+    Retorna un dict {nombre_hoja: DataFrame}; 'Stock Tiendas' y 'Stock Bodega' se pasan
+    por validar_entradas antes de calcular.
+    """
+    hojas = {}
+    for archivo in archivos:
+        nombre = archivo.name.lower()
+        if nombre.endswith(('.xlsx', '.xls')):
+            with pd.ExcelFile(archivo, engine=MOTOR_EXCEL) as libro:
+                for hoja in (HOJA_TIENDAS, HOJA_BODEGA, HOJA_PARAMETROS, HOJA_EXCEPCIONES, HOJA_CAPACIDAD, HOJA_ASIGNACION):
+                    if hoja in libro.sheet_names:
+                        hojas[hoja] = libro.parse(hoja, dtype=TIPOS_LECTURA)
+        elif nombre.endswith('.zip'):
+            with zipfile.ZipFile(archivo) as comprimido:
+                for miembro in comprimido.namelist():
+                    hoja = hoja_desde_nombre(miembro)
+                    if hoja is not None and miembro.lower().endswith(('.csv', '.parquet')):
+                        with comprimido.open(miembro) as contenido:
+                            hojas[hoja] = _leer_tabla(BytesIO(contenido.read()), miembro)
+        elif nombre.endswith(('.csv', '.parquet')):
+            hoja = hoja_desde_nombre(nombre)
+            if hoja is not None:
+                hojas[hoja] = _leer_tabla(archivo, nombre)
+    
+    faltantes = [hoja for hoja in (HOJA_TIENDAS, HOJA_BODEGA) if hoja not in hojas]
+    if faltantes:
+        raise ValueError(f"Faltan las hojas: {', '.join(faltantes)}")
+    hojas.setdefault(HOJA_PARAMETROS, pd.DataFrame(columns=['parametro', 'valor', 'descripcion']))
+    return hojas
+
+# ==================== VALIDACIÓN DE ENTRADAS ====================
+
+TIPOS_CARGA = ('inicial', 'reposicion')
+NIVEL_ERROR = 'error'
+NIVEL_AVISO = 'aviso'
+
+COLUMNAS_OBLIGATORIAS = {
+    HOJA_TIENDAS: ('tienda_id', 'sku', 'stock_actual', 'tipo_carga', 'prioridad_tienda'),
+    HOJA_BODEGA: ('sku', 'stock_bodega')
+}
+
+COLUMNAS_ERRORES = ('hoja', 'fila', 'columna', 'nivel', 'error')
+
+def _texto_normalizado(valor):
+    """Texto en minúsculas, sin espacios en los extremos ni tildes ('Reposición ' -> 'reposicion')"""
+    texto = unicodedata.normalize('NFKD', str(valor).strip().lower())
+    return texto.encode('ascii', 'ignore').decode()
+
+def normalizar_tipo_carga(columna):
+    """
+    tipo_carga como categórica con categorías TIPOS_CARGA; los vacíos y desconocidos
+    quedan como NaN. Los valores exactos se reconocen con una comparación por columna
+    y las variantes (mayúsculas, espacios, tildes) se normalizan una vez por valor distinto.
+    """
+    codigos = np.full(len(columna), -1, dtype=np.int8)
+    arreglo = pa.array(columna) if _es_texto_arrow(columna) else None
+    for codigo, tipo in enumerate(TIPOS_CARGA):
+        if arreglo is not None:
+            iguales = pc.fill_null(pc.equal(arreglo, tipo), False).to_numpy(zero_copy_only=False)
+        else:
+            iguales = (columna == tipo).to_numpy(dtype=bool, na_value=False)
+        codigos[iguales] = codigo
+    resto = np.flatnonzero((codigos < 0) & columna.notna().to_numpy())
+    if len(resto):
+        codigos_resto, valores = _codigos(columna.iloc[resto])
+        normalizados = [_texto_normalizado(valor) for valor in valores]
+        tabla = np.array([TIPOS_CARGA.index(valor) if valor in TIPOS_CARGA else -1 for valor in normalizados] + [-1],
+                         dtype=np.int8)
+        codigos[resto] = tabla[codigos_resto]
+    return pd.Categorical.from_codes(codigos, categories=TIPOS_CARGA)
+
+def _filas_repetidas(codigos_a, codigos_b, n_b):
+    """Filas cuya combinación de códigos (a, b) aparece más de una vez; los códigos -1 (vacíos) no cuentan"""
+    if len(codigos_a) == 0:
+        return np.zeros(0, dtype=bool)
+    validas = (codigos_a >= 0) & (codigos_b >= 0)
+    completas = validas.all()
+    clave = codigos_a.astype(np.int64) * n_b + codigos_b
+    if not completas:
+        clave[~validas] = 0
+    n_claves = (int(codigos_a.max()) + 1) * n_b
+    if n_claves <= 4 * len(clave):
+        # Pocas combinaciones posibles: conteo directo, sin tabla hash
+        conteo = np.bincount(clave if completas else clave[validas], minlength=n_claves)
+        if conteo.max(initial=0) <= 1:
+            return np.zeros(len(clave), dtype=bool)
+        repetidas = conteo[clave] > 1
+    else:
+        repetidas = pd.Series(clave).duplicated(keep=False).to_numpy()
+    return repetidas if completas else validas & repetidas
+
+def _tabla_errores(errores):
+    """
+    Une las reglas incumplidas [(hoja, posiciones, columna, nivel, error), ...] en una
+    tabla con una fila por regla y fila de la hoja. La fila es la del archivo (la 1 es
+    el encabezado) y los textos son categóricos, así la tabla ocupa poco aunque sea larga.
+    """
+    if not errores:
+        return pd.DataFrame({col: pd.Series(dtype=np.int64 if col == 'fila' else 'category') for col in COLUMNAS_ERRORES})
+    regla = np.repeat(np.arange(len(errores)), [len(posiciones) for _, posiciones, _, _, _ in errores])
+    tabla = {}
+    for i, col in enumerate(COLUMNAS_ERRORES):
+        if col == 'fila':
+            tabla[col] = np.concatenate([posiciones for _, posiciones, _, _, _ in errores]).astype(np.int64) + 2
+        else:
+            codigos, valores = pd.factorize(pd.Series([error[i] for error in errores], dtype=object))
+            tabla[col] = pd.Categorical.from_codes(codigos[regla], categories=valores)
+    df_errores = pd.DataFrame(tabla)
+    orden = np.lexsort((regla, tabla['fila'], df_errores['hoja'].cat.codes.to_numpy()))
+    return df_errores.take(orden).reset_index(drop=True)
+
+def _revisar_enteros(errores, hoja, df, columnas, nivel_negativo=NIVEL_ERROR, texto_negativo='Negativo'):
+    """Agrega las filas con vacíos o negativos en las columnas numéricas presentes de df"""
+    for col in columnas:
+        if col not in df.columns:
+            continue
+        valores = df[col]
+        errores.append((hoja, np.flatnonzero(valores.isna().to_numpy()), col, NIVEL_ERROR, 'Vacío'))
+        errores.append((hoja, np.flatnonzero((valores < 0).to_numpy(dtype=bool, na_value=False)), col, nivel_negativo, texto_negativo))
+
+def _a_enteros(df):
+    """Columnas enteras leídas como nullable (TIPOS_LECTURA) de vuelta a int64 si no tienen vacíos"""
+    columnas = {
+        col: 'int64' for col, tipo in TIPOS_ENTRADA.items()
+        if tipo == 'int64' and col in df.columns and isinstance(df[col].dtype, pd.Int64Dtype) and not df[col].hasnans
+    }
+    return df.astype(columnas) if columnas else df
+
+def validar_entradas(df_tiendas, df_bodega):
+    """
+    Revisa 'Stock Tiendas' y 'Stock Bodega' regla por regla con operaciones por
+    columna (sin recorrer filas) y normaliza tipo_carga una sola vez.
+    
+    Errores (impiden calcular): ids vacíos, stock o ventas vacíos o negativos,
+    tipo_carga vacío o desconocido, prioridad_tienda vacía, tienda_id+sku repetido
+    y SKU repetido en bodega. Avisos: SKU sin fila en 'Stock Bodega' (se toma stock 0)
+    y stock de bodega negativo (se toma 0 aquí, así ningún reparto despacha cantidades negativas).
+    Lanza ValueError si faltan columnas obligatorias.
+    Retorna (df_tiendas, df_bodega, df_errores), con una fila de df_errores por regla y fila incumplida.
+    """
+    for hoja, df in ((HOJA_TIENDAS, df_tiendas), (HOJA_BODEGA, df_bodega)):
+        faltantes = [col for col in COLUMNAS_OBLIGATORIAS[hoja] if col not in df.columns]
+        if faltantes:
+            raise ValueError(f"La hoja '{hoja}' necesita las columnas: {', '.join(faltantes)}")
+    errores = []
+    
+    # Stock Tiendas
+    codigo_tienda, _ = _codigos(df_tiendas['tienda_id'])
+    codigo_sku, skus = _codigos(df_tiendas['sku'])
+    errores.append((HOJA_TIENDAS, np.flatnonzero(codigo_tienda < 0), 'tienda_id', NIVEL_ERROR, 'Vacío'))
+    errores.append((HOJA_TIENDAS, np.flatnonzero(codigo_sku < 0), 'sku', NIVEL_ERROR, 'Vacío'))
+    _revisar_enteros(errores, HOJA_TIENDAS, df_tiendas, ('stock_actual', 'venta_ultima_semana', 'venta_4_semanas'))
+    tipo_carga = normalizar_tipo_carga(df_tiendas['tipo_carga'])
+    errores.append((HOJA_TIENDAS, np.flatnonzero(tipo_carga.codes < 0), 'tipo_carga', NIVEL_ERROR,
+                    f"Vacío o desconocido (usa {' o '.join(TIPOS_CARGA)})"))
+    errores.append((HOJA_TIENDAS, np.flatnonzero(df_tiendas['prioridad_tienda'].isna().to_numpy()), 'prioridad_tienda',
+                    NIVEL_ERROR, 'Vacío'))
+    errores.append((HOJA_TIENDAS, np.flatnonzero(_filas_repetidas(codigo_tienda, codigo_sku, len(skus))), 'sku',
+                    NIVEL_ERROR, 'tienda_id+sku repetido'))
+    en_bodega = pc.is_in(pa.array(skus, type=pa.large_string()), value_set=pa.array(df_bodega['sku'].dropna().astype(str), type=pa.large_string()))
+    sin_bodega = np.append(~en_bodega.to_numpy(zero_copy_only=False), False)[codigo_sku]
+    errores.append((HOJA_TIENDAS, np.flatnonzero(sin_bodega), 'sku', NIVEL_AVISO, "Sin fila en 'Stock Bodega' (stock 0)"))
+    
+    # Stock Bodega (una fila por SKU, o por bodega y SKU con varias bodegas)
+    errores.append((HOJA_BODEGA, np.flatnonzero(df_bodega['sku'].isna().to_numpy()), 'sku', NIVEL_ERROR, 'Vacío'))
+    _revisar_enteros(errores, HOJA_BODEGA, df_bodega, ('stock_bodega',), NIVEL_AVISO, 'Negativo (se toma 0)')
+    if len(errores[-1][1]):  # la última regla agregada es la de negativos
+        df_bodega = df_bodega.assign(stock_bodega=df_bodega['stock_bodega'].clip(lower=0))
+    claves = [col for col in ('bodega_id', 'sku') if col in df_bodega.columns]
+    repetidas = df_bodega['sku'].notna() & df_bodega.duplicated(claves, keep=False)
+    errores.append((HOJA_BODEGA, np.flatnonzero(repetidas.to_numpy()), 'sku', NIVEL_ERROR, 'SKU repetido'))
+    
+    df_errores = _tabla_errores([error for error in errores if len(error[1])])
+    return _a_enteros(df_tiendas.assign(tipo_carga=tipo_carga)), _a_enteros(df_bodega), df_errores
+
+def resumir_errores(df_errores):
+    """Cantidad de filas por regla incumplida (hoja, columna, nivel y error), errores primero"""
+    resumen = df_errores.groupby(['hoja', 'columna', 'nivel', 'error'], observed=True, sort=False).agg(
+        filas=('fila', 'size'), primera_fila=('fila', 'min')
+    ).reset_index()
+    return _sin_categorias(resumen.sort_values('nivel', key=lambda nivel: nivel.astype(str) != NIVEL_ERROR, kind='stable'))
+
+def crear_template_descargable():
+    """Crea un template Excel descargable con estructura actualizada"""
+    output = BytesIO()
+    
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # Hoja 1: Stock Tiendas (CON PRIORIDAD)
+        df_tiendas = pd.DataFrame({
+            'tienda_id': ['T001', 'T001', 'T001', 'T002', 'T002', 'T003', 'T003'],
+            'sku': ['SKU-001', 'SKU-002', 'SKU-003', 'SKU-001', 'SKU-002', 'SKU-001', 'SKU-003'],
+            'producto': ['Producto A', 'Producto B', 'Producto C', 'Producto A', 'Producto B', 'Producto A', 'Producto C'],
+            'stock_actual': [8, 0, 5, 3, 12, 1, 0],
+            'venta_ultima_semana': [5, 0, 2, 4, 6, 3, 0],
+            'venta_4_semanas': [22, 0, 8, 18, 24, 12, 0],
+            'tipo_carga': ['reposicion', 'inicial', 'reposicion', 'reposicion', 'reposicion', 'reposicion', 'inicial'],
+            'prioridad_tienda': [1, 1, 1, 2, 2, 3, 3]
+        })
+        df_tiendas.to_excel(writer, sheet_name='Stock Tiendas', index=False)
+        
+        # Hoja 2: Stock Disponible Bodega
+        df_bodega = pd.DataFrame({
+            'sku': ['SKU-001', 'SKU-002', 'SKU-003'],
+            'producto': ['Producto A', 'Producto B', 'Producto C'],
+            'stock_bodega': [150, 80, 45]
+        })
+        df_bodega.to_excel(writer, sheet_name='Stock Bodega', index=False)
+        
+        # Hoja 3: Parámetros
+        df_params = pd.DataFrame({
+            'parametro': ['Carga Mínima (reposición)', 'Carga Inicial (productos nuevos)', 'Máximo por SKU/Tienda'],
+            'valor': [2, 8, 20],
+            'descripcion': ['Mínimo de unidades por tienda', 'Unidades iniciales para nuevos productos', 'Máximo de unidades por SKU en una tienda']
+        })
+        df_params.to_excel(writer, sheet_name='Parámetros', index=False)
+        
+        # Hoja 4: Excepciones (opcional): parámetros distintos por tienda, SKU o tienda+SKU.
+        # Va solo con encabezados, como Capacidad: filas de ejemplo cambiarían los parámetros de las tiendas y SKU de ejemplo
+        df_excepciones = pd.DataFrame(columns=['tienda_id', 'sku', 'carga_minima', 'carga_inicial', 'carga_maxima'])
+        df_excepciones.to_excel(writer, sheet_name='Excepciones', index=False)
+        
+        # Hoja 5: Capacidad (opcional): unidades (o volumen, con la columna volumen en bodega) por despacho a cada tienda.
+        # Va solo con encabezados: filas de ejemplo limitarían las tiendas de ejemplo de 'Stock Tiendas' (el ejemplo está en Instrucciones)
+        df_capacidad = pd.DataFrame(columns=['tienda_id', 'capacidad'])
+        df_capacidad.to_excel(writer, sheet_name='Capacidad', index=False)
+        
+        # Hoja 6: Instrucciones
+        df_instrucciones = pd.DataFrame({
+            'Campo': ['tienda_id', 'sku', 'producto', 'stock_actual', 'venta_ultima_semana', 'venta_4_semanas', 'tipo_carga', 'prioridad_tienda',
+                      'Excepciones', 'Capacidad', 'Asignación'],
+            'Descripción': [
+                'ID único de la tienda (ej: T001)',
+                'Código único del SKU (ej: SKU-001)',
+                'Nombre del producto (opcional)',
+                'Unidades actuales en tienda',
+                'Venta en últimos 7 días',
+                'Venta en últimas 4 semanas',
+                'Marca como "reposicion" o "inicial"',
+                'Orden de carga: 1=primero, 5=último',
+                'Parámetros por tienda, SKU o tienda+SKU (celda vacía = valor general; la hoja viene vacía, agrega una fila por excepción)',
+                'Capacidad del despacho por tienda, en unidades o en volumen si Stock Bodega tiene columna volumen (opcional; la hoja viene vacía, agrega una fila por tienda)',
+                'Varias bodegas: hoja con tienda_id, bodega_principal y bodega_respaldo, y columna bodega_id en Stock Bodega (opcional)'
+            ],
+            'Ejemplo': ['T001', 'SKU-001', 'Producto A', '8', '5', '22', 'reposicion', '1', 'T001 / (vacío) / 4 / (vacío) / 30', 'T001 / 60',
+                        'T001 / CD-NORTE / CD-SUR']
+        })
+        df_instrucciones.to_excel(writer, sheet_name='Instrucciones', index=False)
+        
+        writer.close()
+    
+    output.seek(0)
+    return output
+
+def _sin_categorias(df):
+    """Columnas categóricas de un agregado (pequeño) como valores simples"""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
+
+def _resumen_completitud_tiendas(df_resultados):
+    """Porcentaje de filas completas y prioridad por tienda"""
+    resumen_tiendas = df_resultados.assign(
+        porcentaje_carga=df_resultados['estado'].eq('Completa')
+    ).groupby('tienda_id', observed=True).agg(
+        porcentaje_carga=('porcentaje_carga', 'mean'),
+        prioridad=('prioridad', 'first')
+    ).reset_index()
+    return _sin_categorias(resumen_tiendas)
+
+# Estados posibles de una fila y códigos de razón de los resultados
+ESTADOS = ['Completa', 'Parcialmente cargada', 'No cargada', 'Sin necesidad']
+RAZON_CARGA_INICIAL = 0
+RAZON_NIVEL_MINIMO = 1
+RAZON_REPOSICION = 2
+RAZON_VELOCIDAD = 3
+
+# Modos de cálculo de la demanda
+MODO_MINIMO = 'minimo'
+MODO_VELOCIDAD = 'velocidad'
+MODOS_DEMANDA = (MODO_MINIMO, MODO_VELOCIDAD)
+COBERTURA_DIAS = 14
+PESO_ULTIMA_SEMANA = 0.5
+
+# Reparto del stock de bodega entre tiendas de una misma prioridad
+REPARTO_SECUENCIAL = 'secuencial'
+REPARTO_PROPORCIONAL = 'proporcional'
+REPARTOS = (REPARTO_SECUENCIAL, REPARTO_PROPORCIONAL)
+
+def _entero_compacto(valores, tipo=np.int32):
+    """Convierte enteros a un tipo angosto si todos los valores caben; si no, los deja como están"""
+    valores = np.asarray(valores)
+    if valores.dtype.kind == 'f' and not np.isnan(valores).any() and np.array_equal(valores, np.trunc(valores)):
+        valores = valores.astype(np.int64)
+    if valores.dtype.kind not in 'iu':
+        return valores
+    limites = np.iinfo(tipo)
+    if len(valores) and (valores.min() < limites.min or valores.max() > limites.max):
+        return valores
+    return valores.astype(tipo)
+
+def compactar_resultados(df_resultados):
+    """
+    Vuelve a dejar como categóricas las columnas de texto (por ejemplo después de
+    un concat), sin categorías que ya no se usan.
+    """
+    df_resultados = df_resultados.copy()
+    for col in ('tienda_id', 'sku', 'producto', 'tipo_carga'):
+        if col in df_resultados.columns:
+            df_resultados[col] = df_resultados[col].astype('category').cat.remove_unused_categories()
+    if 'estado' in df_resultados.columns:
+        df_resultados['estado'] = df_resultados['estado'].astype(pd.CategoricalDtype(ESTADOS))
+    return df_resultados
+
+def formatear_razon(df_resultados):
+    """
+    Texto de la razón de cada fila, armado desde codigo_razon, el estado y las cantidades.
+    Se usa solo para las filas que se muestran o exportan.
+    """
+    carga_minima = df_resultados.attrs.get('carga_minima')
+    cobertura_dias = df_resultados.attrs.get('cobertura_dias')
+    codigo = df_resultados['codigo_razon'].to_numpy()
+    razon = pd.Series(np.select(
+        [codigo == RAZON_CARGA_INICIAL, codigo == RAZON_NIVEL_MINIMO, codigo == RAZON_VELOCIDAD],
+        ['Carga inicial (nuevo producto)', 'Tienda en nivel mínimo', f'Reposición por venta ({cobertura_dias} días de cobertura)'],
+        default=f'Reposición a mínimo ({carga_minima} unidades)'
+    ), index=df_resultados.index)
+    
+    # Con excepciones el mínimo viene por fila
+    if 'carga_minima' in df_resultados.columns:
+        reposicion = codigo == RAZON_REPOSICION
+        razon[reposicion] = 'Reposición a mínimo (' + df_resultados['carga_minima'][reposicion].astype(str) + ' unidades)'
+    
+    estado = df_resultados['estado']
+    por_capacidad = (df_resultados['por_capacidad'].to_numpy() if 'por_capacidad' in df_resultados.columns
+                     else np.zeros(len(df_resultados), dtype=bool))
+    parcial = (estado == 'Parcialmente cargada').to_numpy()
+    if parcial.any():
+        limite = np.where(por_capacidad[parcial], ', capacidad de la tienda)', ' disponibles)')
+        razon[parcial] = (razon[parcial] + ' (solo ' + df_resultados['cantidad_a_despachar'][parcial].astype(str)
+                          + ' de ' + df_resultados['cantidad_sugerida'][parcial].astype(str) + limite)
+    no_cargada = (estado == 'No cargada').to_numpy()
+    if no_cargada.any():
+        razon[no_cargada] = razon[no_cargada] + np.where(
+            por_capacidad[no_cargada], ' (capacidad de la tienda completa)', ' (bodega insuficiente)'
+        )
+    return razon
+
+def _contiene(columna, texto):
+    """Máscara de filas cuyo valor contiene texto (sin distinguir mayúsculas); en categóricas busca solo en las categorías"""
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        categorias = columna.cat.categories
+        coincidentes = categorias[categorias.astype(str).str.contains(texto, case=False, regex=False)]
+        return columna.isin(coincidentes).to_numpy()
+    return columna.astype(str).str.contains(texto, case=False, regex=False).to_numpy()
+
+def filtrar_resultados(df, prioridades=None, tiendas=None, texto_sku=None, estados=None):
+    """
+    Filas de df (resultados o un resumen) que cumplen los filtros; un filtro vacío
+    o cuya columna no está en df no se aplica.
+    """
+    mascara = np.ones(len(df), dtype=bool)
+    if prioridades and 'prioridad' in df.columns:
+        mascara &= df['prioridad'].isin(prioridades).to_numpy()
+    if tiendas and 'tienda_id' in df.columns:
+        mascara &= df['tienda_id'].isin(tiendas).to_numpy()
+    if texto_sku and 'sku' in df.columns:
+        mascara &= _contiene(df['sku'], texto_sku)
+    if estados and 'estado' in df.columns:
+        mascara &= df['estado'].isin(estados).to_numpy()
+    return df if mascara.all() else df[mascara]
+
+# Parámetros que admiten excepciones por tienda, SKU o tienda+SKU
+PARAMETROS_CARGA = ('carga_minima', 'carga_inicial', 'carga_maxima')
+
+def validar_excepciones(df_excepciones):
+    """
+    Normaliza la hoja 'Excepciones': columnas tienda_id y/o sku (vacío = todas) y uno o
+    más de carga_minima, carga_inicial y carga_maxima (vacío = valor general).
+    Retorna None si no hay excepciones; lanza ValueError si la tabla es ambigua.
+    """
+    if df_excepciones is None or len(df_excepciones) == 0:
+        return None
+    
+    parametros = [col for col in PARAMETROS_CARGA if col in df_excepciones.columns]
+    if not parametros:
+        raise ValueError(f"La hoja '{HOJA_EXCEPCIONES}' no tiene columnas de parámetros ({', '.join(PARAMETROS_CARGA)})")
+    if 'tienda_id' not in df_excepciones.columns and 'sku' not in df_excepciones.columns:
+        raise ValueError(f"La hoja '{HOJA_EXCEPCIONES}' necesita una columna tienda_id o sku")
+    
+    excepciones = pd.DataFrame({
+        col: (df_excepciones[col].astype(object).where(df_excepciones[col].notna(), None).to_numpy()
+              if col in df_excepciones.columns else np.full(len(df_excepciones), None, dtype=object))
+        for col in ('tienda_id', 'sku')
+    })
+    for col in parametros:
+        valores = pd.to_numeric(df_excepciones[col], errors='raise').to_numpy(dtype=np.float64, na_value=np.nan)
+        if (valores < 0).any():
+            raise ValueError(f"La hoja '{HOJA_EXCEPCIONES}' tiene valores negativos en {col}")
+        excepciones[col] = valores
+    
+    sin_clave = excepciones['tienda_id'].isna() & excepciones['sku'].isna()
+    if sin_clave.any():
+        raise ValueError(f"La hoja '{HOJA_EXCEPCIONES}' tiene {int(sin_clave.sum())} fila(s) sin tienda_id ni sku")
+    duplicadas = excepciones.duplicated(['tienda_id', 'sku'], keep=False)
+    if duplicadas.any():
+        ejemplos = excepciones.loc[duplicadas, ['tienda_id', 'sku']].drop_duplicates().head(3)
+        claves = ', '.join(f"{tienda or '*'}/{sku or '*'}" for tienda, sku in ejemplos.itertuples(index=False))
+        raise ValueError(f"La hoja '{HOJA_EXCEPCIONES}' repite combinaciones tienda/SKU: {claves}")
+    return excepciones
+
+MUESTRA_TRAMOS = 10_000
+
+def _es_texto_arrow(columna):
+    return isinstance(columna.dtype, pd.StringDtype) and columna.dtype.storage == 'pyarrow'
+
+def _inicios_tramos(arreglo):
+    """Posiciones donde cambia el valor de un arreglo Arrow (cada tramo repite un solo valor)"""
+    cambios = pc.fill_null(pc.not_equal(arreglo[1:], arreglo[:-1]), True)
+    return np.flatnonzero(np.concatenate(([True], cambios.to_numpy(zero_copy_only=False))))
+
+def _codigos(columna):
+    """
+    Códigos y valores de una columna de texto (sin factorizar de nuevo si ya es categórica).
+    Las columnas de texto Arrow se codifican con pyarrow; si vienen agrupadas (ej. tienda_id
+    en un extracto ordenado por tienda) solo se codifica el primer valor de cada tramo.
+    """
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        return columna.cat.codes.to_numpy(), pd.Index(columna.cat.categories)
+    if not _es_texto_arrow(columna) or len(columna) < 2:
+        codigos, valores = pd.factorize(columna)
+        return codigos, pd.Index(valores)
+    
+    arreglo = pa.array(columna)
+    if isinstance(arreglo, pa.ChunkedArray):
+        arreglo = arreglo.combine_chunks()
+    inicios = None
+    # Una muestra decide si vale la pena buscar tramos en toda la columna
+    if len(_inicios_tramos(arreglo[:MUESTRA_TRAMOS])) * 4 <= min(len(arreglo), MUESTRA_TRAMOS):
+        inicios = _inicios_tramos(arreglo)
+        if len(inicios) * 4 > len(arreglo):
+            inicios = None
+    codificado = pc.dictionary_encode(arreglo if inicios is None else arreglo.take(inicios))
+    indices = codificado.indices
+    codigos = (indices.fill_null(-1) if indices.null_count else indices).to_numpy(zero_copy_only=False)
+    if inicios is not None:
+        codigos = np.repeat(codigos, np.diff(np.append(inicios, len(arreglo))))
+    return codigos, pd.Index(codificado.dictionary.to_pandas())
+
+def _posicion_por_codigo(codigos_excepcion, posiciones, codigos_filas, n_valores):
+    """Join directo por código: posición de la excepción de cada fila (-1 si no tiene)"""
+    tabla = np.full(n_valores + 1, -1, dtype=np.int64)
+    tabla[codigos_excepcion] = posiciones
+    return tabla[np.where(codigos_filas >= 0, codigos_filas, n_valores)]
+
+def resolver_excepciones(df, excepciones):
+    """
+    Valores de excepción de cada fila de df por parámetro (NaN donde rige el valor
+    general), con prioridad tienda+SKU > SKU > tienda.
+    Cada nivel es un join indexado sobre los códigos de tienda y SKU, así que el
+    costo no crece con el número de excepciones por fila. Retorna None sin excepciones.
+    """
+    excepciones = validar_excepciones(excepciones)
+    if excepciones is None:
+        return None
+    
+    codigo_tienda, tiendas = _codigos(df['tienda_id'])
+    codigo_sku, skus = _codigos(df['sku'])
+    exc_tienda = tiendas.get_indexer(excepciones['tienda_id'])
+    exc_sku = skus.get_indexer(excepciones['sku'])
+    tiene_tienda = excepciones['tienda_id'].notna().to_numpy()
+    tiene_sku = excepciones['sku'].notna().to_numpy()
+    
+    # Posición de la excepción que aplica a cada fila, del nivel más general al más específico
+    niveles = []
+    solo_tienda = np.flatnonzero(tiene_tienda & ~tiene_sku & (exc_tienda >= 0))
+    if len(solo_tienda):
+        niveles.append(_posicion_por_codigo(exc_tienda[solo_tienda], solo_tienda, codigo_tienda, len(tiendas)))
+    solo_sku = np.flatnonzero(tiene_sku & ~tiene_tienda & (exc_sku >= 0))
+    if len(solo_sku):
+        niveles.append(_posicion_por_codigo(exc_sku[solo_sku], solo_sku, codigo_sku, len(skus)))
+    ambas = np.flatnonzero(tiene_tienda & tiene_sku & (exc_tienda >= 0) & (exc_sku >= 0))
+    if len(ambas):
+        claves = pd.Index(exc_tienda[ambas].astype(np.int64) * len(skus) + exc_sku[ambas])
+        clave_filas = np.where((codigo_tienda >= 0) & (codigo_sku >= 0),
+                               codigo_tienda.astype(np.int64) * len(skus) + codigo_sku, -1)
+        posicion = claves.get_indexer(clave_filas)
+        niveles.append(np.where(posicion >= 0, ambas[np.maximum(posicion, 0)], -1))
+    
+    valores_filas = {}
+    for col in PARAMETROS_CARGA:
+        if col not in excepciones.columns:
+            continue
+        valores_excepcion = np.append(excepciones[col].to_numpy(), np.nan)
+        valores = np.full(len(df), np.nan)
+        for posicion in niveles:
+            nivel = valores_excepcion[posicion]  # posición -1 -> NaN agregado al final
+            valores = np.where(np.isnan(nivel), valores, nivel)
+        valores_filas[col] = valores
+    return valores_filas
+
+def _parametros_filas(excepciones_filas, carga_minima, carga_inicial, carga_maxima):
+    """(carga_minima, carga_inicial, carga_maxima): escalares, o arreglos por fila donde hay excepciones"""
+    parametros = {'carga_minima': carga_minima, 'carga_inicial': carga_inicial, 'carga_maxima': carga_maxima}
+    for col, valores in (excepciones_filas or {}).items():
+        parametros[col] = np.where(np.isnan(valores), parametros[col], valores).astype(np.int64)
+    return tuple(parametros[col] for col in PARAMETROS_CARGA)
+
+def _demanda(es_inicial, stock_actual, carga_minima, carga_inicial, carga_maxima, objetivo=None):
+    """
+    Demanda por fila: carga inicial o reposición hasta el stock objetivo (por
+    defecto carga_minima), limitada al máximo
+    """
+    if objetivo is None:
+        objetivo = carga_minima
+    sugerida_base = np.where(es_inicial, carga_inicial, np.maximum(objetivo - stock_actual, 0))
+    return sugerida_base, np.minimum(sugerida_base, carga_maxima)
+
+def _objetivo_por_velocidad(venta_ultima_semana, venta_4_semanas, carga_minima,
+                            cobertura_dias=COBERTURA_DIAS, peso_ultima_semana=PESO_ULTIMA_SEMANA):
+    """
+    Stock objetivo por fila según la venta: venta diaria ponderada (última semana
+    y promedio de 4 semanas) por los días de cobertura, redondeada hacia arriba
+    y nunca bajo carga_minima
+    """
+    venta_diaria = (peso_ultima_semana * np.asarray(venta_ultima_semana, dtype=np.float64) / 7
+                    + (1 - peso_ultima_semana) * np.asarray(venta_4_semanas, dtype=np.float64) / 28)
+    objetivo = np.ceil(np.round(venta_diaria * cobertura_dias, 9)).astype(np.int64)
+    return np.maximum(objetivo, carga_minima)
+
+def _objetivo_filas(df, modo, carga_minima, cobertura_dias, peso_ultima_semana):
+    """Stock objetivo de cada fila según el modo de demanda (None = carga_minima)"""
+    if modo not in MODOS_DEMANDA:
+        raise ValueError(f"Modo de demanda desconocido: {modo!r} (opciones: {', '.join(MODOS_DEMANDA)})")
+    if modo == MODO_MINIMO:
+        return None
+    ventas = [df[col].to_numpy() if col in df.columns else np.zeros(len(df))
+              for col in ('venta_ultima_semana', 'venta_4_semanas')]
+    return _objetivo_por_velocidad(*ventas, carga_minima, cobertura_dias, peso_ultima_semana)
+
+def _asignar_stock(cantidad_sugerida, stock_sku, previo, primera_fila):
+    """
+    Stock disponible al llegar a cada fila y cantidad asignada, dada la demanda
+    acumulada previa del mismo SKU. Un stock negativo se consume completo en la
+    primera fila del SKU, igual que en la referencia.
+    """
+    stock_disponible = np.where(
+        stock_sku >= 0,
+        np.maximum(stock_sku - previo, 0),
+        np.where(primera_fila, stock_sku, 0)
+    )
+    cantidad_real = np.minimum(cantidad_sugerida, stock_disponible)
+    return stock_disponible, cantidad_real
+
+def _asignar_proporcional(cantidad_sugerida, stock_sku, codigo_sku, prioridad):
+    """
+    Cantidad asignada repartiendo el stock de cada SKU por prioridad: cada prioridad
+    recibe lo que dejan las anteriores y, si no alcanza para toda su demanda, lo
+    reparte entre sus filas en proporción a la demanda, redondeando por restos
+    mayores (empates en orden de carga).
+    """
+    n_filas = len(cantidad_sugerida)
+    cantidad_sugerida = np.asarray(cantidad_sugerida, dtype=np.int64)
+    if n_filas == 0:
+        return cantidad_sugerida.copy()
+    
+    # Grupos (SKU, prioridad) ordenados por SKU y luego por prioridad
+    codigo_prioridad, prioridades = pd.factorize(prioridad, sort=True)
+    claves, grupo = np.unique(codigo_sku.astype(np.int64) * len(prioridades) + codigo_prioridad, return_inverse=True)
+    n_grupos = len(claves)
+    demanda = np.bincount(grupo, weights=cantidad_sugerida, minlength=n_grupos).astype(np.int64)
+    
+    # Stock que llega a cada grupo: el del SKU menos la demanda de las prioridades anteriores
+    stock_grupo = np.zeros(n_grupos, dtype=np.int64)
+    stock_grupo[grupo] = stock_sku
+    sku_grupo = claves // len(prioridades)
+    inicio_sku = np.r_[True, sku_grupo[1:] != sku_grupo[:-1]]
+    demanda_acumulada = np.cumsum(demanda) - demanda
+    demanda_previa = demanda_acumulada - np.maximum.accumulate(np.where(inicio_sku, demanda_acumulada, 0))
+    asignable = np.clip(stock_grupo - demanda_previa, 0, demanda)
+    
+    # Parte entera de la cuota proporcional de cada fila y su resto
+    demanda_fila = np.maximum(demanda[grupo], 1)
+    cuota = cantidad_sugerida * asignable[grupo]
+    cantidad_real, resto = np.divmod(cuota, demanda_fila)
+    
+    # Las unidades sobrantes de cada grupo van a las filas con mayor resto
+    sobrantes = asignable - np.bincount(grupo, weights=cantidad_real, minlength=n_grupos).astype(np.int64)
+    orden = np.lexsort((np.arange(n_filas), -resto, grupo))
+    inicio_grupo = np.cumsum(np.bincount(grupo, minlength=n_grupos)) - np.bincount(grupo, minlength=n_grupos)
+    rango = np.arange(n_filas) - inicio_grupo[grupo[orden]]
+    cantidad_real[orden[rango < sobrantes[grupo[orden]]]] += 1
+    return cantidad_real
+
+def validar_capacidades(df_capacidad):
+    """
+    Normaliza la hoja 'Capacidad' (tienda_id, capacidad) como una Series de capacidad
+    por tienda. Retorna None si no hay capacidades; lanza ValueError si la tabla es inválida.
+    """
+    if df_capacidad is None or len(df_capacidad) == 0:
+        return None
+    faltantes = [col for col in ('tienda_id', 'capacidad') if col not in df_capacidad.columns]
+    if faltantes:
+        raise ValueError(f"La hoja '{HOJA_CAPACIDAD}' necesita las columnas: {', '.join(faltantes)}")
+    
+    capacidad = pd.to_numeric(df_capacidad['capacidad'], errors='raise')
+    if capacidad.isna().any() or (capacidad < 0).any():
+        raise ValueError(f"La hoja '{HOJA_CAPACIDAD}' tiene capacidades vacías o negativas")
+    tiendas = df_capacidad['tienda_id'].astype(object)
+    if tiendas.duplicated().any():
+        raise ValueError(f"La hoja '{HOJA_CAPACIDAD}' repite tiendas: {', '.join(map(str, tiendas[tiendas.duplicated()].unique()[:3]))}")
+    return pd.Series(capacidad.to_numpy(dtype=np.float64), index=pd.Index(tiendas, name='tienda_id'), name='capacidad')
+
+def _volumen_filas(skus, df_bodega):
+    """Volumen por unidad del SKU de cada fila (columna volumen de 'Stock Bodega'; 1 si no está)"""
+    if 'volumen' not in df_bodega.columns:
+        return np.ones(len(skus))
+    volumen = df_bodega.set_index('sku')['volumen']
+    if (volumen <= 0).any():
+        raise ValueError("'Stock Bodega' tiene volúmenes en cero o negativos")
+    return skus.map(volumen).fillna(1).to_numpy(dtype=np.float64)
+
+def _asignar_con_capacidad(cantidad_sugerida, stock_sku, codigo_sku, codigo_tienda, capacidad_tienda, volumen):
+    """
+    Asignación en orden de carga con dos límites: el stock de bodega de cada SKU y la
+    capacidad de cada tienda (en unidades x volumen). La capacidad se llena en orden de
+    carga: la primera fila que no cabe completa recibe lo que cabe y cierra la tienda.
+    
+    La capacidad acopla los SKU de una tienda, así que no sirve la suma acumulada por
+    SKU; pero las filas de una tienda son contiguas (y sus SKU, ordenados) y cada SKU
+    aparece una vez por tienda, así que se resuelve por bloques de tienda con
+    operaciones de arreglos.
+    Retorna (cantidad asignada, filas limitadas por capacidad, capacidad restante por tienda).
+    """
+    n_filas = len(cantidad_sugerida)
+    cantidad_sugerida = np.asarray(cantidad_sugerida, dtype=np.int64)
+    cantidad_real = np.zeros(n_filas, dtype=np.int64)
+    por_capacidad = np.zeros(n_filas, dtype=bool)
+    restante = np.asarray(capacidad_tienda, dtype=np.float64).copy()
+    if n_filas == 0:
+        return cantidad_real, por_capacidad, restante
+    
+    # Stock por SKU que se va descontando
+    stock = np.zeros(codigo_sku.max() + 1, dtype=np.int64)
+    stock[codigo_sku] = stock_sku
+    
+    cortes = np.flatnonzero(np.r_[True, codigo_tienda[1:] != codigo_tienda[:-1], True])
+    for inicio, fin in zip(cortes[:-1], cortes[1:]):
+        tienda = codigo_tienda[inicio]
+        sku = codigo_sku[inicio:fin]
+        if (sku[1:] == sku[:-1]).any():
+            # Filas repetidas de tienda/SKU: se asignan una a una
+            for fila in range(inicio, fin):
+                _asignar_bloque(fila, fila + 1, cantidad_sugerida, stock, codigo_sku, tienda, restante, volumen,
+                                cantidad_real, por_capacidad)
+        else:
+            _asignar_bloque(inicio, fin, cantidad_sugerida, stock, codigo_sku, tienda, restante, volumen,
+                            cantidad_real, por_capacidad)
+    return cantidad_real, por_capacidad, restante
+
+def _asignar_bloque(inicio, fin, cantidad_sugerida, stock, codigo_sku, tienda, restante, volumen, cantidad_real,
+                    por_capacidad):
+    """Asigna un bloque de filas de una misma tienda (SKU distintos); actualiza stock y restante en el lugar"""
+    sku = codigo_sku[inicio:fin]
+    deseada = np.minimum(cantidad_sugerida[inicio:fin], stock[sku])
+    if np.isinf(restante[tienda]):
+        cantidad = deseada
+    else:
+        vol = volumen[inicio:fin]
+        necesario = deseada * vol
+        previo = np.cumsum(necesario) - necesario
+        cabe = np.floor(np.maximum(restante[tienda] - previo, 0) / vol + 1e-9).astype(np.int64)
+        cantidad = np.minimum(deseada, cabe)
+        limitada = cantidad < deseada
+        por_capacidad[inicio:fin] = limitada
+        restante[tienda] = 0.0 if limitada.any() else restante[tienda] - necesario.sum()
+    cantidad_real[inicio:fin] = cantidad
+    stock[sku] -= cantidad
+
+def _marcas_estado(cantidad_sugerida, cantidad_real):
+    """Filas parcialmente cargadas y no cargadas (mismas reglas que la referencia)"""
+    parcial = (cantidad_real < cantidad_sugerida) & (cantidad_sugerida > 0)
+    no_cargada = ~parcial & (cantidad_real == 0) & (cantidad_sugerida > 0)
+    return parcial, no_cargada
+
+def _codigo_estado(cantidad_sugerida, cantidad_real):
+    """Posición en ESTADOS del estado de cada fila"""
+    parcial, no_cargada = _marcas_estado(cantidad_sugerida, cantidad_real)
+    return np.select(
+        [parcial, no_cargada, cantidad_sugerida > 0],
+        [ESTADOS.index('Parcialmente cargada'), ESTADOS.index('No cargada'), ESTADOS.index('Completa')],
+        default=ESTADOS.index('Sin necesidad')
+    )
+
+def calcular_sugerido_con_prioridad(df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima,
+                                    modo=MODO_MINIMO, cobertura_dias=COBERTURA_DIAS,
+                                    peso_ultima_semana=PESO_ULTIMA_SEMANA, reparto=REPARTO_SECUENCIAL,
+                                    excepciones=None, capacidades=None):
+    """
+    Calcula el sugerido de carga respetando:
+    1. PRIORIDAD de tiendas
+    2. MÁXIMO de carga por SKU/tienda
+    
+    Con modo='velocidad' la reposición lleva cada tienda/SKU a la venta diaria
+    ponderada por cobertura_dias (y al menos a carga_minima) en vez de a carga_minima.
+    
+    Con reparto='proporcional', si el stock no alcanza para una prioridad se
+    reparte entre sus tiendas en proporción a la demanda, en vez de servirlas
+    en orden de tienda_id.
+    
+    excepciones (hoja 'Excepciones') reemplaza carga_minima, carga_inicial y/o
+    carga_maxima por tienda, SKU o tienda+SKU; los valores por fila quedan como
+    columnas de los resultados.
+    
+    capacidades (hoja 'Capacidad') limita lo que recibe cada tienda en total (unidades
+    x volumen del SKU), llenándola en orden de carga; solo con reparto secuencial.
+    
+    La asignación de cada SKU depende solo de sus filas en orden de prioridad,
+    así que se resuelve por columnas: suma acumulada de la demanda por SKU
+    recortada contra el stock de bodega.
+    """
+    
+    # Stock inicial de bodega por SKU
+    stock_bodega_inicial = df_bodega.set_index('sku')['stock_bodega'].to_dict()
+    
+    # Ordenar por prioridad_tienda (mismo orden que la referencia)
+    df = df_tiendas.sort_values(['prioridad_tienda', 'tienda_id', 'sku']).reset_index(drop=True)
+    skus = df['sku']
+    stock_actual = df['stock_actual'].to_numpy()
+    es_inicial = (df['tipo_carga'].str.lower() == 'inicial').to_numpy()
+    
+    # Parámetros por fila: excepciones tienda+SKU > SKU > tienda sobre los valores generales
+    excepciones_filas = resolver_excepciones(df, excepciones)
+    minima_fila, inicial_fila, maxima_fila = _parametros_filas(excepciones_filas, carga_minima, carga_inicial, carga_maxima)
+    
+    # Demanda por fila: carga inicial o reposición al objetivo (mínimo o por venta), limitada al máximo
+    objetivo = _objetivo_filas(df, modo, minima_fila, cobertura_dias, peso_ultima_semana)
+    sugerida_base, cantidad_sugerida = _demanda(
+        es_inicial, stock_actual, minima_fila, inicial_fila, maxima_fila, objetivo
+    )
+    
+    # Stock de bodega del SKU de cada fila (0 si el SKU no está en bodega)
+    stock_sku = skus.map(stock_bodega_inicial).fillna(0)
+    if pd.api.types.is_integer_dtype(df_bodega['stock_bodega']):
+        stock_sku = stock_sku.astype('int64')
+    stock_sku = stock_sku.to_numpy()
+    
+    # Demanda acumulada del SKU antes de cada fila
+    acumulado = pd.Series(cantidad_sugerida).groupby(skus, sort=False).cumsum().to_numpy()
+    previo = acumulado - cantidad_sugerida
+    
+    # Stock disponible al llegar a cada fila y cantidad asignada
+    if reparto not in REPARTOS:
+        raise ValueError(f"Reparto desconocido: {reparto!r} (opciones: {', '.join(REPARTOS)})")
+    capacidad = validar_capacidades(capacidades)
+    if capacidad is not None and reparto != REPARTO_SECUENCIAL:
+        raise ValueError("La capacidad por tienda solo se aplica con reparto secuencial")
+    por_capacidad = None
+    if capacidad is not None:
+        # La capacidad acopla los SKU de cada tienda: asignación secuencial por bloques de tienda
+        codigo_sku, _ = pd.factorize(skus)
+        codigo_tienda, tiendas = _codigos(df['tienda_id'])
+        codigo_tienda = np.where(codigo_tienda >= 0, codigo_tienda, len(tiendas))
+        capacidad_tienda = np.append(capacidad.reindex(tiendas.astype(object)).fillna(np.inf).to_numpy(), np.inf)
+        cantidad_real, por_capacidad, restante = _asignar_con_capacidad(
+            cantidad_sugerida, stock_sku, codigo_sku, codigo_tienda, capacidad_tienda, _volumen_filas(skus, df_bodega)
+        )
+        asignado = pd.Series(cantidad_real).groupby(skus, sort=False).cumsum().to_numpy()
+        stock_disponible = stock_sku - (asignado - cantidad_real)
+    elif reparto == REPARTO_SECUENCIAL:
+        primera_fila = ~skus.duplicated().to_numpy()
+        stock_disponible, cantidad_real = _asignar_stock(cantidad_sugerida, stock_sku, previo, primera_fila)
+    else:
+        codigo_sku, _ = pd.factorize(skus)
+        cantidad_real = _asignar_proporcional(cantidad_sugerida, stock_sku, codigo_sku, df['prioridad_tienda'].to_numpy())
+        asignado = pd.Series(cantidad_real).groupby(skus, sort=False).cumsum().to_numpy()
+        stock_disponible = stock_sku - (asignado - cantidad_real)
+    disponible_despues = stock_disponible - cantidad_real
+    
+    # Estado de cada fila (categórico con categorías fijas)
+    codigo_estado = _codigo_estado(cantidad_sugerida, cantidad_real)
+    
+    # Código de razón; el texto se arma solo al mostrar o exportar (formatear_razon)
+    por_velocidad = objetivo > minima_fila if objetivo is not None else np.zeros(len(df), dtype=bool)
+    codigo_razon = np.select(
+        [es_inicial, sugerida_base == 0, por_velocidad],
+        [RAZON_CARGA_INICIAL, RAZON_NIVEL_MINIMO, RAZON_VELOCIDAD],
+        default=RAZON_REPOSICION
+    ).astype(np.int8)
+    
+    n_filas = len(df)
+    df_resultados = pd.DataFrame({
+        'tienda_id': df['tienda_id'].astype('category'),
+        'sku': skus.astype('category'),
+        'producto': (df['producto'] if 'producto' in df.columns else skus).astype('category'),
+        'prioridad': _entero_compacto(df['prioridad_tienda'].to_numpy(), np.int16),
+        'stock_antes': _entero_compacto(stock_actual),
+        'stock_despues': _entero_compacto(stock_actual + cantidad_real),
+        'cantidad_a_despachar': _entero_compacto(cantidad_real),
+        'cantidad_sugerida': _entero_compacto(cantidad_sugerida),
+        'codigo_razon': codigo_razon,
+        'venta_ultima_semana': _entero_compacto(df['venta_ultima_semana'].to_numpy() if 'venta_ultima_semana' in df.columns else np.zeros(n_filas)),
+        'venta_4_semanas': _entero_compacto(df['venta_4_semanas'].to_numpy() if 'venta_4_semanas' in df.columns else np.zeros(n_filas)),
+        'stock_bodega_disponible': _entero_compacto(stock_disponible),
+        'stock_bodega_despues': _entero_compacto(disponible_despues),
+        'tipo_carga': df['tipo_carga'].astype('category'),
+        'orden_carga': np.arange(1, n_filas + 1, dtype=np.int32 if n_filas < np.iinfo(np.int32).max else np.int64),
+        'estado': pd.Categorical.from_codes(codigo_estado, categories=ESTADOS)
+    })
+    for col, valores in zip(PARAMETROS_CARGA, (minima_fila, inicial_fila, maxima_fila)):
+        if excepciones_filas and col in excepciones_filas:
+            df_resultados[col] = _entero_compacto(valores, np.int16)
+    if por_capacidad is not None:
+        df_resultados['por_capacidad'] = por_capacidad
+    
+    # Constantes de la corrida como metadatos, no repetidas en cada fila
+    df_resultados.attrs.update({
+        'carga_minima': carga_minima,
+        'carga_inicial': carga_inicial,
+        'carga_maxima_aplicada': carga_maxima,
+        'modo': modo,
+        'cobertura_dias': cobertura_dias,
+        'peso_ultima_semana': peso_ultima_semana,
+        'reparto': reparto
+    })
+    if capacidad is not None:
+        # Capacidad que queda en las tiendas con límite (la usa el cálculo por particiones de SKU)
+        con_limite = np.isfinite(capacidad_tienda[:-1])
+        df_resultados.attrs['capacidad_restante'] = dict(zip(tiendas[con_limite], restante[:-1][con_limite].tolist()))
+    
+    # Stock final de bodega: último saldo de cada SKU despachado
+    stock_bodega_final = dict(stock_bodega_inicial)
+    ultimo_saldo = pd.Series(disponible_despues).groupby(skus, sort=False).last()
+    stock_bodega_final.update(zip(ultimo_saldo.index, ultimo_saldo.to_numpy().tolist()))
+    
+    resumen_tiendas = _resumen_completitud_tiendas(df_resultados)
+    
+    return df_resultados, resumen_tiendas, stock_bodega_final
+
+def ordenar_para_particiones(df_tiendas):
+    """
+    'Stock Tiendas' en orden de carga y con las columnas de texto como categóricas
+    con todas sus categorías, para calcular por partes (subconjuntos de filas) y
+    unir después los resultados con unir_particiones sin perder las categóricas.
+    """
+    df = df_tiendas.sort_values(['prioridad_tienda', 'tienda_id', 'sku']).reset_index(drop=True)
+    for col in ('tienda_id', 'sku', 'producto', 'tipo_carga'):
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def unir_particiones(partes, posiciones):
+    """
+    Une los resultados de particiones de la tabla de ordenar_para_particiones:
+    partes[i] son los resultados de las filas posiciones[i] (en orden). Cada fila
+    vuelve a su posición y orden_carga se numera de nuevo; los attrs son los de la primera parte.
+    """
+    df_resultados = pd.concat(partes, ignore_index=True)
+    orden = np.empty(len(df_resultados), dtype=np.int64)
+    orden[np.concatenate(posiciones)] = np.arange(len(df_resultados))
+    df_resultados = df_resultados.take(orden).reset_index(drop=True)
+    df_resultados['orden_carga'] = np.arange(1, len(df_resultados) + 1, dtype=df_resultados['orden_carga'].dtype)
+    df_resultados.attrs = dict(partes[0].attrs)
+    return df_resultados
+
+def calcular_sugerido_referencia(df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima):
+    """
+    Implementación de referencia (fila a fila) del sugerido con prioridad.
+    Se conserva para validar que el motor vectorizado entrega los mismos resultados.
+    """
+    
+    # Crear copia mutable del stock bodega
+    stock_bodega_disponible = df_bodega.set_index('sku')['stock_bodega'].to_dict()
+    
+    # Ordenar por prioridad_tienda
+    df_tiendas_ordenadas = df_tiendas.sort_values(['prioridad_tienda', 'tienda_id', 'sku']).reset_index(drop=True)
+    
+    resultados = []
+    orden_carga = 0
+    
+    for idx, row in df_tiendas_ordenadas.iterrows():
+        orden_carga += 1
+        
+        sku = row['sku']
+        tienda = row['tienda_id']
+        stock_actual = row['stock_actual']
+        tipo_carga = row['tipo_carga']
+        prioridad = row['prioridad_tienda']
+        
+        # Obtener stock disponible en bodega
+        stock_bodega = stock_bodega_disponible.get(sku, 0)
+        
+        # Determinar cantidad sugerida
+        if tipo_carga.lower() == 'inicial':
+            cantidad_sugerida = carga_inicial
+            razon = f"Carga inicial (nuevo producto)"
+        else:  # reposición
+            cantidad_sugerida = max(0, carga_minima - stock_actual)
+            if cantidad_sugerida == 0:
+                razon = "Tienda en nivel mínimo"
+            else:
+                razon = f"Reposición a mínimo ({carga_minima} unidades)"
+        
+        # APLICAR MÁXIMO DE CARGA por SKU/tienda
+        cantidad_sugerida = min(cantidad_sugerida, carga_maxima)
+        
+        # Ajustar por disponibilidad en bodega
+        cantidad_real = min(cantidad_sugerida, stock_bodega)
+        
+        if cantidad_real < cantidad_sugerida and cantidad_sugerida > 0:
+            estado = "Parcialmente cargada"
+            razon += f" (solo {cantidad_real} de {cantidad_sugerida} disponibles)"
+        elif cantidad_real == 0 and cantidad_sugerida > 0:
+            estado = "No cargada"
+            razon += " (bodega insuficiente)"
+        else:
+            estado = "Completa" if cantidad_sugerida > 0 else "Sin necesidad"
+        
+        # Actualizar stock bodega
+        stock_bodega_disponible[sku] = stock_bodega - cantidad_real
+        disponible_despues = stock_bodega_disponible[sku]
+        stock_despues = stock_actual + cantidad_real
+        
+        resultados.append({
+            'tienda_id': tienda,
+            'sku': sku,
+            'producto': row.get('producto', sku),
+            'prioridad': prioridad,
+            'stock_antes': stock_actual,
+            'stock_despues': stock_despues,
+            'cantidad_a_despachar': cantidad_real,
+            'razon': razon,
+            'venta_ultima_semana': row.get('venta_ultima_semana', 0),
+            'venta_4_semanas': row.get('venta_4_semanas', 0),
+            'stock_bodega_disponible': stock_bodega,
+            'stock_bodega_despues': disponible_despues,
+            'tipo_carga': tipo_carga,
+            'orden_carga': orden_carga,
+            'estado': estado,
+            'carga_maxima_aplicada': carga_maxima
+        })
+    
+    df_resultados = pd.DataFrame(resultados)
+    
+    resumen_tiendas = _resumen_completitud_tiendas(df_resultados)
+    
+    return df_resultados, resumen_tiendas, stock_bodega_disponible
+
+# Excel admite 1.048.576 filas por hoja (incluida la fila de encabezado)
+LIMITE_FILAS_EXCEL = 1_048_576
+# Sobre este número de filas el reporte se escribe en modo streaming
+UMBRAL_REPORTE_STREAMING = 200_000
+FILAS_POR_BLOQUE = 50_000
+
+def _estado_agrupado(n_filas, n_completa, n_parcial):
+    """Estado de un grupo de filas: Completa, Parcial o No cargada"""
+    return np.select(
+        [n_completa == n_filas, n_parcial > 0],
+        ['Completa', 'Parcial'],
+        default='No cargada'
+    )
+
+def agregar_resultados(df_resultados):
+    """
+    Agregados combinables (conteos y sumas) por tienda, por prioridad/tienda y por SKU.
+    Las marcas de estado se derivan como columnas booleanas y se suman en groupbys vectorizados.
+    """
+    estado = df_resultados['estado']
+    base = df_resultados.assign(
+        es_completa=estado.eq('Completa'),
+        es_parcial=estado.eq('Parcialmente cargada'),
+        es_no_cargada=estado.eq('No cargada')
+    )
+    conteos = {
+        'n_filas': ('estado', 'size'),
+        'n_completa': ('es_completa', 'sum'),
+        'n_parcial': ('es_parcial', 'sum'),
+        'n_no_cargada': ('es_no_cargada', 'sum'),
+        'cantidad_a_despachar': ('cantidad_a_despachar', 'sum')
+    }
+    
+    # Por tienda
+    por_tienda = base.groupby('tienda_id', observed=True).agg(
+        prioridad=('prioridad', 'first'),
+        stock_antes=('stock_antes', 'sum'),
+        stock_despues=('stock_despues', 'sum'),
+        **conteos
+    ).reset_index()
+    
+    # Por prioridad y tienda
+    por_prioridad = base.groupby(['prioridad', 'tienda_id'], observed=True).agg(**conteos).reset_index()
+    
+    # Por SKU (impacto en bodega)
+    por_sku = df_resultados.groupby('sku', observed=True).agg(
+        cantidad_a_despachar=('cantidad_a_despachar', 'sum'),
+        stock_bodega_disponible=('stock_bodega_disponible', 'first'),
+        stock_bodega_despues=('stock_bodega_despues', 'first')
+    ).reset_index()
+    
+    return _sin_categorias(por_tienda), _sin_categorias(por_prioridad), _sin_categorias(por_sku)
+
+def combinar_agregados(partes):
+    """
+    Combina agregados de particiones disjuntas por SKU (ver agregar_resultados).
+    Los resultados vienen ordenados por prioridad, así que la prioridad de la tienda es la mínima.
+    """
+    partes = list(partes)
+    columnas_suma = ['n_filas', 'n_completa', 'n_parcial', 'n_no_cargada', 'cantidad_a_despachar']
+    
+    por_tienda = pd.concat([parte[0] for parte in partes]).groupby('tienda_id').agg(
+        prioridad=('prioridad', 'min'),
+        stock_antes=('stock_antes', 'sum'),
+        stock_despues=('stock_despues', 'sum'),
+        **{col: (col, 'sum') for col in columnas_suma}
+    ).reset_index()
+    por_prioridad = pd.concat([parte[1] for parte in partes]).groupby(['prioridad', 'tienda_id'])[columnas_suma].sum().reset_index()
+    por_sku = pd.concat([parte[2] for parte in partes]).sort_values('sku').reset_index(drop=True)
+    
+    return por_tienda, por_prioridad, por_sku
+
+def resumir_agregados(por_tienda, por_prioridad, por_sku, df_bodega, stock_bodega_final):
+    """Completa los agregados con estados y métricas para el Paso 4 y el reporte"""
+    por_tienda = por_tienda.assign(
+        estado=_estado_agrupado(por_tienda['n_filas'], por_tienda['n_completa'], por_tienda['n_parcial'])
+    )
+    por_prioridad = por_prioridad.assign(
+        estado=_estado_agrupado(por_prioridad['n_filas'], por_prioridad['n_completa'], por_prioridad['n_parcial'])
+    )
+    por_sku = por_sku.assign(stock_bodega_final=por_sku['sku'].map(stock_bodega_final))
+    
+    tienda_completa = por_tienda['n_completa'] == por_tienda['n_filas']
+    con_parcial = por_tienda['n_parcial'] > 0
+    con_no_cargada = por_tienda['n_no_cargada'] > 0
+    stock_bodega_inicial = df_bodega['stock_bodega'].sum()
+    stock_bodega_restante = sum(stock_bodega_final.values())
+    
+    return {
+        'por_tienda': por_tienda,
+        'por_prioridad': por_prioridad,
+        'por_sku': por_sku,
+        'total_unidades': por_sku['cantidad_a_despachar'].sum(),
+        'total_skus': len(por_sku),
+        'tiendas_completas': int(tienda_completa.sum()),
+        'tiendas_parciales': int((con_parcial & ~tienda_completa).sum()),
+        'tiendas_con_faltante': int((con_parcial | con_no_cargada).sum()),
+        'tiendas_no_cargadas': int((por_tienda['n_no_cargada'] == por_tienda['n_filas']).sum()),
+        'stock_bodega_inicial': stock_bodega_inicial,
+        'stock_bodega_final': stock_bodega_restante,
+        'stock_bodega_usado': stock_bodega_inicial - stock_bodega_restante
+    }
+
+def calcular_resumenes(df_resultados, df_bodega, stock_bodega_final):
+    """
+    Calcula una sola vez los agregados por tienda, por prioridad/tienda y por SKU
+    que comparten las métricas del Paso 4 y las hojas del reporte.
+    """
+    por_tienda, por_prioridad, por_sku = agregar_resultados(df_resultados)
+    return resumir_agregados(por_tienda, por_prioridad, por_sku, df_bodega, stock_bodega_final)
+
+def _hojas_reporte(df_resultados, resumenes, carga_maxima=None):
+    """
+    Arma las hojas del reporte como {nombre_hoja: DataFrame}.
+    Sin df_resultados (corridas particionadas) se omite la hoja 'Detalle Tiendas'.
+    """
+    # Hoja 1: Resumen ejecutivo
+    if carga_maxima is None:
+        carga_maxima = df_resultados.attrs.get('carga_maxima_aplicada', 0) if df_resultados is not None else 0
+    
+    resumen = pd.DataFrame({
+        'Métrica': [
+            'Total unidades a despachar',
+            'Total SKUs a reponer',
+            'Tiendas completamente cargadas',
+            'Tiendas parcialmente cargadas',
+            'Tiendas no cargadas',
+            'Stock bodega inicial',
+            'Stock bodega final',
+            'Stock bodega usado',
+            'Máximo por SKU/Tienda (aplicado)'
+        ],
+        'Valor': [
+            resumenes['total_unidades'],
+            resumenes['total_skus'],
+            resumenes['tiendas_completas'],
+            resumenes['tiendas_parciales'],
+            resumenes['tiendas_no_cargadas'],
+            resumenes['stock_bodega_inicial'],
+            resumenes['stock_bodega_final'],
+            resumenes['stock_bodega_usado'],
+            carga_maxima
+        ]
+    })
+    
+    # Hoja 2: Detalle por tienda (en orden de prioridad)
+    df_por_tienda = None
+    if df_resultados is not None:
+        # Con varias bodegas, la principal, la de respaldo y lo que sale de esta
+        columnas_bodega = [col for col in ('bodega_id', 'bodega_respaldo', 'cantidad_respaldo') if col in df_resultados.columns]
+        # Selección sin copia (copy-on-write); los resultados ya vienen en orden de carga
+        df_por_tienda = df_resultados[['orden_carga', 'tienda_id', 'prioridad', 'sku', 'producto', 'stock_antes', 
+                                        'stock_despues', 'cantidad_a_despachar', *columnas_bodega, 'tipo_carga', 'estado']]
+        if not df_por_tienda['orden_carga'].is_monotonic_increasing:
+            df_por_tienda = df_por_tienda.sort_values(['orden_carga', 'tienda_id', 'sku'])
+    
+    # Hoja 3: Carga por Prioridad
+    df_prioridad = resumenes['por_prioridad'][['prioridad', 'tienda_id', 'cantidad_a_despachar', 'estado']].rename(columns={
+        'prioridad': 'Prioridad',
+        'tienda_id': 'Tienda',
+        'cantidad_a_despachar': 'Total Despachar',
+        'estado': 'Estado'
+    })
+    
+    # Hoja 4: Impacto bodega
+    df_bodega_impacto = resumenes['por_sku'].rename(columns={
+        'sku': 'SKU',
+        'cantidad_a_despachar': 'Total Despachar',
+        'stock_bodega_disponible': 'Stock Antes',
+        'stock_bodega_despues': 'Stock Después (calculado)',
+        'stock_bodega_final': 'Stock Final (real)'
+    })
+    
+    # Hoja 5: Antes vs Después (agrupado por tienda)
+    pivot_antes_despues = resumenes['por_tienda'].assign(
+        diferencia=lambda df: df['stock_despues'] - df['stock_antes']
+    ).rename(columns={
+        'tienda_id': 'Tienda',
+        'stock_antes': 'Stock Antes',
+        'stock_despues': 'Stock Después',
+        'cantidad_a_despachar': 'Despachar',
+        'diferencia': 'Cambio',
+        'estado': 'Estado',
+        'prioridad': 'Prioridad'
+    })
+    pivot_antes_despues = pivot_antes_despues[['Prioridad', 'Tienda', 'Stock Antes', 'Stock Después', 'Cambio', 'Despachar', 'Estado']]
+    
+    # Hoja 6: Stock por bodega (solo con varias bodegas)
+    df_por_bodega = None
+    if resumenes.get('por_bodega') is not None:
+        df_por_bodega = resumenes['por_bodega'].rename(columns={
+            'bodega_id': 'Bodega',
+            'sku': 'SKU',
+            'stock_bodega': 'Stock Inicial',
+            'despacho_principal': 'Despacho Principal',
+            'despacho_respaldo': 'Despacho Respaldo',
+            'stock_bodega_final': 'Stock Final'
+        })
+    
+    hojas = {
+        'Resumen': resumen,
+        'Detalle Tiendas': df_por_tienda,
+        'Carga por Prioridad': df_prioridad,
+        'Impacto Bodega': df_bodega_impacto,
+        'Antes vs Después': pivot_antes_despues,
+        'Stock por Bodega': df_por_bodega
+    }
+    return {nombre: df for nombre, df in hojas.items() if df is not None}
+
+def _partes_hoja(nombre, df):
+    """Divide una hoja que excede el límite de filas de Excel en 'Nombre', 'Nombre 2', ..."""
+    filas_por_hoja = LIMITE_FILAS_EXCEL - 1
+    if len(df) <= filas_por_hoja:
+        yield nombre, df
+        return
+    for parte, inicio in enumerate(range(0, len(df), filas_por_hoja), start=1):
+        yield (nombre if parte == 1 else f"{nombre} {parte}"), df.iloc[inicio:inicio + filas_por_hoja]
+
+def _escribir_reporte_streaming(output, hojas, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Escribe las hojas con xlsxwriter en modo constant_memory: cada fila se vuelca
+    a disco al escribirse, así la memoria no crece con el número de filas.
+    """
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    formato_encabezado = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+    
+    for nombre, df in hojas.items():
+        for nombre_hoja, parte in _partes_hoja(nombre, df):
+            worksheet = workbook.add_worksheet(nombre_hoja)
+            worksheet.write_row(0, 0, [str(col) for col in parte.columns], formato_encabezado)
+            fila = 1
+            for inicio in range(0, len(parte), filas_por_bloque):
+                bloque = parte.iloc[inicio:inicio + filas_por_bloque].astype(object)
+                bloque = bloque.where(bloque.notna(), None)
+                for valores in bloque.itertuples(index=False, name=None):
+                    worksheet.write_row(fila, 0, valores)
+                    fila += 1
+    
+    workbook.close()
+
+def generar_reporte_descargable(df_resultados, df_bodega, stock_bodega_final, streaming=None, resumenes=None,
+                                destino=None, carga_maxima=None):
+    """
+    Genera un archivo Excel con los reportes de carga y bodega.
+    Con streaming=None se usa el modo streaming solo para resultados grandes.
+    Si ya se calcularon los resumenes (Paso 4) se reutilizan.
+    Si se indica destino (ruta) se escribe directo a disco; si no, se retorna un BytesIO.
+    Con df_resultados=None (corridas particionadas) se requieren los resumenes y se omite el detalle.
+    """
+    if resumenes is None:
+        resumenes = calcular_resumenes(df_resultados, df_bodega, stock_bodega_final)
+    hojas = _hojas_reporte(df_resultados, resumenes, carga_maxima)
+    if streaming is None:
+        streaming = df_resultados is not None and len(df_resultados) > UMBRAL_REPORTE_STREAMING
+    
+    output = destino if destino is not None else BytesIO()
+    
+    if streaming:
+        _escribir_reporte_streaming(output, hojas)
+    else:
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            for nombre, df in hojas.items():
+                for nombre_hoja, parte in _partes_hoja(nombre, df):
+                    parte.to_excel(writer, sheet_name=nombre_hoja, index=False)
+    
+    if destino is None:
+        output.seek(0)
+    return output
+
+def tabla_arrow(df, columnas=None):
+    """
+    DataFrame como tabla Arrow. Las columnas numéricas sin nulos comparten la memoria
+    del DataFrame (no se copian). Con columnas ({columna: nombre_nuevo}) se eligen y
+    renombran columnas de la tabla, también sin copiar datos.
+    """
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    if columnas is not None:
+        tabla = tabla.select(list(columnas)).rename_columns(list(columnas.values()))
+    return tabla
+
+def _nombre_tabla(hoja):
+    """Nombre de archivo de una hoja del reporte ('Antes vs Después' -> 'antes_vs_despues')"""
+    return _texto_normalizado(hoja).replace(' ', '_')
+
+def generar_reporte_parquet(df_resultados, df_bodega, stock_bodega_final, resumenes=None, destino=None, carga_maxima=None):
+    """
+    Las mismas hojas del reporte Excel, una tabla Parquet por hoja, para herramientas
+    de BI. El detalle va completo (sin el límite de filas de Excel) y pasa a Arrow
+    sin copiar sus columnas numéricas.
+    Si se indica destino (ruta) el zip se escribe directo a disco; si no, se retorna un BytesIO.
+    """
+    if resumenes is None:
+        resumenes = calcular_resumenes(df_resultados, df_bodega, stock_bodega_final)
+    hojas = _hojas_reporte(df_resultados, resumenes, carga_maxima)
+    
+    output = destino if destino is not None else BytesIO()
+    # Parquet ya viene comprimido: los archivos se guardan tal cual en el zip
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for nombre, df in hojas.items():
+            with archivo_zip.open(f"{_nombre_tabla(nombre)}.parquet", 'w') as archivo:
+                pq.write_table(tabla_arrow(df), archivo)
+    
+    if destino is None:
+        output.seek(0)
+    return output
+
+# ==================== HASH Y CACHÉ ====================
+
+def hash_dataframe(df):
+    """Hash del contenido de un DataFrame (columnas, tipos y valores)"""
+    h = hashlib.sha1()
+    h.update(repr(list(zip(df.columns, df.dtypes.astype(str)))).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+class CacheLRU:
+    """Caché acotada con expulsión LRU (el menos usado recientemente sale primero)"""
+    
+    def __init__(self, max_entradas=8):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obtener(self, clave):
+        with self._lock:
+            if clave not in self._datos:
+                return None
+            self._datos.move_to_end(clave)
+            return self._datos[clave]
+    
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._datos)
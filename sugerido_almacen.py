@@ -0,0 +1,125 @@
+"""
+Almacén compartido de DataFrames para la app, direccionado por contenido.
+
+Las sesiones guardan en st.session_state solo la clave (hash) de sus entradas y
+resultados; los DataFrames viven una sola vez por proceso en el AlmacenDatos.
+Diez planificadores que cargan el mismo extracto comparten una sola copia.
+
+El almacén tiene un presupuesto de memoria global. Al superarlo, las entradas
+menos usadas recientemente se bajan a Parquet en disco y salen de memoria; al
+pedirlas de nuevo se recargan desde el archivo. Como la clave es el contenido,
+cada archivo se escribe una sola vez. Con la variable SUGERIDO_ALMACEN la carpeta
+es fija y los archivos que ya tiene sirven también después de reiniciar la app.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from motor_sugerido import hash_dataframe
+
+MAX_MB_ALMACEN = int(os.environ.get('SUGERIDO_ALMACEN_MB', 2048))
+CARPETA_ALMACEN = os.environ.get('SUGERIDO_ALMACEN')
+
+def stock_a_tabla(stock):
+    """Stock por SKU (dict) como tabla, para guardarlo en el almacén"""
+    return pd.DataFrame({'sku': list(stock), 'stock_bodega': list(stock.values())})
+
+def tabla_a_stock(df):
+    """Tabla de stock_a_tabla de vuelta a dict por SKU"""
+    return dict(zip(df['sku'].tolist(), df['stock_bodega'].tolist()))
+
+def _tamano_bytes(df):
+    """Memoria que ocupa el DataFrame (con el contenido de las columnas de texto)"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+class AlmacenDatos:
+    """
+    DataFrames por clave de contenido, con un presupuesto de memoria (max_mb) y
+    expulsión LRU a Parquet en carpeta. Por defecto la carpeta es temporal y se
+    borra al terminar el proceso; una carpeta indicada se conserva y se reutiliza.
+    La entrada recién usada nunca se expulsa, aunque por sí sola supere el presupuesto.
+    """
+    
+    def __init__(self, max_mb=MAX_MB_ALMACEN, carpeta=CARPETA_ALMACEN):
+        self.max_bytes = max_mb * 1024 * 1024
+        if carpeta is None:
+            carpeta = tempfile.mkdtemp(prefix='sugerido_almacen_')
+            atexit.register(shutil.rmtree, carpeta, ignore_errors=True)
+        os.makedirs(carpeta, exist_ok=True)
+        self.carpeta = carpeta
+        self._memoria = OrderedDict()
+        self._tamanos = {}
+        self._en_disco = {nombre[:-len('.parquet')] for nombre in os.listdir(carpeta) if nombre.endswith('.parquet')}
+        self._usados = 0
+        self._recargas = 0
+        self._expulsiones = 0
+        self._lock = threading.Lock()
+    
+    def _ruta(self, clave):
+        return os.path.join(self.carpeta, f"{clave}.parquet")
+    
+    def guardar(self, df, clave=None):
+        """
+        Guarda df bajo clave (por defecto hash_dataframe(df)) y retorna la clave.
+        Si la clave ya está, se conserva la copia guardada y df se descarta.
+        """
+        if clave is None:
+            clave = hash_dataframe(df)
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                return clave
+            if clave in self._en_disco:
+                return clave
+            self._agregar(clave, df)
+        return clave
+    
+    def obtener(self, clave):
+        """DataFrame de la clave (recargado desde disco si fue expulsado); None si no está"""
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                return self._memoria[clave]
+            if clave not in self._en_disco:
+                return None
+            df = pd.read_parquet(self._ruta(clave))
+            self._recargas += 1
+            self._agregar(clave, df)
+            return df
+    
+    def __contains__(self, clave):
+        with self._lock:
+            return clave in self._memoria or clave in self._en_disco
+    
+    def _agregar(self, clave, df):
+        """Deja df en memoria como la entrada más reciente y expulsa las antiguas hasta volver al presupuesto"""
+        self._memoria[clave] = df
+        self._tamanos[clave] = _tamano_bytes(df)
+        self._usados += self._tamanos[clave]
+        while self._usados > self.max_bytes and len(self._memoria) > 1:
+            antigua, df_antiguo = self._memoria.popitem(last=False)
+            if antigua not in self._en_disco:
+                # Se escribe a un temporal y se renombra: nunca queda un Parquet a medias con la clave
+                temporal = self._ruta(antigua) + '.tmp'
+                df_antiguo.to_parquet(temporal, index=True)
+                os.replace(temporal, self._ruta(antigua))
+                self._en_disco.add(antigua)
+            self._usados -= self._tamanos.pop(antigua)
+            self._expulsiones += 1
+    
+    def estado(self):
+        """Entradas en memoria y en disco, MB usados, presupuesto, recargas y expulsiones"""
+        with self._lock:
+            return {
+                'en_memoria': len(self._memoria),
+                'solo_en_disco': len(self._en_disco - set(self._memoria)),
+                'mb_en_memoria': round(self._usados / (1024 * 1024), 1),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'recargas': self._recargas,
+                'expulsiones': self._expulsiones
+            }
@@ -0,0 +1,395 @@
+"""
+Servicio HTTP local del Sugerido Automático, para llamarlo desde el ERP sin
+pasar por la app de Streamlit.
+
+    POST /sugerido   resultados de calcular_sugerido_con_prioridad (Parquet o CSV)
+    POST /reporte    reporte Excel de generar_reporte_descargable
+    GET  /salud      estado del servicio (procesos, solicitudes en curso y en cola)
+
+El cuerpo es un Excel (.xlsx) con las hojas de la plantilla, un zip con
+CSV/Parquet por hoja, o un multipart/form-data con un archivo por hoja
+(stock_tiendas.parquet, stock_bodega.csv, ...). Los parámetros van en la URL:
+carga_minima, carga_inicial, carga_maxima, modo, cobertura_dias,
+peso_ultima_semana, reparto y, en /sugerido, formato (parquet o csv).
+
+Cada solicitud se calcula en un pool acotado de procesos. Las que llegan con
+todos los procesos ocupados esperan en una cola de tamaño fijo; con la cola
+llena se responde 503 con Retry-After. Si un proceso del pool muere (por ejemplo,
+sin memoria), las solicitudes que estaban en él reciben 503 y el pool se crea de
+nuevo para las siguientes. El cuerpo se guarda en disco al recibirlo
+y el proceso escribe el resultado en disco, que se envía por bloques: ni la
+entrada ni la salida pasan completas por la memoria del servidor.
+
+Ejemplo:
+    python sugerido_api.py --puerto 8765 --procesos 2 --cola 8
+    curl --data-binary @cd_norte.xlsx -H 'Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' \\
+        'http://127.0.0.1:8765/sugerido?carga_maxima=20&formato=csv' -o resultados.csv
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from email import policy
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pyarrow.parquet as pq
+
+from motor_sugerido import (
+    COBERTURA_DIAS,
+    HOJA_ASIGNACION,
+    HOJA_BODEGA,
+    HOJA_CAPACIDAD,
+    HOJA_EXCEPCIONES,
+    HOJA_TIENDAS,
+    MODO_MINIMO,
+    MODOS_DEMANDA,
+    NIVEL_ERROR,
+    PESO_ULTIMA_SEMANA,
+    REPARTO_SECUENCIAL,
+    REPARTOS,
+    calcular_resumenes,
+    calcular_sugerido_con_prioridad,
+    generar_reporte_descargable,
+    leer_entradas,
+    resumir_errores,
+    tabla_arrow,
+    validar_entradas,
+)
+from sugerido_metricas import RegistroRendimiento
+
+OPERACION_SUGERIDO = 'sugerido'
+OPERACION_REPORTE = 'reporte'
+
+FORMATOS_RESULTADO = {
+    'parquet': 'application/vnd.apache.parquet',
+    'csv': 'text/csv; charset=utf-8'
+}
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+TIPOS_CUERPO = {
+    TIPO_XLSX: 'entrada.xlsx',
+    'application/zip': 'entrada.zip',
+    'application/x-zip-compressed': 'entrada.zip'
+}
+
+BLOQUE_BYTES = 1 << 20
+MAX_CUERPO_MB = 512
+# Cuerpo no usado que se lee y descarta antes de responder (uno mayor no se lee)
+MAX_DESCARTE_BYTES = 64 * 1024
+
+class ErrorSolicitud(Exception):
+    """Solicitud inválida: se responde con el código HTTP indicado y un JSON con el detalle"""
+    
+    def __init__(self, estado, mensaje, **detalle):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.detalle = {'error': mensaje, **detalle}
+
+def _entero(valores, nombre, defecto):
+    valor = valores.get(nombre, [None])[-1]
+    if valor in (None, ''):
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, f"El parámetro {nombre} debe ser entero: {valor}")
+
+def _opcion(valores, nombre, opciones, defecto):
+    valor = valores.get(nombre, [defecto])[-1] or defecto
+    if valor not in opciones:
+        raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, f"{nombre} debe ser uno de: {', '.join(opciones)}")
+    return valor
+
+def leer_parametros(consulta):
+    """Parámetros de cálculo desde la query string, con los mismos valores por defecto que la CLI"""
+    valores = parse_qs(consulta)
+    try:
+        peso = float(valores.get('peso_ultima_semana', [PESO_ULTIMA_SEMANA])[-1])
+    except ValueError:
+        raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, "peso_ultima_semana debe ser un número")
+    return {
+        'carga_minima': _entero(valores, 'carga_minima', 2),
+        'carga_inicial': _entero(valores, 'carga_inicial', 8),
+        'carga_maxima': _entero(valores, 'carga_maxima', 20),
+        'modo': _opcion(valores, 'modo', MODOS_DEMANDA, MODO_MINIMO),
+        'cobertura_dias': _entero(valores, 'cobertura_dias', COBERTURA_DIAS),
+        'peso_ultima_semana': peso,
+        'reparto': _opcion(valores, 'reparto', REPARTOS, REPARTO_SECUENCIAL),
+        'formato': _opcion(valores, 'formato', tuple(FORMATOS_RESULTADO), 'parquet')
+    }
+
+def calcular_solicitud(carpeta_entrada, carpeta_salida, operacion, parametros):
+    """
+    Corre en un proceso del pool: lee las entradas guardadas en carpeta_entrada, las
+    valida, calcula y escribe el resultado en carpeta_salida. Retorna un dict con la ruta del
+    resultado, filas, unidades y tiempos por etapa; con errores de validación
+    retorna solo el resumen de errores.
+    """
+    parametros = dict(parametros)
+    formato = parametros.pop('formato')
+    carga = [parametros.pop(nombre) for nombre in ('carga_minima', 'carga_inicial', 'carga_maxima')]
+    registro = RegistroRendimiento(operacion=operacion)
+    
+    with registro.etapa('lectura') as medicion:
+        with ExitStack() as pila:
+            archivos = [pila.enter_context(open(os.path.join(carpeta_entrada, nombre), 'rb'))
+                        for nombre in sorted(os.listdir(carpeta_entrada))]
+            hojas = leer_entradas(archivos)
+        medicion['filas'] = len(hojas[HOJA_TIENDAS])
+    if HOJA_ASIGNACION in hojas:
+        raise ValueError(f"El servicio no calcula con varias bodegas (hoja '{HOJA_ASIGNACION}'): usa sugerido_cli.py")
+    
+    with registro.etapa('validacion', filas=len(hojas[HOJA_TIENDAS])):
+        df_tiendas, df_bodega, df_errores = validar_entradas(hojas[HOJA_TIENDAS], hojas[HOJA_BODEGA])
+    if (df_errores['nivel'] == NIVEL_ERROR).any():
+        return {'errores': resumir_errores(df_errores).to_dict('records')}
+    
+    with registro.etapa('calculo', filas=len(df_tiendas)):
+        df_resultados, _, stock_bodega_final = calcular_sugerido_con_prioridad(
+            df_tiendas, df_bodega, *carga,
+            excepciones=hojas.get(HOJA_EXCEPCIONES), capacidades=hojas.get(HOJA_CAPACIDAD), **parametros
+        )
+    
+    if operacion == OPERACION_REPORTE:
+        with registro.etapa('resumenes', filas=len(df_resultados)):
+            resumenes = calcular_resumenes(df_resultados, df_bodega, stock_bodega_final)
+        destino = os.path.join(carpeta_salida, 'resultado.xlsx')
+        with registro.etapa('reporte', filas=len(df_resultados)):
+            generar_reporte_descargable(df_resultados, df_bodega, stock_bodega_final, resumenes=resumenes, destino=destino)
+    else:
+        destino = os.path.join(carpeta_salida, f"resultado.{formato}")
+        with registro.etapa('escritura', filas=len(df_resultados), formato=formato):
+            if formato == 'parquet':
+                pq.write_table(tabla_arrow(df_resultados), destino)
+            else:
+                df_resultados.to_csv(destino, index=False)
+    
+    return {
+        'ruta': destino,
+        'filas': len(df_resultados),
+        'unidades': int(df_resultados['cantidad_a_despachar'].sum()),
+        'avisos': int(len(df_errores)),
+        'tiempos': registro.tiempos()
+    }
+
+class ServidorSugerido(ThreadingHTTPServer):
+    """
+    Servidor HTTP con un hilo por conexión y un pool de procesos para el cálculo.
+    cupos limita las solicitudes aceptadas (en curso más en cola).
+    """
+    daemon_threads = True
+    
+    def __init__(self, direccion, procesos=None, cola=8, max_cuerpo_mb=MAX_CUERPO_MB):
+        super().__init__(direccion, ManejadorSugerido)
+        self.procesos = procesos or os.cpu_count() or 1
+        self.max_solicitudes = self.procesos + cola
+        self.max_cuerpo = max_cuerpo_mb * 1024 * 1024
+        self.pool = ProcessPoolExecutor(max_workers=self.procesos)
+        self.cupos = threading.BoundedSemaphore(self.max_solicitudes)
+        self._lock = threading.Lock()
+        self.aceptadas = 0
+    
+    def reiniciar_pool(self, pool_roto):
+        """Reemplaza el pool si sigue siendo pool_roto (las solicitudes que fallaron juntas lo reemplazan una vez)"""
+        with self._lock:
+            if self.pool is not pool_roto:
+                return
+            self.pool = ProcessPoolExecutor(max_workers=self.procesos)
+        pool_roto.shutdown(wait=False, cancel_futures=True)
+    
+    def tomar_cupo(self):
+        """True si la solicitud entra (a un proceso o a la cola); False si la cola está llena"""
+        if not self.cupos.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.aceptadas += 1
+        return True
+    
+    def liberar_cupo(self):
+        with self._lock:
+            self.aceptadas -= 1
+        self.cupos.release()
+    
+    def estado(self):
+        with self._lock:
+            aceptadas = self.aceptadas
+        return {
+            'estado': 'ok',
+            'procesos': self.procesos,
+            'en_curso': min(aceptadas, self.procesos),
+            'en_cola': max(aceptadas - self.procesos, 0),
+            'max_solicitudes': self.max_solicitudes
+        }
+    
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+
+class ManejadorSugerido(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # do_POST lo pone en False hasta leer el cuerpo completo
+    cuerpo_leido = True
+    
+    def log_message(self, formato, *args):
+        pass
+    
+    def _responder_json(self, estado, contenido, **cabeceras):
+        cuerpo = json.dumps(contenido, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(estado)
+        if not self.cuerpo_leido:
+            # Los bytes sin leer se tomarían como la siguiente solicitud de la conexión
+            self._descartar_cuerpo()
+            self.send_header('Connection', 'close')
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        for nombre, valor in cabeceras.items():
+            self.send_header(nombre.replace('_', '-'), valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+    
+    def _responder_archivo(self, ruta, tipo, resultado):
+        """Envía el archivo por bloques desde disco, con las filas, unidades y tiempos en cabeceras"""
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(os.path.getsize(ruta)))
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(ruta)}"')
+        self.send_header('X-Sugerido-Filas', str(resultado['filas']))
+        self.send_header('X-Sugerido-Unidades', str(resultado['unidades']))
+        self.send_header('X-Sugerido-Avisos', str(resultado['avisos']))
+        self.send_header('X-Sugerido-Tiempos', json.dumps(resultado['tiempos']))
+        self.end_headers()
+        with open(ruta, 'rb') as archivo:
+            shutil.copyfileobj(archivo, self.wfile, BLOQUE_BYTES)
+    
+    def _guardar_cuerpo(self, carpeta):
+        """Guarda el cuerpo en carpeta (por bloques, sin tenerlo entero en memoria salvo en multipart)"""
+        largo = int(self.headers.get('Content-Length') or 0)
+        if largo <= 0:
+            raise ErrorSolicitud(HTTPStatus.LENGTH_REQUIRED, "Falta el cuerpo con las entradas (y Content-Length)")
+        if largo > self.server.max_cuerpo:
+            raise ErrorSolicitud(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                 f"El cuerpo supera {self.server.max_cuerpo // (1024 * 1024)} MB")
+        
+        tipo = self.headers.get_content_type()
+        if tipo == 'multipart/form-data':
+            cuerpo = self.rfile.read(largo)
+            self.cuerpo_leido = len(cuerpo) == largo
+            mensaje = BytesParser(policy=policy.HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + cuerpo
+            )
+            nombres = []
+            for parte in mensaje.iter_parts():
+                nombre = parte.get_filename()
+                if nombre:
+                    nombre = os.path.basename(nombre)
+                    with open(os.path.join(carpeta, nombre), 'wb') as archivo:
+                        archivo.write(parte.get_payload(decode=True))
+                    nombres.append(nombre)
+            if not nombres:
+                raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, "El multipart no trae archivos")
+            return
+        if tipo not in TIPOS_CUERPO:
+            raise ErrorSolicitud(HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+                                 f"Content-Type no soportado: {tipo} (usa xlsx, zip o multipart/form-data)")
+        
+        with open(os.path.join(carpeta, TIPOS_CUERPO[tipo]), 'wb') as archivo:
+            while largo > 0:
+                bloque = self.rfile.read(min(largo, BLOQUE_BYTES))
+                if not bloque:
+                    raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, "El cuerpo llegó incompleto")
+                archivo.write(bloque)
+                largo -= len(bloque)
+        self.cuerpo_leido = True
+    
+    def _descartar_cuerpo(self):
+        """
+        Lee y descarta un cuerpo no usado de hasta MAX_DESCARTE_BYTES, para que el cliente
+        reciba la respuesta sin un reset de la conexión. Uno mayor, o que supera el máximo
+        del servidor, no se lee.
+        """
+        largo = int(self.headers.get('Content-Length') or 0)
+        if largo > min(MAX_DESCARTE_BYTES, self.server.max_cuerpo):
+            return
+        while largo > 0:
+            bloque = self.rfile.read(min(largo, BLOQUE_BYTES))
+            if not bloque:
+                break
+            largo -= len(bloque)
+    
+    def do_GET(self):
+        if urlsplit(self.path).path == '/salud':
+            self._responder_json(HTTPStatus.OK, self.server.estado())
+        else:
+            self._responder_json(HTTPStatus.NOT_FOUND, {'error': f"Ruta desconocida: {self.path}"})
+    
+    def do_POST(self):
+        self.cuerpo_leido = False
+        url = urlsplit(self.path)
+        operacion = url.path.strip('/')
+        if operacion not in (OPERACION_SUGERIDO, OPERACION_REPORTE):
+            self._responder_json(HTTPStatus.NOT_FOUND, {'error': f"Ruta desconocida: {url.path}"})
+            return
+        if not self.server.tomar_cupo():
+            self._responder_json(HTTPStatus.SERVICE_UNAVAILABLE, {'error': "Cola llena, reintenta más tarde"}, Retry_After='1')
+            return
+        
+        carpeta = tempfile.mkdtemp(prefix='sugerido_api_')
+        try:
+            parametros = leer_parametros(url.query)
+            carpeta_entrada = os.path.join(carpeta, 'entrada')
+            os.mkdir(carpeta_entrada)
+            self._guardar_cuerpo(carpeta_entrada)
+            pool = self.server.pool
+            try:
+                resultado = pool.submit(calcular_solicitud, carpeta_entrada, carpeta, operacion, parametros).result()
+            except BrokenProcessPool:
+                # Un proceso murió a mitad de cálculo: esta solicitud se reintenta con un pool nuevo
+                self.server.reiniciar_pool(pool)
+                self._responder_json(HTTPStatus.SERVICE_UNAVAILABLE,
+                                     {'error': "Se cayó un proceso de cálculo, reintenta"}, Retry_After='1')
+                return
+            if 'errores' in resultado:
+                raise ErrorSolicitud(HTTPStatus.UNPROCESSABLE_ENTITY, "Las entradas tienen errores", resumen=resultado['errores'])
+            tipo = TIPO_XLSX if operacion == OPERACION_REPORTE else FORMATOS_RESULTADO[parametros['formato']]
+            self._responder_archivo(resultado['ruta'], tipo, resultado)
+        except ErrorSolicitud as e:
+            self._responder_json(e.estado, e.detalle)
+        except ValueError as e:
+            self._responder_json(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+        except Exception as e:
+            self._responder_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(e).__name__}: {e}"})
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+            self.server.liberar_cupo()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP local del Sugerido Automático")
+    parser.add_argument('--host', default='127.0.0.1', help="Dirección donde escuchar (default: 127.0.0.1)")
+    parser.add_argument('--puerto', type=int, default=8765, help="Puerto (default: 8765)")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos de cálculo (default: uno por CPU)")
+    parser.add_argument('--cola', type=int, default=8,
+                        help="Solicitudes que esperan con todos los procesos ocupados; más allá se responde 503 (default: 8)")
+    parser.add_argument('--max-mb', type=int, default=MAX_CUERPO_MB,
+                        help=f"Tamaño máximo del cuerpo en MB (default: {MAX_CUERPO_MB})")
+    args = parser.parse_args(argv)
+    
+    servidor = ServidorSugerido((args.host, args.puerto), procesos=args.procesos, cola=args.cola, max_cuerpo_mb=args.max_mb)
+    print(f"🛒 Sugerido en http://{args.host}:{servidor.server_address[1]} "
+          f"({servidor.procesos} proceso(s), cola de {args.cola})", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
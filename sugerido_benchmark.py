@@ -0,0 +1,266 @@
+"""
+Benchmark del Sugerido Automático sobre datos sintéticos (sugerido_sintetico.py).
+
+Mide tiempo y memoria pico (tracemalloc, más la memoria residente máxima del
+proceso) de cada etapa: lectura de entradas, validar_entradas, calcular_sugerido_con_prioridad
+(en ambos modos de demanda, con reparto proporcional, con excepciones por
+tienda/SKU y con capacidad por tienda), resumenes del Paso 4,
+generar_reporte_descargable y generar_reporte_parquet.
+Cada medición se agrega como una línea JSON al archivo de resultados y se compara
+con la última corrida guardada del mismo tamaño para detectar regresiones.
+
+Ejemplo:
+    python sugerido_benchmark.py --tamanos 10k 1M --resultados benchmarks/resultados.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from motor_sugerido import (
+    HOJA_BODEGA,
+    HOJA_TIENDAS,
+    LIMITE_FILAS_EXCEL,
+    MODO_VELOCIDAD,
+    REPARTO_PROPORCIONAL,
+    calcular_resumenes,
+    calcular_sugerido_con_prioridad,
+    generar_reporte_descargable,
+    generar_reporte_parquet,
+    leer_entradas,
+    validar_entradas,
+)
+from sugerido_sintetico import (
+    dimensiones_para_filas,
+    generar_capacidades,
+    generar_entradas,
+    generar_excepciones,
+    guardar_entradas,
+)
+
+TAMANOS = {
+    '10k': 10_000,
+    '1M': 1_000_000,
+    '10M': 10_000_000
+}
+
+PARAMETROS = (2, 8, 20)
+
+def medir(funcion, *args, memoria=True, **kwargs):
+    """
+    Ejecuta funcion y retorna (resultado, segundos, pico de memoria en MB).
+    El tiempo se mide sin tracemalloc (que vuelve mucho más lentas las etapas con
+    muchos objetos Python, como el reporte); la memoria, en una segunda ejecución.
+    """
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    segundos = time.perf_counter() - inicio
+    if not memoria:
+        return resultado, segundos, None
+    
+    tracemalloc.start()
+    try:
+        funcion(*args, **kwargs)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, segundos, pico / 1e6
+
+def _rss_maximo_mb():
+    """Memoria residente máxima del proceso hasta ahora (incluye buffers de Arrow, que tracemalloc no ve)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+def _leer(rutas):
+    """Lee las entradas desde archivos en disco, igual que la CLI"""
+    archivos = [open(ruta, 'rb') for ruta in rutas]
+    try:
+        return leer_entradas(archivos)
+    finally:
+        for archivo in archivos:
+            archivo.close()
+
+def _guardar_excel(df_tiendas, df_bodega, ruta):
+    """Escribe las entradas como un Excel con las hojas de la plantilla"""
+    with pd.ExcelWriter(ruta, engine='xlsxwriter') as writer:
+        df_tiendas.to_excel(writer, sheet_name=HOJA_TIENDAS, index=False)
+        df_bodega.to_excel(writer, sheet_name=HOJA_BODEGA, index=False)
+    return [ruta]
+
+def _commit_actual():
+    """Commit de git del árbol medido (None fuera de un repositorio)"""
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return salida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def correr_tamano(tamano, filas, carpeta, formatos, cobertura_bodega, semilla, memoria=True):
+    """Genera los datos de un tamaño y mide cada etapa. Retorna una lista de mediciones."""
+    n_tiendas, n_skus = dimensiones_para_filas(filas)
+    df_tiendas, df_bodega = generar_entradas(n_tiendas, n_skus, cobertura_bodega=cobertura_bodega, semilla=semilla)
+    mediciones = []
+    
+    def registrar(etapa, segundos, pico_mb):
+        mediciones.append({'tamano': tamano, 'filas': len(df_tiendas), 'etapa': etapa, 'segundos': round(segundos, 4),
+                           'pico_mb': round(pico_mb, 1) if pico_mb is not None else None,
+                           'rss_maximo_mb': _rss_maximo_mb()})
+        texto_memoria = f"{pico_mb:10.1f} MB" if pico_mb is not None else ''
+        print(f"   {etapa:<22} {segundos:9.2f}s {texto_memoria}", flush=True)
+    
+    print(f"📦 {tamano}: {len(df_tiendas):,} filas ({n_tiendas:,} tiendas x {n_skus:,} SKU)", flush=True)
+    
+    # Lectura: las entradas se escriben antes de medir
+    for formato in formatos:
+        if formato == 'xlsx':
+            if len(df_tiendas) >= LIMITE_FILAS_EXCEL:
+                continue
+            rutas = _guardar_excel(df_tiendas, df_bodega, os.path.join(carpeta, f"entrada_{tamano}.xlsx"))
+        else:
+            rutas = guardar_entradas(df_tiendas, df_bodega, os.path.join(carpeta, f"entrada_{tamano}"), formato)
+        hojas, segundos, pico_mb = medir(_leer, rutas, memoria=memoria)
+        registrar(f"lectura_{formato}", segundos, pico_mb)
+        del hojas
+    
+    _, segundos, pico_mb = medir(validar_entradas, df_tiendas, df_bodega, memoria=memoria)
+    registrar('validacion', segundos, pico_mb)
+    
+    (df_resultados, _, stock_bodega_final), segundos, pico_mb = medir(
+        calcular_sugerido_con_prioridad, df_tiendas, df_bodega, *PARAMETROS, memoria=memoria
+    )
+    registrar('calculo', segundos, pico_mb)
+    
+    _, segundos, pico_mb = medir(
+        calcular_sugerido_con_prioridad, df_tiendas, df_bodega, *PARAMETROS, modo=MODO_VELOCIDAD, memoria=memoria
+    )
+    registrar('calculo_velocidad', segundos, pico_mb)
+    
+    _, segundos, pico_mb = medir(
+        calcular_sugerido_con_prioridad, df_tiendas, df_bodega, *PARAMETROS, reparto=REPARTO_PROPORCIONAL, memoria=memoria
+    )
+    registrar('calculo_proporcional', segundos, pico_mb)
+    
+    excepciones = generar_excepciones(df_tiendas, semilla=semilla)
+    _, segundos, pico_mb = medir(
+        calcular_sugerido_con_prioridad, df_tiendas, df_bodega, *PARAMETROS, excepciones=excepciones, memoria=memoria
+    )
+    registrar('calculo_excepciones', segundos, pico_mb)
+    del excepciones
+    
+    capacidades = generar_capacidades(df_tiendas, semilla=semilla)
+    _, segundos, pico_mb = medir(
+        calcular_sugerido_con_prioridad, df_tiendas, df_bodega, *PARAMETROS, capacidades=capacidades, memoria=memoria
+    )
+    registrar('calculo_capacidad', segundos, pico_mb)
+    
+    resumenes, segundos, pico_mb = medir(calcular_resumenes, df_resultados, df_bodega, stock_bodega_final, memoria=memoria)
+    registrar('resumenes', segundos, pico_mb)
+    
+    destino = os.path.join(carpeta, f"reporte_{tamano}.xlsx")
+    _, segundos, pico_mb = medir(
+        generar_reporte_descargable, df_resultados, df_bodega, stock_bodega_final,
+        resumenes=resumenes, destino=destino, memoria=memoria
+    )
+    registrar('reporte', segundos, pico_mb)
+    
+    destino = os.path.join(carpeta, f"reporte_{tamano}_parquet.zip")
+    _, segundos, pico_mb = medir(
+        generar_reporte_parquet, df_resultados, df_bodega, stock_bodega_final,
+        resumenes=resumenes, destino=destino, memoria=memoria
+    )
+    registrar('reporte_parquet', segundos, pico_mb)
+    
+    return mediciones
+
+def cargar_resultados(ruta):
+    """Mediciones guardadas anteriormente (lista vacía si el archivo no existe)"""
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, encoding='utf-8') as archivo:
+        return [json.loads(linea) for linea in archivo if linea.strip()]
+
+def comparar(mediciones, anteriores, tolerancia):
+    """
+    Compara cada medición con la última corrida guardada del mismo tamaño y etapa.
+    Retorna las regresiones (más lentas que la anterior por sobre la tolerancia).
+    """
+    ultimas = {}
+    for medicion in anteriores:
+        ultimas[(medicion['tamano'], medicion['etapa'])] = medicion
+    
+    regresiones = []
+    for medicion in mediciones:
+        anterior = ultimas.get((medicion['tamano'], medicion['etapa']))
+        if anterior is None or anterior['segundos'] <= 0:
+            continue
+        razon = medicion['segundos'] / anterior['segundos']
+        if razon > 1 + tolerancia:
+            regresiones.append((medicion, anterior, razon))
+    return regresiones
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del Sugerido Automático con datos sintéticos")
+    parser.add_argument('--tamanos', nargs='+', choices=list(TAMANOS), default=list(TAMANOS),
+                        help="Tamaños a medir (default: 10k 1M 10M)")
+    parser.add_argument('--resultados', default=os.path.join('benchmarks', 'resultados.jsonl'),
+                        help="Archivo JSONL donde se agregan las mediciones (default: benchmarks/resultados.jsonl)")
+    parser.add_argument('--formatos', nargs='+', choices=['parquet', 'csv', 'xlsx'], default=['parquet', 'xlsx'],
+                        help="Formatos de entrada para medir la lectura (xlsx solo si cabe en una hoja)")
+    parser.add_argument('--cobertura-bodega', type=float, default=0.5,
+                        help="Semanas de venta en bodega; el default genera bodega escasa (default: 0.5)")
+    parser.add_argument('--semilla', type=int, default=0, help="Semilla de los datos sintéticos (default: 0)")
+    parser.add_argument('--tolerancia', type=float, default=0.25,
+                        help="Aumento de tiempo aceptado frente a la corrida anterior (default: 0.25 = 25%%)")
+    parser.add_argument('--sin-memoria', action='store_true',
+                        help="No medir la memoria pico (cada etapa se ejecuta una sola vez)")
+    parser.add_argument('--carpeta-temporal', default=None, help="Carpeta para las entradas y reportes generados")
+    args = parser.parse_args(argv)
+    
+    corrida = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_actual(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'maquina': platform.node(),
+        'cpus': os.cpu_count()
+    }
+    # Solo se compara contra corridas de la misma máquina
+    anteriores = [medicion for medicion in cargar_resultados(args.resultados) if medicion.get('maquina') == corrida['maquina']]
+    
+    mediciones = []
+    with tempfile.TemporaryDirectory(dir=args.carpeta_temporal) as carpeta:
+        for tamano in args.tamanos:
+            mediciones.extend(correr_tamano(tamano, TAMANOS[tamano], carpeta, args.formatos,
+                                            args.cobertura_bodega, args.semilla, memoria=not args.sin_memoria))
+    
+    os.makedirs(os.path.dirname(os.path.abspath(args.resultados)), exist_ok=True)
+    with open(args.resultados, 'a', encoding='utf-8') as archivo:
+        for medicion in mediciones:
+            archivo.write(json.dumps({**corrida, **medicion}, ensure_ascii=False) + '\n')
+    print(f"💾 {len(mediciones)} mediciones agregadas a {args.resultados}")
+    
+    regresiones = comparar(mediciones, anteriores, args.tolerancia)
+    for medicion, anterior, razon in regresiones:
+        print(f"⚠️ Regresión en {medicion['tamano']}/{medicion['etapa']}: {medicion['segundos']:.2f}s "
+              f"vs {anterior['segundos']:.2f}s ({razon:.2f}x, commit {anterior.get('commit')})", file=sys.stderr)
+    return 1 if regresiones else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
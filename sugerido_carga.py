@@ -0,0 +1,144 @@
+"""
+Prueba de carga del servicio HTTP (sugerido_api.py) sobre datos sintéticos.
+
+Envía N solicitudes con C clientes concurrentes y mide solicitudes por segundo
+y la latencia (p50, p95 y máxima) de las respuestas. Sin --url levanta el
+servicio en un proceso aparte en un puerto libre y lo detiene al terminar.
+
+Ejemplo:
+    python sugerido_carga.py --filas 10000 --solicitudes 100 --concurrencia 4
+    python sugerido_carga.py --url http://127.0.0.1:8765 --ruta reporte --filas 100000
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sugerido_sintetico import dimensiones_para_filas, generar_entradas, guardar_entradas
+
+ESPERA_INICIO = 30
+
+def armar_cuerpo(filas, formato='parquet', semilla=0):
+    """Zip con stock_tiendas y stock_bodega sintéticos en el formato indicado"""
+    df_tiendas, df_bodega = generar_entradas(*dimensiones_para_filas(filas), semilla=semilla)
+    cuerpo = io.BytesIO()
+    with tempfile.TemporaryDirectory() as carpeta, zipfile.ZipFile(cuerpo, 'w') as comprimido:
+        for ruta in guardar_entradas(df_tiendas, df_bodega, carpeta, formato):
+            comprimido.write(ruta, os.path.basename(ruta))
+    return cuerpo.getvalue(), len(df_tiendas)
+
+def _puerto_libre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def levantar_servicio(procesos, cola):
+    """Inicia sugerido_api.py en un puerto libre y espera a que responda /salud. Retorna (proceso, url)."""
+    puerto = _puerto_libre()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sugerido_api.py')
+    comando = [sys.executable, script, '--puerto', str(puerto), '--cola', str(cola)]
+    if procesos:
+        comando += ['--procesos', str(procesos)]
+    servicio = subprocess.Popen(comando, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + ESPERA_INICIO
+    while time.monotonic() < limite:
+        try:
+            with urllib.request.urlopen(f"{url}/salud", timeout=1):
+                return servicio, url
+        except OSError:
+            time.sleep(0.1)
+    servicio.terminate()
+    raise RuntimeError(f"El servicio no respondió en {ESPERA_INICIO}s")
+
+def enviar(url, cuerpo):
+    """Una solicitud: retorna (código HTTP, segundos hasta leer la respuesta completa, bytes recibidos)"""
+    solicitud = urllib.request.Request(url, data=cuerpo, headers={'Content-Type': 'application/zip'}, method='POST')
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(solicitud) as respuesta:
+            recibidos = len(respuesta.read())
+            estado = respuesta.status
+    except urllib.error.HTTPError as e:
+        recibidos = len(e.read())
+        estado = e.code
+    return estado, time.perf_counter() - inicio, recibidos
+
+def medir_carga(url, cuerpo, solicitudes, concurrencia):
+    """Envía las solicitudes con concurrencia clientes. Retorna un dict con el resumen."""
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as clientes:
+        respuestas = list(clientes.map(lambda _: enviar(url, cuerpo), range(solicitudes)))
+    total = time.perf_counter() - inicio
+    
+    estados = Counter(estado for estado, _, _ in respuestas)
+    latencias = np.array([segundos for estado, segundos, _ in respuestas if estado == 200])
+    resumen = {
+        'solicitudes': solicitudes,
+        'concurrencia': concurrencia,
+        'segundos': round(total, 3),
+        'solicitudes_por_segundo': round(estados[200] / total, 2),
+        'estados': dict(estados),
+        'mb_recibidos': round(sum(recibidos for _, _, recibidos in respuestas) / 1e6, 2)
+    }
+    if len(latencias):
+        resumen.update({
+            'p50_s': round(float(np.percentile(latencias, 50)), 4),
+            'p95_s': round(float(np.percentile(latencias, 95)), 4),
+            'max_s': round(float(latencias.max()), 4)
+        })
+    return resumen
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio HTTP del Sugerido Automático")
+    parser.add_argument('--url', default=None, help="Servicio ya levantado (default: levanta uno local)")
+    parser.add_argument('--ruta', choices=('sugerido', 'reporte'), default='sugerido', help="Operación a medir (default: sugerido)")
+    parser.add_argument('--formato', choices=('parquet', 'csv'), default='parquet',
+                        help="Formato de los resultados de /sugerido (default: parquet)")
+    parser.add_argument('--filas', type=int, default=10_000, help="Filas de 'Stock Tiendas' por solicitud (default: 10000)")
+    parser.add_argument('--solicitudes', type=int, default=50, help="Solicitudes a enviar (default: 50)")
+    parser.add_argument('--concurrencia', type=int, default=4, help="Clientes en paralelo (default: 4)")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos del servicio local (default: uno por CPU)")
+    parser.add_argument('--cola', type=int, default=8, help="Cola del servicio local (default: 8)")
+    parser.add_argument('--json', action='store_true', help="Imprimir el resumen como JSON")
+    args = parser.parse_args(argv)
+    
+    cuerpo, filas = armar_cuerpo(args.filas)
+    servicio = None
+    url = args.url
+    if url is None:
+        servicio, url = levantar_servicio(args.procesos, args.cola)
+    try:
+        destino = f"{url.rstrip('/')}/{args.ruta}?formato={args.formato}"
+        # Una solicitud de calentamiento: arranca los procesos del pool
+        enviar(destino, cuerpo)
+        resumen = medir_carga(destino, cuerpo, args.solicitudes, args.concurrencia)
+    finally:
+        if servicio is not None:
+            servicio.terminate()
+            servicio.wait()
+    
+    resumen.update({'ruta': args.ruta, 'filas': filas, 'kb_cuerpo': round(len(cuerpo) / 1024, 1)})
+    if args.json:
+        print(json.dumps(resumen))
+    else:
+        print(f"📦 /{args.ruta}: {filas:,} filas por solicitud ({resumen['kb_cuerpo']:,.1f} KB), "
+              f"{args.solicitudes} solicitudes con {args.concurrencia} cliente(s)")
+        print(f"   {resumen['solicitudes_por_segundo']:.2f} solicitudes/s | p50 {resumen.get('p50_s', 0):.3f}s | "
+              f"p95 {resumen.get('p95_s', 0):.3f}s | máx {resumen.get('max_s', 0):.3f}s | estados {resumen['estados']}")
+    return 0 if set(resumen['estados']) == {200} else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
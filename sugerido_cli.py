@@ -0,0 +1,316 @@
+"""
+Ejecución del Sugerido Automático por línea de comandos (sin Streamlit).
+
+Cada entrada corresponde a un centro de distribución: un Excel con las hojas
+'Stock Tiendas', 'Stock Bodega' y 'Parámetros', un zip con CSV/Parquet, o una
+carpeta con esos archivos. Las entradas se procesan en paralelo.
+
+Con --particiones N la entrada (carpeta con CSV/Parquet) se procesa fuera de
+memoria por particiones de SKU: el detalle se escribe en <entrada>_resultados.parquet
+y el reporte Excel lleva solo las hojas de resumen.
+
+Con --picking csv|xlsx se escribe además <entrada>_picking.zip, con una lista
+de picking por tienda (sugerido_picking.py).
+
+Con --parquet se escribe además <entrada>_reporte_parquet.zip, con las hojas del
+reporte como tablas Parquet (el detalle completo, sin el límite de filas de Excel).
+
+Con --historial RUTA cada corrida se guarda además en el historial SQLite
+(sugerido_historial.py), para compararla con corridas anteriores.
+
+Antes de calcular se validan las entradas (validar_entradas, por partición con
+--particiones): los problemas encontrados se escriben en <entrada>_validacion.csv
+y, si alguno es un error, la entrada no se calcula.
+
+Si la entrada trae la hoja 'Asignación' (tienda → bodega principal y de respaldo)
+se calcula con varias bodegas (sugerido_multibodega.py) y el reporte agrega la
+hoja 'Stock por Bodega'.
+
+Ejemplo:
+    python sugerido_cli.py cd_norte.xlsx cd_sur.zip --salida reportes/ --carga-maxima 20
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+
+import pandas as pd
+
+from motor_sugerido import (
+    COBERTURA_DIAS,
+    HOJA_ASIGNACION,
+    HOJA_BODEGA,
+    HOJA_CAPACIDAD,
+    HOJA_EXCEPCIONES,
+    HOJA_TIENDAS,
+    MODO_MINIMO,
+    MODOS_DEMANDA,
+    NIVEL_ERROR,
+    PESO_ULTIMA_SEMANA,
+    REPARTO_SECUENCIAL,
+    REPARTOS,
+    calcular_resumenes,
+    calcular_sugerido_con_prioridad,
+    generar_reporte_descargable,
+    generar_reporte_parquet,
+    hoja_desde_nombre,
+    leer_entradas,
+    resumir_errores,
+    validar_entradas,
+)
+from sugerido_historial import HistorialCorridas
+from sugerido_multibodega import calcular_resumenes_multibodega, calcular_sugerido_multibodega, stock_por_sku
+from sugerido_metricas import RegistroRendimiento, configurar_log_json
+from sugerido_particionado import ErrorValidacion, calcular_sugerido_particionado, leer_por_lotes
+from sugerido_picking import FORMATOS_PICKING, generar_listas_picking
+
+EXTENSIONES_ENTRADA = ('.xlsx', '.xls', '.csv', '.parquet', '.zip')
+
+def _archivos_entrada(ruta):
+    """Lista los archivos de una entrada (un archivo o una carpeta con CSV/Parquet)"""
+    if os.path.isdir(ruta):
+        return sorted(
+            os.path.join(ruta, nombre) for nombre in os.listdir(ruta)
+            if nombre.lower().endswith(EXTENSIONES_ENTRADA)
+        )
+    return [ruta]
+
+def _nombre_entrada(ruta):
+    """Nombre base de la entrada, usado para el archivo de salida"""
+    return os.path.splitext(os.path.basename(os.path.normpath(ruta)))[0]
+
+def _registro_entrada(ruta, log_json):
+    """Registro de rendimiento de una entrada; con log_json las etapas se emiten como líneas JSON en stderr"""
+    if log_json:
+        configurar_log_json()
+    return RegistroRendimiento(centro=_nombre_entrada(ruta))
+
+def procesar_entrada(ruta, carga_minima, carga_inicial, carga_maxima, carpeta_salida, streaming=None, log_json=False,
+                     opciones=None, historial=None, picking=None, procesos_internos=1, parquet=False):
+    """
+    Lee, calcula y escribe el reporte de una entrada. opciones (modo de demanda y reparto)
+    y las hojas 'Excepciones' y 'Capacidad' de la entrada, si las tiene, se pasan a
+    calcular_sugerido_con_prioridad; con la hoja 'Asignación' se calcula por bodega.
+    Con historial (ruta SQLite) la corrida se guarda ahí y con picking (formato) se
+    escriben las listas de picking por tienda. Con parquet se escribe además el reporte
+    como un zip de tablas Parquet. procesos_internos son los procesos para
+    las bodegas y el picking de esta entrada. Retorna los tiempos por etapa.
+    """
+    registro = _registro_entrada(ruta, log_json)
+    
+    with registro.etapa('lectura') as medicion:
+        with ExitStack() as pila:
+            archivos = [pila.enter_context(open(archivo, 'rb')) for archivo in _archivos_entrada(ruta)]
+            hojas = leer_entradas(archivos)
+        medicion['filas'] = len(hojas[HOJA_TIENDAS])
+    
+    with registro.etapa('validacion', filas=len(hojas[HOJA_TIENDAS])):
+        df_tiendas, df_bodega, df_errores = validar_entradas(hojas[HOJA_TIENDAS], hojas[HOJA_BODEGA])
+    _revisar_validacion(df_errores, ruta, carpeta_salida)
+    
+    hojas_opcionales = {'excepciones': hojas.get(HOJA_EXCEPCIONES), 'capacidades': hojas.get(HOJA_CAPACIDAD)}
+    if HOJA_ASIGNACION in hojas:
+        with registro.etapa('calculo', filas=len(df_tiendas), procesos=procesos_internos):
+            df_resultados, _, stock_bodega_final, stock_bodegas = calcular_sugerido_multibodega(
+                df_tiendas, df_bodega, hojas[HOJA_ASIGNACION], carga_minima, carga_inicial, carga_maxima,
+                procesos=procesos_internos, **hojas_opcionales, **(opciones or {})
+            )
+        with registro.etapa('resumenes', filas=len(df_resultados)):
+            resumenes = calcular_resumenes_multibodega(df_resultados, df_bodega, stock_bodega_final, stock_bodegas)
+        # El reporte y el historial trabajan con el stock de la red completa
+        df_bodega = stock_por_sku(df_bodega)
+    else:
+        with registro.etapa('calculo', filas=len(df_tiendas)):
+            df_resultados, _, stock_bodega_final = calcular_sugerido_con_prioridad(
+                df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, **hojas_opcionales, **(opciones or {})
+            )
+        with registro.etapa('resumenes', filas=len(df_resultados)):
+            resumenes = calcular_resumenes(df_resultados, df_bodega, stock_bodega_final)
+    
+    destino = os.path.join(carpeta_salida, f"{_nombre_entrada(ruta)}_reporte.xlsx")
+    with registro.etapa('reporte', filas=len(df_resultados)):
+        generar_reporte_descargable(
+            df_resultados, df_bodega, stock_bodega_final,
+            streaming=streaming, resumenes=resumenes, destino=destino
+        )
+    
+    salidas = [destino]
+    if parquet:
+        destino_parquet = os.path.join(carpeta_salida, f"{_nombre_entrada(ruta)}_reporte_parquet.zip")
+        with registro.etapa('reporte_parquet', filas=len(df_resultados)):
+            generar_reporte_parquet(df_resultados, df_bodega, stock_bodega_final, resumenes=resumenes, destino=destino_parquet)
+        salidas.append(destino_parquet)
+    if picking is not None:
+        destino_picking = os.path.join(carpeta_salida, f"{_nombre_entrada(ruta)}_picking.zip")
+        with registro.etapa('picking', filas=len(df_resultados), procesos=procesos_internos):
+            generar_listas_picking(df_resultados, picking, destino=destino_picking, procesos=procesos_internos)
+        salidas.append(destino_picking)
+    
+    if historial is not None:
+        with registro.etapa('historial_guardar', filas=len(df_resultados)):
+            HistorialCorridas(historial).guardar(df_resultados, df_bodega, stock_bodega_final, centro=_nombre_entrada(ruta))
+    
+    return {
+        'entrada': ruta,
+        'salida': ', '.join(salidas),
+        'filas': len(df_resultados),
+        'unidades': int(resumenes['total_unidades']),
+        'tiempos': registro.tiempos(),
+        'mediciones': registro.mediciones
+    }
+
+def _revisar_validacion(df_errores, ruta, carpeta_salida):
+    """Escribe los problemas en <entrada>_validacion.csv y lanza ValueError si alguno es un error"""
+    if df_errores.empty:
+        return
+    df_errores.to_csv(os.path.join(carpeta_salida, f"{_nombre_entrada(ruta)}_validacion.csv"),
+                      index=False, encoding='utf-8-sig')
+    if (df_errores['nivel'] == NIVEL_ERROR).any():
+        resumen = resumir_errores(df_errores)
+        resumen = resumen[resumen['nivel'] == NIVEL_ERROR]
+        detalle = '; '.join(f"{r.hoja}/{r.columna}: {r.error} ({r.filas:,} filas, primera {r.primera_fila})"
+                            for r in resumen.itertuples())
+        raise ValueError(f"Datos con errores (ver {_nombre_entrada(ruta)}_validacion.csv): {detalle}")
+
+def procesar_entrada_particionada(ruta, carga_minima, carga_inicial, carga_maxima, carpeta_salida, n_particiones,
+                                  log_json=False, opciones=None):
+    """
+    Procesa una entrada CSV/Parquet por particiones de SKU. Cada partición se valida
+    antes de calcular, con las mismas reglas que procesar_entrada. Retorna los tiempos por etapa.
+    """
+    registro = _registro_entrada(ruta, log_json)
+    rutas = {hoja_desde_nombre(archivo): archivo for archivo in _archivos_entrada(ruta)
+             if archivo.lower().endswith(('.csv', '.parquet'))}
+    faltantes = [hoja for hoja in (HOJA_TIENDAS, HOJA_BODEGA) if hoja not in rutas]
+    if faltantes:
+        raise ValueError(f"Faltan archivos CSV/Parquet para: {', '.join(faltantes)}")
+    if HOJA_ASIGNACION in rutas:
+        raise ValueError(f"--particiones no admite varias bodegas (hoja '{HOJA_ASIGNACION}')")
+    
+    with registro.etapa('lectura') as medicion:
+        df_bodega = pd.concat(leer_por_lotes(rutas[HOJA_BODEGA]), ignore_index=True)
+        excepciones, capacidades = (pd.concat(leer_por_lotes(rutas[hoja]), ignore_index=True) if hoja in rutas else None
+                                    for hoja in (HOJA_EXCEPCIONES, HOJA_CAPACIDAD))
+        medicion['filas'] = len(df_bodega)
+    
+    nombre = _nombre_entrada(ruta)
+    ruta_resultados = os.path.join(carpeta_salida, f"{nombre}_resultados.parquet")
+    with registro.etapa('calculo', particiones=n_particiones) as medicion:
+        try:
+            stock_bodega_final, resumenes, df_bodega, df_errores = calcular_sugerido_particionado(
+                rutas[HOJA_TIENDAS], df_bodega, carga_minima, carga_inicial, carga_maxima,
+                ruta_resultados, n_particiones=n_particiones, excepciones=excepciones, capacidades=capacidades,
+                **(opciones or {})
+            )
+        except ErrorValidacion as error:
+            _revisar_validacion(error.df_errores, ruta, carpeta_salida)
+            raise
+        filas = int(resumenes['por_tienda']['n_filas'].sum())
+        medicion['filas'] = filas
+    _revisar_validacion(df_errores, ruta, carpeta_salida)
+    
+    destino = os.path.join(carpeta_salida, f"{nombre}_reporte.xlsx")
+    with registro.etapa('reporte', filas=filas):
+        generar_reporte_descargable(
+            None, df_bodega, stock_bodega_final,
+            resumenes=resumenes, destino=destino, carga_maxima=carga_maxima
+        )
+    
+    return {
+        'entrada': ruta,
+        'salida': f"{ruta_resultados}, {destino}",
+        'filas': filas,
+        'unidades': int(resumenes['total_unidades']),
+        'tiempos': registro.tiempos(),
+        'mediciones': registro.mediciones
+    }
+
+def _formatear_resultado(resultado):
+    """Línea de resumen con los tiempos por etapa de una entrada"""
+    tiempos = resultado['tiempos']
+    etapas = ' | '.join(f"{etapa} {segundos:.2f}s" for etapa, segundos in tiempos.items())
+    return (f"✅ {resultado['entrada']}: {resultado['filas']:,} filas, {resultado['unidades']:,} unidades "
+            f"-> {resultado['salida']}\n   {etapas} | total {sum(tiempos.values()):.2f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sugerido Automático por línea de comandos")
+    parser.add_argument('entradas', nargs='+', help="Excel, zip o carpeta con CSV/Parquet (uno por centro de distribución)")
+    parser.add_argument('--salida', default='.', help="Carpeta donde se escriben los reportes (default: carpeta actual)")
+    parser.add_argument('--carga-minima', type=int, default=2, help="Carga mínima de reposición (default: 2)")
+    parser.add_argument('--carga-inicial', type=int, default=8, help="Carga inicial para productos nuevos (default: 8)")
+    parser.add_argument('--carga-maxima', type=int, default=20, help="Máximo por SKU/tienda (default: 20)")
+    parser.add_argument('--modo', choices=MODOS_DEMANDA, default=MODO_MINIMO,
+                        help="Demanda: reposición a carga mínima o por velocidad de venta (default: minimo)")
+    parser.add_argument('--cobertura-dias', type=int, default=COBERTURA_DIAS,
+                        help=f"Días de venta a cubrir en modo velocidad (default: {COBERTURA_DIAS})")
+    parser.add_argument('--peso-ultima-semana', type=float, default=PESO_ULTIMA_SEMANA,
+                        help=f"Peso de la última semana frente al promedio de 4 semanas (default: {PESO_ULTIMA_SEMANA})")
+    parser.add_argument('--reparto', choices=REPARTOS, default=REPARTO_SECUENCIAL,
+                        help="Reparto de bodega escasa dentro de una prioridad: por orden de tienda o proporcional "
+                             "a la demanda (default: secuencial)")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos en paralelo (default: uno por CPU)")
+    parser.add_argument('--streaming', action=argparse.BooleanOptionalAction, default=None,
+                        help="Forzar (o desactivar) el reporte en modo streaming")
+    parser.add_argument('--particiones', type=int, default=None,
+                        help="Procesar fuera de memoria en N particiones de SKU (entradas CSV/Parquet)")
+    parser.add_argument('--log-json', action='store_true',
+                        help="Emitir en stderr una línea JSON por etapa (tiempo, memoria y filas) de cada entrada")
+    parser.add_argument('--picking', choices=FORMATOS_PICKING, default=None,
+                        help="Escribir además un zip con una lista de picking por tienda (no con --particiones)")
+    parser.add_argument('--parquet', action='store_true',
+                        help="Escribir además el reporte como un zip con una tabla Parquet por hoja (no con --particiones)")
+    parser.add_argument('--historial', default=None,
+                        help="Guardar cada corrida en este archivo SQLite de historial (no con --particiones)")
+    args = parser.parse_args(argv)
+    if args.historial and args.particiones:
+        parser.error("--historial no se puede usar con --particiones (el detalle queda en Parquet)")
+    if args.parquet and args.particiones:
+        parser.error("--parquet no se puede usar con --particiones (el detalle ya queda en Parquet)")
+    if args.picking and args.particiones:
+        parser.error("--picking no se puede usar con --particiones (el detalle queda en Parquet)")
+    
+    os.makedirs(args.salida, exist_ok=True)
+    opciones = {
+        'modo': args.modo,
+        'cobertura_dias': args.cobertura_dias,
+        'peso_ultima_semana': args.peso_ultima_semana,
+        'reparto': args.reparto
+    }
+    procesos = min(args.procesos or os.cpu_count() or 1, len(args.entradas))
+    # Las CPU que no usan las entradas quedan para las bodegas y las listas de picking de cada una
+    procesos_internos = max(1, (args.procesos or os.cpu_count() or 1) // procesos)
+    
+    inicio = time.perf_counter()
+    errores = 0
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        if args.particiones:
+            futuros = {
+                pool.submit(
+                    procesar_entrada_particionada, ruta, args.carga_minima, args.carga_inicial,
+                    args.carga_maxima, args.salida, args.particiones, args.log_json, opciones
+                ): ruta
+                for ruta in args.entradas
+            }
+        else:
+            futuros = {
+                pool.submit(
+                    procesar_entrada, ruta, args.carga_minima, args.carga_inicial,
+                    args.carga_maxima, args.salida, args.streaming, args.log_json, opciones, args.historial,
+                    args.picking, procesos_internos, args.parquet
+                ): ruta
+                for ruta in args.entradas
+            }
+        for futuro in as_completed(futuros):
+            try:
+                print(_formatear_resultado(futuro.result()), flush=True)
+            except Exception as e:
+                errores += 1
+                print(f"❌ {futuros[futuro]}: {e}", file=sys.stderr, flush=True)
+    
+    print(f"⏱️ {len(args.entradas)} entrada(s) en {time.perf_counter() - inicio:.2f}s con {procesos} proceso(s)")
+    return 1 if errores else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
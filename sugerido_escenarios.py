@@ -0,0 +1,161 @@
+"""
+Análisis "what-if": evalúa una grilla de (carga_minima, carga_inicial, carga_maxima)
+sobre los mismos datos cargados una sola vez.
+
+El orden de carga, los códigos de SKU/tienda y el stock de bodega por fila no
+dependen de los parámetros, así que se preparan una vez. Cada escenario es solo
+aritmética de arreglos NumPy (demanda, suma acumulada por SKU y conteos por
+tienda) y los escenarios se evalúan en paralelo con hilos, que comparten los
+datos sin copiarlos (NumPy libera el GIL en estas operaciones).
+"""
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from motor_sugerido import (
+    COBERTURA_DIAS,
+    MODO_MINIMO,
+    MODO_VELOCIDAD,
+    PESO_ULTIMA_SEMANA,
+    REPARTO_PROPORCIONAL,
+    REPARTO_SECUENCIAL,
+    _asignar_con_capacidad,
+    _asignar_proporcional,
+    _asignar_stock,
+    _demanda,
+    _marcas_estado,
+    _objetivo_por_velocidad,
+    _parametros_filas,
+    _volumen_filas,
+    resolver_excepciones,
+    validar_capacidades,
+)
+
+def preparar_escenarios(df_tiendas, df_bodega, excepciones=None, capacidades=None):
+    """
+    Precalcula los arreglos que no dependen de los parámetros, ordenados por SKU y orden de carga.
+    Las excepciones por tienda/SKU se resuelven una vez; en cada escenario se completan con sus valores generales.
+    Con capacidades se guardan además los arreglos en orden de carga que usa la asignación con capacidad.
+    """
+    stock_bodega_inicial = df_bodega.set_index('sku')['stock_bodega'].to_dict()
+    df = df_tiendas.sort_values(['prioridad_tienda', 'tienda_id', 'sku']).reset_index(drop=True)
+    
+    sku_codigo, _ = pd.factorize(df['sku'])
+    tienda_codigo, tiendas = pd.factorize(df['tienda_id'])
+    
+    # Filas agrupadas por SKU, conservando el orden de carga dentro de cada SKU
+    orden = np.argsort(sku_codigo, kind='stable')
+    sku_ordenado = sku_codigo[orden]
+    inicio_grupo = np.r_[True, sku_ordenado[1:] != sku_ordenado[:-1]] if len(orden) else np.array([], dtype=bool)
+    
+    stock_sku = df['sku'].map(stock_bodega_inicial).fillna(0).to_numpy()
+    ventas = {col: (df[col].to_numpy() if col in df.columns else np.zeros(len(df)))[orden]
+              for col in ('venta_ultima_semana', 'venta_4_semanas')}
+    excepciones_filas = resolver_excepciones(df, excepciones)
+    
+    capacidad = validar_capacidades(capacidades)
+    carga = None
+    if capacidad is not None:
+        carga = {
+            'orden': orden,
+            'stock_sku': stock_sku,
+            'codigo_sku': sku_codigo,
+            'codigo_tienda': tienda_codigo,
+            'capacidad_tienda': capacidad.reindex(tiendas.astype(object)).fillna(np.inf).to_numpy(),
+            'volumen': _volumen_filas(df['sku'], df_bodega)
+        }
+    
+    return {
+        **ventas,
+        'stock_actual': df['stock_actual'].to_numpy()[orden],
+        'excepciones': {col: valores[orden] for col, valores in excepciones_filas.items()} if excepciones_filas else None,
+        'carga': carga,
+        'codigo_sku': sku_ordenado,
+        'prioridad': df['prioridad_tienda'].to_numpy()[orden],
+        'es_inicial': (df['tipo_carga'].str.lower() == 'inicial').to_numpy()[orden],
+        'stock_sku': stock_sku[orden],
+        'inicio_grupo': inicio_grupo,
+        'grupo': np.cumsum(inicio_grupo) - 1,
+        'tienda': tienda_codigo[orden],
+        'n_tiendas': len(tiendas),
+        'stock_bodega_inicial': df_bodega['stock_bodega'].sum(),
+        'stock_bodega_por_sku': sum(stock_bodega_inicial.values())
+    }
+
+def evaluar_escenario(datos, carga_minima, carga_inicial, carga_maxima, modo=MODO_MINIMO,
+                      cobertura_dias=COBERTURA_DIAS, peso_ultima_semana=PESO_ULTIMA_SEMANA,
+                      reparto=REPARTO_SECUENCIAL):
+    """Métricas de un escenario (mismas reglas que calcular_sugerido_con_prioridad)"""
+    minima_fila, inicial_fila, maxima_fila = _parametros_filas(datos['excepciones'], carga_minima, carga_inicial, carga_maxima)
+    objetivo = None
+    if modo == MODO_VELOCIDAD:
+        objetivo = _objetivo_por_velocidad(
+            datos['venta_ultima_semana'], datos['venta_4_semanas'], minima_fila, cobertura_dias, peso_ultima_semana
+        )
+    _, cantidad_sugerida = _demanda(
+        datos['es_inicial'], datos['stock_actual'], minima_fila, inicial_fila, maxima_fila, objetivo
+    )
+    
+    carga = datos['carga']
+    if carga is not None:
+        if reparto != REPARTO_SECUENCIAL:
+            raise ValueError("La capacidad por tienda solo se aplica con reparto secuencial")
+        # La capacidad se llena en orden de carga: se pasa la demanda a ese orden y se vuelve
+        sugerida_carga = np.empty_like(cantidad_sugerida)
+        sugerida_carga[carga['orden']] = cantidad_sugerida
+        real_carga, _, _ = _asignar_con_capacidad(
+            sugerida_carga, carga['stock_sku'], carga['codigo_sku'], carga['codigo_tienda'],
+            carga['capacidad_tienda'], carga['volumen']
+        )
+        cantidad_real = real_carga[carga['orden']]
+    elif reparto == REPARTO_PROPORCIONAL:
+        cantidad_real = _asignar_proporcional(cantidad_sugerida, datos['stock_sku'], datos['codigo_sku'], datos['prioridad'])
+    else:
+        # Demanda acumulada del SKU antes de cada fila
+        previo_total = np.cumsum(cantidad_sugerida) - cantidad_sugerida
+        previo = previo_total - previo_total[datos['inicio_grupo']][datos['grupo']]
+        _, cantidad_real = _asignar_stock(cantidad_sugerida, datos['stock_sku'], previo, datos['inicio_grupo'])
+    
+    parcial, no_cargada = _marcas_estado(cantidad_sugerida, cantidad_real)
+    completa = ~parcial & ~no_cargada & (cantidad_sugerida > 0)
+    
+    tienda, n_tiendas = datos['tienda'], datos['n_tiendas']
+    n_filas = np.bincount(tienda, minlength=n_tiendas)
+    n_completa = np.bincount(tienda, weights=completa, minlength=n_tiendas)
+    n_parcial = np.bincount(tienda, weights=parcial, minlength=n_tiendas)
+    n_no_cargada = np.bincount(tienda, weights=no_cargada, minlength=n_tiendas)
+    tienda_completa = n_completa == n_filas
+    
+    total_unidades = int(cantidad_real.sum())
+    stock_bodega_usado = datos['stock_bodega_inicial'] - (datos['stock_bodega_por_sku'] - total_unidades)
+    
+    return {
+        'carga_minima': carga_minima,
+        'carga_inicial': carga_inicial,
+        'carga_maxima': carga_maxima,
+        'total_sugerido': int(cantidad_sugerida.sum()),
+        'total_unidades': total_unidades,
+        'stock_bodega_usado': stock_bodega_usado,
+        'uso_bodega_pct': 100 * stock_bodega_usado / datos['stock_bodega_inicial'] if datos['stock_bodega_inicial'] else 0.0,
+        'tiendas_completas': int(tienda_completa.sum()),
+        'tiendas_parciales': int(((n_parcial > 0) & ~tienda_completa).sum()),
+        'tiendas_no_cargadas': int((n_no_cargada == n_filas).sum())
+    }
+
+def barrer_escenarios(df_tiendas, df_bodega, cargas_minimas, cargas_iniciales, cargas_maximas, max_workers=None,
+                      excepciones=None, capacidades=None, **opciones):
+    """
+    Evalúa todas las combinaciones de parámetros en paralelo (opciones: modo de
+    demanda y reparto, igual que calcular_sugerido_con_prioridad). Las excepciones
+    por tienda/SKU y las capacidades se mantienen fijas; la grilla varía los valores generales.
+    Retorna una tabla comparativa con una fila por escenario.
+    """
+    datos = preparar_escenarios(df_tiendas, df_bodega, excepciones, capacidades)
+    grilla = list(itertools.product(cargas_minimas, cargas_iniciales, cargas_maximas))
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        filas = list(pool.map(lambda parametros: evaluar_escenario(datos, *parametros, **opciones), grilla))
+    
+    return pd.DataFrame(filas)
@@ -0,0 +1,256 @@
+"""
+Historial local de corridas del sugerido en SQLite.
+
+Cada corrida guarda sus parámetros, el stock de bodega de entrada y las filas de
+resultados por tienda/SKU (que incluyen las entradas de 'Stock Tiendas': stock,
+ventas, tipo de carga y prioridad), más un resumen por SKU y por tienda. Las
+tablas están indexadas por corrida, tienda y SKU, así que comparar dos corridas
+o seguir un SKU en el tiempo son consultas indexadas sobre el archivo, sin
+volver a abrir los reportes Excel.
+"""
+import json
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+CACHE_GUARDAR_KB = 256_000
+
+RUTA_HISTORIAL = os.environ.get('SUGERIDO_HISTORIAL', os.path.join('historial', 'sugerido.sqlite'))
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS corridas (
+    corrida_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT NOT NULL,
+    centro TEXT,
+    parametros TEXT NOT NULL,
+    filas INTEGER NOT NULL,
+    total_sugerido INTEGER NOT NULL,
+    total_unidades INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resultados (
+    corrida_id INTEGER NOT NULL,
+    orden_carga INTEGER NOT NULL,
+    tienda_id TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    prioridad INTEGER,
+    tipo_carga TEXT,
+    stock_antes INTEGER,
+    venta_ultima_semana INTEGER,
+    venta_4_semanas INTEGER,
+    cantidad_sugerida INTEGER,
+    cantidad_a_despachar INTEGER,
+    estado TEXT,
+    PRIMARY KEY (corrida_id, orden_carga)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_resultados_tienda_sku ON resultados (corrida_id, tienda_id, sku, cantidad_a_despachar);
+CREATE INDEX IF NOT EXISTS idx_resultados_sku ON resultados (sku, corrida_id);
+CREATE TABLE IF NOT EXISTS bodega (
+    corrida_id INTEGER NOT NULL,
+    sku TEXT NOT NULL,
+    stock_bodega INTEGER,
+    stock_bodega_final INTEGER,
+    PRIMARY KEY (corrida_id, sku)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS resumen_sku (
+    corrida_id INTEGER NOT NULL,
+    sku TEXT NOT NULL,
+    n_tiendas INTEGER,
+    cantidad_sugerida INTEGER,
+    cantidad_a_despachar INTEGER,
+    PRIMARY KEY (corrida_id, sku)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_resumen_sku_sku ON resumen_sku (sku, corrida_id);
+CREATE TABLE IF NOT EXISTS resumen_tienda (
+    corrida_id INTEGER NOT NULL,
+    tienda_id TEXT NOT NULL,
+    prioridad INTEGER,
+    n_filas INTEGER,
+    cantidad_sugerida INTEGER,
+    cantidad_a_despachar INTEGER,
+    PRIMARY KEY (corrida_id, tienda_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_resumen_tienda_tienda ON resumen_tienda (tienda_id, corrida_id);
+"""
+
+COLUMNAS_RESULTADOS = [
+    'orden_carga', 'tienda_id', 'sku', 'prioridad', 'tipo_carga', 'stock_antes', 'venta_ultima_semana',
+    'venta_4_semanas', 'cantidad_sugerida', 'cantidad_a_despachar', 'estado'
+]
+
+# Niveles de comparación entre corridas: tabla y columnas clave (todas con índice por corrida)
+NIVELES = {
+    'sku': ('resumen_sku', ['sku']),
+    'tienda': ('resumen_tienda', ['tienda_id']),
+    'tienda_sku': ('resultados', ['tienda_id', 'sku'])
+}
+
+def _valores(columna):
+    """Valores de una columna como objetos Python para sqlite3 (las categóricas, sin convertir cada fila)"""
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        return columna.astype(columna.cat.categories.dtype).astype(object).tolist()
+    return columna.astype(object).tolist()
+
+def _entero_o_nulo(valor):
+    """Entero Python (sqlite3 no acepta enteros de NumPy) o None"""
+    return int(valor) if valor is not None else None
+
+def _filas(df, columnas, corrida_id):
+    """Tuplas (corrida_id, columnas...) para executemany"""
+    valores = [_valores(df[col]) for col in columnas]
+    return zip([corrida_id] * len(df), *valores)
+
+class HistorialCorridas:
+    """
+    Guarda y consulta corridas en un archivo SQLite. Cada operación abre su propia
+    conexión, así que una instancia se puede compartir entre sesiones y procesos.
+    """
+    
+    def __init__(self, ruta=RUTA_HISTORIAL):
+        self.ruta = ruta
+        carpeta = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(carpeta, exist_ok=True)
+        with self._conectar() as conexion:
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.executescript(ESQUEMA)
+    
+    @contextmanager
+    def _conectar(self):
+        """Conexión con transacción: confirma al salir sin errores y siempre se cierra"""
+        with closing(sqlite3.connect(self.ruta, timeout=60)) as conexion:
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            with conexion:
+                yield conexion
+    
+    def _consulta(self, sql, parametros=()):
+        """Resultado de una consulta como DataFrame"""
+        with self._conectar() as conexion:
+            return pd.read_sql_query(sql, conexion, params=parametros)
+    
+    def guardar(self, df_resultados, df_bodega, stock_bodega_final, centro=None, parametros=None):
+        """
+        Guarda una corrida (parámetros de df_resultados.attrs más los dados, entradas y
+        resultados). Retorna el corrida_id.
+        """
+        parametros = {
+            **{clave: valor for clave, valor in df_resultados.attrs.items() if clave != 'capacidad_restante'},
+            **(parametros or {})
+        }
+        bodega = df_bodega.groupby('sku', observed=True, sort=False)['stock_bodega'].last()
+        por_sku = df_resultados.groupby('sku', observed=True, sort=False).agg(
+            n_tiendas=('tienda_id', 'nunique'),
+            cantidad_sugerida=('cantidad_sugerida', 'sum'),
+            cantidad_a_despachar=('cantidad_a_despachar', 'sum')
+        ).reset_index()
+        por_tienda = df_resultados.groupby('tienda_id', observed=True, sort=False).agg(
+            prioridad=('prioridad', 'first'),
+            n_filas=('sku', 'size'),
+            cantidad_sugerida=('cantidad_sugerida', 'sum'),
+            cantidad_a_despachar=('cantidad_a_despachar', 'sum')
+        ).reset_index()
+        
+        with self._conectar() as conexion:
+            # Caché de páginas amplia: el índice por SKU se inserta en desorden
+            conexion.execute(f"PRAGMA cache_size=-{CACHE_GUARDAR_KB}")
+            cursor = conexion.execute(
+                'INSERT INTO corridas (fecha, centro, parametros, filas, total_sugerido, total_unidades) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (datetime.now().isoformat(timespec='seconds'), centro, json.dumps(parametros, ensure_ascii=False, default=str),
+                 len(df_resultados), int(df_resultados['cantidad_sugerida'].sum()),
+                 int(df_resultados['cantidad_a_despachar'].sum()))
+            )
+            corrida_id = cursor.lastrowid
+            conexion.executemany(
+                f"INSERT INTO resultados (corrida_id, {', '.join(COLUMNAS_RESULTADOS)}) "
+                f"VALUES ({', '.join('?' * (len(COLUMNAS_RESULTADOS) + 1))})",
+                _filas(df_resultados, COLUMNAS_RESULTADOS, corrida_id)
+            )
+            conexion.executemany(
+                'INSERT INTO bodega (corrida_id, sku, stock_bodega, stock_bodega_final) VALUES (?, ?, ?, ?)',
+                ((corrida_id, sku, int(stock), _entero_o_nulo(stock_bodega_final.get(sku))) for sku, stock in bodega.items())
+            )
+            conexion.executemany(
+                'INSERT INTO resumen_sku VALUES (?, ?, ?, ?, ?)',
+                _filas(por_sku, ['sku', 'n_tiendas', 'cantidad_sugerida', 'cantidad_a_despachar'], corrida_id)
+            )
+            conexion.executemany(
+                'INSERT INTO resumen_tienda VALUES (?, ?, ?, ?, ?, ?)',
+                _filas(por_tienda, ['tienda_id', 'prioridad', 'n_filas', 'cantidad_sugerida', 'cantidad_a_despachar'],
+                       corrida_id)
+            )
+        return corrida_id
+    
+    def corridas(self, limite=100):
+        """Últimas corridas guardadas, la más reciente primero"""
+        return self._consulta(
+            'SELECT corrida_id, fecha, centro, filas, total_sugerido, total_unidades, parametros '
+            'FROM corridas ORDER BY corrida_id DESC LIMIT ?', (limite,)
+        )
+    
+    def resultados(self, corrida_id, tienda_id=None, sku=None):
+        """Filas de resultados de una corrida, opcionalmente de una tienda y/o un SKU (consulta por índice)"""
+        condiciones, parametros = ['corrida_id = ?'], [corrida_id]
+        if tienda_id is not None:
+            condiciones.append('tienda_id = ?')
+            parametros.append(tienda_id)
+        if sku is not None:
+            condiciones.append('sku = ?')
+            parametros.append(sku)
+        return self._consulta(
+            f"SELECT {', '.join(COLUMNAS_RESULTADOS)} FROM resultados WHERE {' AND '.join(condiciones)} ORDER BY orden_carga",
+            parametros
+        )
+    
+    def cambios(self, corrida_a, corrida_b, nivel='sku', umbral_pct=0.0, limite=None):
+        """
+        Claves (SKU, tienda o tienda+SKU) cuyo despacho cambió más de umbral_pct % entre
+        corrida_a y corrida_b, incluidas las que aparecen en una sola. Ordenadas por
+        el mayor cambio absoluto. Cada lado se agrega leyendo solo su corrida (clave
+        primaria o índice cubriente) y los dos lados se cruzan por la clave.
+        """
+        tabla, claves = NIVELES[nivel]
+        columnas = ', '.join(claves)
+        existe = ' AND '.join(f"a.{clave} = b.{clave}" for clave in claves)
+        sql = f"""
+            WITH a AS (
+                SELECT {columnas}, SUM(cantidad_a_despachar) AS despacho FROM {tabla}
+                WHERE corrida_id = :a GROUP BY {columnas}
+            ), b AS (
+                SELECT {columnas}, SUM(cantidad_a_despachar) AS despacho FROM {tabla}
+                WHERE corrida_id = :b GROUP BY {columnas}
+            ), pares AS (
+                SELECT {columnas}, a.despacho AS despacho_a, COALESCE(b.despacho, 0) AS despacho_b
+                FROM a LEFT JOIN b USING ({columnas})
+                UNION ALL
+                SELECT {columnas}, 0, b.despacho FROM b WHERE NOT EXISTS (SELECT 1 FROM a WHERE {existe})
+            )
+            SELECT {columnas}, despacho_a, despacho_b, despacho_b - despacho_a AS diferencia,
+                   CASE WHEN despacho_a = 0 THEN NULL
+                        ELSE ROUND(100.0 * (despacho_b - despacho_a) / despacho_a, 1) END AS variacion_pct
+            FROM pares
+            WHERE despacho_b != despacho_a
+              AND (despacho_a = 0 OR ABS(despacho_b - despacho_a) * 100.0 > :umbral * despacho_a)
+            ORDER BY ABS(despacho_b - despacho_a) DESC, {columnas}
+        """
+        parametros = {'a': corrida_a, 'b': corrida_b, 'umbral': umbral_pct}
+        if limite is not None:
+            sql += ' LIMIT :limite'
+            parametros['limite'] = limite
+        return self._consulta(sql, parametros)
+    
+    def historia_sku(self, sku, limite=50):
+        """Despacho total de un SKU en las últimas corridas donde aparece (índice por SKU)"""
+        return self._consulta(
+            'SELECT c.corrida_id, c.fecha, c.centro, r.n_tiendas, r.cantidad_sugerida, r.cantidad_a_despachar, '
+            'b.stock_bodega FROM resumen_sku r JOIN corridas c USING (corrida_id) '
+            'LEFT JOIN bodega b ON b.corrida_id = r.corrida_id AND b.sku = r.sku '
+            'WHERE r.sku = ? ORDER BY r.corrida_id DESC LIMIT ?', (sku, limite)
+        )
+    
+    def eliminar(self, corrida_id):
+        """Borra una corrida y todas sus filas"""
+        with self._conectar() as conexion:
+            for tabla in ('resultados', 'bodega', 'resumen_sku', 'resumen_tienda', 'corridas'):
+                conexion.execute(f"DELETE FROM {tabla} WHERE corrida_id = ?", (corrida_id,))
@@ -0,0 +1,182 @@
+"""
+Recálculo incremental del sugerido.
+
+La asignación de cada SKU depende solo de sus propias filas y de su stock de
+bodega, así que al volver a cargar datos con pocos cambios basta con recalcular
+los SKU cuyas filas de 'Stock Tiendas' o cuyo stock_bodega cambiaron y parchar
+el resto de los resultados de la corrida anterior.
+
+Con un almacén (sugerido_almacen.AlmacenDatos) las tablas de la corrida anterior
+viven en el almacén compartido, dentro de su presupuesto de memoria, y el objeto
+solo guarda sus claves: las sesiones con las mismas entradas comparten una copia.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from motor_sugerido import (
+    _resumen_completitud_tiendas,
+    calcular_sugerido_con_prioridad,
+    compactar_resultados,
+    hash_dataframe,
+)
+from sugerido_almacen import stock_a_tabla, tabla_a_stock
+from sugerido_tareas import calcular_sugerido_por_bloques
+
+CLAVE_ORDEN = ['prioridad', 'tienda_id', 'sku']
+
+def _firmas_por_sku(df_tiendas):
+    """Firma del contenido de las filas de cada SKU (suma de hashes por fila y número de filas)"""
+    hashes = pd.Series(pd.util.hash_pandas_object(df_tiendas, index=False).to_numpy(), index=df_tiendas.index)
+    return hashes.groupby(df_tiendas['sku']).agg(['sum', 'size'])
+
+def _calcular_sugerido(df_tiendas, df_bodega, cargas, progreso, opciones):
+    """Corrida completa; por bloques de SKU cuando hay que informar avance"""
+    if progreso is not None:
+        return calcular_sugerido_por_bloques(df_tiendas, df_bodega, *cargas, progreso=progreso, **opciones)
+    return calcular_sugerido_con_prioridad(df_tiendas, df_bodega, *cargas, **opciones)
+
+class RecalculoIncremental:
+    """
+    Guarda las entradas y resultados de la última corrida y, en la siguiente,
+    recalcula solo los SKU que cambiaron. Con almacen las tablas se guardan ahí
+    y el objeto retiene solo sus claves.
+    """
+    
+    def __init__(self, almacen=None):
+        self.almacen = almacen
+        self._parametros = None
+        self._columnas = None
+        # firmas, stock_bodega, resultados y stock_final de la última corrida (o sus claves en el almacén)
+        self._estado = {}
+        # Una corrida a la vez (el cálculo puede correr en una tarea de fondo)
+        self._lock = threading.Lock()
+    
+    def _guardar_estado(self, claves, **tablas):
+        """Deja las tablas de la corrida como estado; con almacén, bajo claves (por defecto su hash)"""
+        if self.almacen is None:
+            self._estado = tablas
+        else:
+            self._estado = {nombre: self.almacen.guardar(df, clave=claves.get(nombre)) for nombre, df in tablas.items()}
+    
+    def _leer_estado(self, nombre):
+        """Tabla de la última corrida; None si no hay corrida (o el almacén ya no la tiene)"""
+        valor = self._estado.get(nombre)
+        if self.almacen is None or valor is None:
+            return valor
+        return self.almacen.obtener(valor)
+    
+    def _skus_cambiados(self, firmas, stock_bodega, firmas_previas, stock_bodega_previo):
+        """SKU con filas nuevas, eliminadas o modificadas, o con stock de bodega distinto"""
+        todos = firmas.index.union(firmas_previas.index)
+        firmas_previas = firmas_previas.reindex(todos, fill_value=0)
+        firmas_nuevas = firmas.reindex(todos, fill_value=0)
+        distintas = (firmas_previas != firmas_nuevas).any(axis=1)
+        cambiados = set(distintas.index[distintas])
+        
+        for sku in stock_bodega.keys() | stock_bodega_previo.keys():
+            if stock_bodega.get(sku) != stock_bodega_previo.get(sku):
+                cambiados.add(sku)
+        return cambiados
+    
+    def calcular(self, df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, progreso=None, claves=None,
+                 **opciones):
+        """
+        Igual que calcular_sugerido_con_prioridad (con las mismas opciones de demanda,
+        reparto, excepciones y capacidades), pero reutiliza la corrida anterior.
+        Con progreso (sugerido_tareas.Progreso) el cálculo se hace por bloques de SKU
+        informando el avance y se puede cancelar.
+        claves ({'resultados': ..., 'stock_final': ...}) fija las claves en el almacén de los
+        resultados, para que quien los guarde después con esas claves no los duplique.
+        Retorna (df_resultados, resumen_tiendas, stock_bodega_final, skus_recalculados).
+        """
+        with self._lock:
+            return self._calcular(df_tiendas, df_bodega, (carga_minima, carga_inicial, carga_maxima), progreso, opciones,
+                                  claves or {})
+    
+    def _calcular(self, df_tiendas, df_bodega, cargas, progreso, opciones, claves):
+        """Cuerpo de calcular (con el lock tomado)"""
+        carga_minima, carga_inicial, carga_maxima = cargas
+        # Las tablas (excepciones, capacidades) entran a la comparación por su hash
+        parametros = (carga_minima, carga_inicial, carga_maxima, tuple(sorted(
+            (clave, hash_dataframe(valor) if isinstance(valor, pd.DataFrame) else valor) for clave, valor in opciones.items()
+        )))
+        columnas = list(zip(df_tiendas.columns, df_tiendas.dtypes.astype(str)))
+        firmas = _firmas_por_sku(df_tiendas)
+        stock_bodega = df_bodega.set_index('sku')['stock_bodega'].to_dict()
+        
+        # Con capacidad por tienda los SKU de una tienda dependen entre sí: siempre se recalcula completo
+        con_capacidad = opciones.get('capacidades') is not None
+        previos = {nombre: self._leer_estado(nombre) for nombre in ('firmas', 'stock_bodega', 'resultados', 'stock_final')}
+        if (any(previo is None for previo in previos.values()) or parametros != self._parametros
+                or columnas != self._columnas or con_capacidad):
+            df_resultados, resumen_tiendas, stock_bodega_final = _calcular_sugerido(
+                df_tiendas, df_bodega, cargas, progreso, opciones
+            )
+            skus_recalculados = len(firmas)
+        else:
+            cambiados = self._skus_cambiados(firmas, stock_bodega, previos['firmas'], tabla_a_stock(previos['stock_bodega']))
+            df_resultados, stock_bodega_final = self._parchar(
+                df_tiendas, df_bodega, cargas, progreso, opciones, cambiados,
+                previos['resultados'], tabla_a_stock(previos['stock_final'])
+            )
+            resumen_tiendas = _resumen_completitud_tiendas(df_resultados)
+            skus_recalculados = len(cambiados & set(firmas.index))
+        
+        self._parametros = parametros
+        self._columnas = columnas
+        self._guardar_estado(
+            claves, firmas=firmas, stock_bodega=stock_a_tabla(stock_bodega),
+            resultados=df_resultados, stock_final=stock_a_tabla(stock_bodega_final)
+        )
+        return df_resultados, resumen_tiendas, stock_bodega_final, skus_recalculados
+    
+    def _parchar(self, df_tiendas, df_bodega, cargas, progreso, opciones, cambiados, df_previo, stock_final_previo):
+        """Recalcula los SKU cambiados y los reemplaza en los resultados anteriores"""
+        # Se parcha una copia: la corrida anterior puede seguir referenciada (por ejemplo en caché o en el almacén)
+        df_resultados = df_previo.copy()
+        stock_bodega_final = dict(stock_final_previo)
+        if not cambiados:
+            return df_resultados, stock_bodega_final
+        
+        df_cambiados = df_tiendas[df_tiendas['sku'].isin(cambiados)]
+        if len(df_cambiados) > 0:
+            nuevos, _, stock_nuevo = _calcular_sugerido(df_cambiados, df_bodega, cargas, progreso, opciones)
+        else:
+            nuevos = df_resultados.iloc[0:0]
+            stock_nuevo = df_bodega.set_index('sku')['stock_bodega'].to_dict()
+        
+        for sku in cambiados:
+            if sku in stock_nuevo:
+                stock_bodega_final[sku] = stock_nuevo[sku]
+            else:
+                stock_bodega_final.pop(sku, None)
+        
+        mascara = df_resultados['sku'].isin(cambiados).to_numpy()
+        previas = df_resultados.loc[mascara, CLAVE_ORDEN]
+        
+        # Mismas filas (solo cambiaron valores): se reemplazan en su posición y orden_carga no cambia
+        if len(previas) == len(nuevos) and np.array_equal(previas.to_numpy(dtype=object), nuevos[CLAVE_ORDEN].to_numpy(dtype=object)):
+            for columna in df_resultados.columns:
+                if columna == 'orden_carga':
+                    continue
+                valores = nuevos[columna]
+                if isinstance(df_resultados[columna].dtype, pd.CategoricalDtype):
+                    # Los valores nuevos (por ejemplo un producto renombrado) se agregan como categorías
+                    faltantes = pd.Index(valores.astype(object).unique()).difference(df_resultados[columna].cat.categories)
+                    if len(faltantes):
+                        df_resultados[columna] = df_resultados[columna].cat.add_categories(faltantes)
+                elif df_resultados[columna].dtype != valores.dtype:
+                    df_resultados[columna] = df_resultados[columna].astype(np.result_type(df_resultados[columna].dtype, valores.dtype))
+                df_resultados.loc[mascara, columna] = valores.to_numpy()
+            return df_resultados, stock_bodega_final
+        
+        # Cambiaron filas: se combinan y se vuelve a numerar el orden de carga
+        attrs = df_resultados.attrs
+        df_resultados = pd.concat([df_resultados[~mascara], nuevos], ignore_index=True)
+        df_resultados = df_resultados.sort_values(CLAVE_ORDEN, kind='stable').reset_index(drop=True)
+        df_resultados = compactar_resultados(df_resultados)
+        df_resultados['orden_carga'] = np.arange(1, len(df_resultados) + 1, dtype=df_resultados['orden_carga'].dtype)
+        df_resultados.attrs = dict(attrs)
+        return df_resultados, stock_bodega_final
@@ -0,0 +1,135 @@
+"""
+Instrumentación por etapa del Sugerido Automático: tiempo, memoria y filas.
+
+Cada etapa (lectura, cálculo, resumenes, reporte, ...) se mide con
+RegistroRendimiento.etapa(). La memoria es la memoria residente (RSS) del
+proceso, muestreada en un hilo mientras corre la etapa: incluye los buffers de
+NumPy y Arrow y no vuelve más lento el código medido (a diferencia de tracemalloc).
+
+Cada medición se emite como una línea JSON en el logger 'sugerido.metricas',
+para armar tableros de costo por centro de distribución.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger('sugerido.metricas')
+
+INTERVALO_MUESTREO = 0.02
+MAX_MEDICIONES = 200
+
+def rss_actual_mb():
+    """Memoria residente actual del proceso en MB (None si no se puede obtener)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # Sin /proc (macOS) se usa el máximo del proceso; ru_maxrss está en bytes en macOS y en KB en Linux
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo / 1e6 if sys.platform == 'darwin' else maximo / 1e3
+
+def _redondear(valor, decimales=1):
+    """Redondea un valor en MB, dejando None tal cual"""
+    return round(valor, decimales) if valor is not None else None
+
+class _MuestreadorMemoria(threading.Thread):
+    """Hilo que registra la memoria residente máxima mientras corre una etapa"""
+    
+    def __init__(self, intervalo=INTERVALO_MUESTREO):
+        super().__init__(daemon=True)
+        self._intervalo = intervalo
+        self._detener = threading.Event()
+        self.inicial = rss_actual_mb()
+        self.pico = self.inicial
+    
+    def _muestrear(self):
+        rss = rss_actual_mb()
+        if rss is not None and (self.pico is None or rss > self.pico):
+            self.pico = rss
+    
+    def run(self):
+        while not self._detener.wait(self._intervalo):
+            self._muestrear()
+    
+    def detener(self):
+        self._detener.set()
+        self.join()
+        self._muestrear()
+
+class RegistroRendimiento:
+    """
+    Guarda las mediciones por etapa de una sesión o corrida.
+    El contexto (por ejemplo el centro de distribución) se agrega a cada medición.
+    """
+    
+    def __init__(self, max_mediciones=MAX_MEDICIONES, **contexto):
+        self.contexto = contexto
+        self.mediciones = []
+        self._max_mediciones = max_mediciones
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def etapa(self, nombre, filas=None, **extra):
+        """
+        Mide una etapa. Entrega el dict de la medición para completar datos
+        conocidos al final (por ejemplo medicion['filas'] = len(df)).
+        """
+        medicion = {'etapa': nombre, 'filas': filas, **extra}
+        muestreador = _MuestreadorMemoria()
+        muestreador.start()
+        inicio = time.perf_counter()
+        try:
+            yield medicion
+        finally:
+            segundos = time.perf_counter() - inicio
+            muestreador.detener()
+            medicion.update({
+                'segundos': round(segundos, 4),
+                'rss_pico_mb': _redondear(muestreador.pico),
+                'rss_delta_mb': _redondear(muestreador.pico - muestreador.inicial)
+                if muestreador.pico is not None and muestreador.inicial is not None else None
+            })
+            self.registrar(medicion)
+    
+    def registrar(self, medicion):
+        """Agrega una medición (con fecha y contexto) y la emite como línea JSON"""
+        medicion = {'fecha': datetime.now().isoformat(timespec='seconds'), **self.contexto, **medicion}
+        with self._lock:
+            self.mediciones.append(medicion)
+            del self.mediciones[:-self._max_mediciones]
+        logger.info(json.dumps(medicion, ensure_ascii=False, default=str))
+        return medicion
+    
+    def tiempos(self):
+        """Segundos por etapa de las mediciones registradas (la última de cada etapa)"""
+        return {medicion['etapa']: medicion['segundos'] for medicion in self.mediciones}
+    
+    def tabla(self):
+        """Mediciones como DataFrame, la más reciente primero"""
+        return pd.DataFrame(self.mediciones[::-1])
+
+def configurar_log_json(destino=None):
+    """Envía las líneas JSON del logger 'sugerido.metricas' a destino (stderr por defecto), una vez"""
+    if not any(getattr(handler, '_sugerido_json', False) for handler in logger.handlers):
+        handler = logging.StreamHandler(destino)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handler._sugerido_json = True
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,235 @@
+"""
+Sugerido con varias bodegas (centros de distribución).
+
+'Stock Bodega' lleva una columna bodega_id y la hoja 'Asignación' indica, por
+tienda, su bodega principal y opcionalmente una bodega de respaldo.
+
+El cálculo se hace en dos pasadas:
+1. Cada bodega atiende a sus tiendas principales con calcular_sugerido_con_prioridad.
+   Las bodegas son independientes entre sí, así que se calculan en paralelo en procesos.
+2. Lo que quedó sin cubrir en cada fila se pide a la bodega de respaldo de la
+   tienda, contra el stock que le quedó después de la primera pasada. Es una sola
+   pasada vectorizada en orden de carga global (suma acumulada por bodega de
+   respaldo y SKU), siempre secuencial aunque el reparto sea proporcional.
+
+stock_bodega_final se sigue entregando por SKU (suma de las bodegas) para los
+resumenes y el historial; el detalle por bodega va en una tabla aparte.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from motor_sugerido import (
+    HOJA_ASIGNACION,
+    HOJA_BODEGA,
+    _asignar_stock,
+    _codigo_estado,
+    _entero_compacto,
+    _resumen_completitud_tiendas,
+    calcular_resumenes,
+    calcular_sugerido_con_prioridad,
+    ordenar_para_particiones,
+    unir_particiones,
+)
+from sugerido_tareas import Progreso
+
+ETAPA_BODEGAS = 'bodegas'
+ETAPA_RESPALDO = 'respaldo'
+
+def validar_asignacion(df_asignacion):
+    """
+    Normaliza la hoja 'Asignación' (tienda_id, bodega_principal y opcional bodega_respaldo).
+    Un respaldo vacío o igual a la principal es 'sin respaldo'.
+    Retorna None si no hay asignación; lanza ValueError si la tabla es inválida.
+    """
+    if df_asignacion is None or len(df_asignacion) == 0:
+        return None
+    faltantes = [col for col in ('tienda_id', 'bodega_principal') if col not in df_asignacion.columns]
+    if faltantes:
+        raise ValueError(f"La hoja '{HOJA_ASIGNACION}' necesita las columnas: {', '.join(faltantes)}")
+    
+    asignacion = pd.DataFrame({
+        col: df_asignacion[col].astype(object).where(df_asignacion[col].notna(), None).to_numpy()
+        if col in df_asignacion.columns else np.full(len(df_asignacion), None, dtype=object)
+        for col in ('tienda_id', 'bodega_principal', 'bodega_respaldo')
+    })
+    for col in ('tienda_id', 'bodega_principal'):
+        if asignacion[col].isna().any():
+            raise ValueError(f"La hoja '{HOJA_ASIGNACION}' tiene {int(asignacion[col].isna().sum())} fila(s) sin {col}")
+    tiendas = asignacion['tienda_id']
+    if tiendas.duplicated().any():
+        raise ValueError(f"La hoja '{HOJA_ASIGNACION}' repite tiendas: {', '.join(map(str, tiendas[tiendas.duplicated()].unique()[:3]))}")
+    asignacion.loc[asignacion['bodega_respaldo'] == asignacion['bodega_principal'], 'bodega_respaldo'] = None
+    return asignacion
+
+def revisar_bodegas(asignacion, df_tiendas, df_bodega):
+    """Lanza ValueError si la asignación no calza con 'Stock Bodega' o deja tiendas sin bodega"""
+    if 'bodega_id' not in df_bodega.columns:
+        raise ValueError(f"Con la hoja '{HOJA_ASIGNACION}', '{HOJA_BODEGA}' necesita la columna bodega_id")
+    if df_bodega['bodega_id'].isna().any():
+        raise ValueError(f"'{HOJA_BODEGA}' tiene {int(df_bodega['bodega_id'].isna().sum())} fila(s) sin bodega_id")
+    
+    bodegas = set(df_bodega['bodega_id'].astype(object))
+    usadas = pd.concat([asignacion['bodega_principal'], asignacion['bodega_respaldo'].dropna()])
+    desconocidas = usadas[~usadas.isin(bodegas)].unique()
+    if len(desconocidas):
+        raise ValueError(f"La hoja '{HOJA_ASIGNACION}' usa bodegas que no están en '{HOJA_BODEGA}': "
+                         f"{', '.join(map(str, desconocidas[:3]))}")
+    tiendas = pd.Series(df_tiendas['tienda_id'].astype(object).unique())
+    sin_bodega = tiendas[~tiendas.isin(asignacion['tienda_id'])]
+    if len(sin_bodega):
+        raise ValueError(f"{len(sin_bodega):,} tienda(s) sin bodega en la hoja '{HOJA_ASIGNACION}': "
+                         f"{', '.join(map(str, sin_bodega[:3]))}")
+
+def stock_por_sku(df_bodega):
+    """'Stock Bodega' de la red completa: stock sumado por SKU (el volumen es el de la primera fila del SKU)"""
+    agregaciones = {'stock_bodega': ('stock_bodega', 'sum')}
+    if 'volumen' in df_bodega.columns:
+        agregaciones['volumen'] = ('volumen', 'first')
+    return df_bodega.groupby('sku', sort=False, observed=True).agg(**agregaciones).reset_index()
+
+def _calcular_bodega(df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, opciones):
+    """Primera pasada de una bodega con sus tiendas principales. Retorna (df_resultados, stock_bodega_final)."""
+    df_resultados, _, stock_bodega_final = calcular_sugerido_con_prioridad(
+        df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, **opciones
+    )
+    return df_resultados, stock_bodega_final
+
+def _primera_pasada(df, df_bodega, principal, carga_minima, carga_inicial, carga_maxima, procesos, progreso, opciones):
+    """
+    Calcula cada bodega con las filas de sus tiendas principales (en paralelo si procesos > 1).
+    Retorna (partes, posiciones, {bodega_id: stock_bodega_final}) en el orden de las bodegas.
+    """
+    codigo_bodega, bodegas = pd.factorize(principal)
+    posiciones = [np.flatnonzero(codigo_bodega == k) for k in range(len(bodegas))]
+    stock_bodegas = [df_bodega[df_bodega['bodega_id'] == bodega] for bodega in bodegas]
+    argumentos = [
+        (df.iloc[filas], stock_bodega, carga_minima, carga_inicial, carga_maxima, opciones)
+        for filas, stock_bodega in zip(posiciones, stock_bodegas)
+    ]
+    
+    progreso.actualizar(ETAPA_BODEGAS, 0, len(bodegas))
+    if procesos == 1 or len(bodegas) == 1:
+        salidas = []
+        for hechas, args in enumerate(argumentos, start=1):
+            salidas.append(_calcular_bodega(*args))
+            progreso.actualizar(ETAPA_BODEGAS, hechas, len(bodegas))
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(procesos, len(bodegas)))
+        try:
+            futuros = [pool.submit(_calcular_bodega, *args) for args in argumentos]
+            salidas = []
+            for hechas, futuro in enumerate(futuros, start=1):
+                salidas.append(futuro.result())
+                progreso.actualizar(ETAPA_BODEGAS, hechas, len(bodegas))
+        finally:
+            # Si se canceló o falló una bodega, las que no empezaron no se calculan
+            pool.shutdown(cancel_futures=True)
+    
+    partes = [df_resultados for df_resultados, _ in salidas]
+    return partes, posiciones, dict(zip(bodegas, (stock_final for _, stock_final in salidas)))
+
+def calcular_sugerido_multibodega(df_tiendas, df_bodega, df_asignacion, carga_minima, carga_inicial, carga_maxima,
+                                  procesos=None, progreso=None, **opciones):
+    """
+    Sugerido con varias bodegas: primera pasada por bodega principal (en paralelo,
+    procesos=1 en este proceso) y segunda pasada que completa los faltantes desde la
+    bodega de respaldo de cada tienda. Las opciones (modo de demanda, reparto y
+    excepciones) se pasan a calcular_sugerido_con_prioridad; la capacidad por tienda no se admite.
+    
+    Los resultados agregan bodega_id (principal), bodega_respaldo y cantidad_respaldo;
+    cantidad_a_despachar incluye lo que sale del respaldo. stock_bodega_disponible y
+    stock_bodega_despues son los de la bodega principal.
+    Retorna (df_resultados, resumen_tiendas, stock_bodega_final por SKU, stock_por_bodega).
+    """
+    if opciones.get('capacidades') is not None:
+        raise ValueError("La capacidad por tienda no se puede combinar con varias bodegas")
+    opciones.pop('capacidades', None)
+    asignacion = validar_asignacion(df_asignacion)
+    if asignacion is None:
+        raise ValueError(f"La hoja '{HOJA_ASIGNACION}' está vacía")
+    revisar_bodegas(asignacion, df_tiendas, df_bodega)
+    if progreso is None:
+        progreso = Progreso()
+    
+    df = ordenar_para_particiones(df_tiendas)
+    tiendas = df['tienda_id'].astype(object)
+    principal = tiendas.map(asignacion.set_index('tienda_id')['bodega_principal']).to_numpy()
+    respaldo = tiendas.map(asignacion.set_index('tienda_id')['bodega_respaldo']).to_numpy()
+    
+    # Pasada 1: cada bodega con sus tiendas principales
+    partes, posiciones, stock_final_bodegas = _primera_pasada(
+        df, df_bodega, principal, carga_minima, carga_inicial, carga_maxima,
+        procesos or os.cpu_count() or 1, progreso, opciones
+    )
+    df_resultados = unir_particiones(partes, posiciones)
+    
+    # Stock por bodega y SKU que queda después de la primera pasada (inicial en bodegas sin tiendas
+    # principales; los SKU pedidos que la bodega no tiene quedan con stock 0, igual que en el motor)
+    stock_inicial = df_bodega['stock_bodega'].groupby(
+        [df_bodega['bodega_id'].astype(object), df_bodega['sku'].astype(object)]
+    ).sum().rename_axis(['bodega_id', 'sku'])
+    restante = pd.concat(
+        {bodega: pd.Series(stock_final, dtype=np.float64) for bodega, stock_final in stock_final_bodegas.items()}
+    ).rename_axis(['bodega_id', 'sku']).combine_first(stock_inicial.astype(np.float64))
+    stock_inicial = stock_inicial.reindex(restante.index, fill_value=0)
+    
+    # Pasada 2: faltantes contra la bodega de respaldo, en orden de carga por (respaldo, SKU)
+    progreso.actualizar(ETAPA_RESPALDO)
+    cantidad_sugerida = df_resultados['cantidad_sugerida'].to_numpy(dtype=np.int64)
+    cantidad_principal = df_resultados['cantidad_a_despachar'].to_numpy(dtype=np.int64)
+    faltante = cantidad_sugerida - cantidad_principal
+    filas = np.flatnonzero(pd.notna(respaldo) & (faltante > 0))
+    cantidad_respaldo = np.zeros(len(df_resultados), dtype=np.int64)
+    if len(filas):
+        respaldo_filas = respaldo[filas]
+        skus_filas = df_resultados['sku'].to_numpy(dtype=object)[filas]
+        claves = pd.MultiIndex.from_arrays([respaldo_filas, skus_filas])
+        stock_sku = restante.reindex(claves).fillna(0).to_numpy(dtype=np.int64)
+        grupos = pd.Series(faltante[filas]).groupby([respaldo_filas, skus_filas], sort=False)
+        previo = grupos.cumsum().to_numpy() - faltante[filas]
+        primera_fila = ~claves.duplicated()
+        _, cantidad_respaldo[filas] = _asignar_stock(faltante[filas], stock_sku, previo, primera_fila)
+    
+    cantidad_real = cantidad_principal + cantidad_respaldo
+    df_resultados['cantidad_a_despachar'] = _entero_compacto(cantidad_real)
+    df_resultados['stock_despues'] = _entero_compacto(df_resultados['stock_antes'].to_numpy(dtype=np.int64) + cantidad_real)
+    df_resultados['estado'] = pd.Categorical.from_codes(
+        _codigo_estado(cantidad_sugerida, cantidad_real), categories=df_resultados['estado'].cat.categories
+    )
+    df_resultados['bodega_id'] = pd.Categorical(principal)
+    df_resultados['bodega_respaldo'] = pd.Categorical(respaldo)
+    df_resultados['cantidad_respaldo'] = _entero_compacto(cantidad_respaldo)
+    
+    # Stock final por bodega: lo que dejó la primera pasada menos lo que salió como respaldo
+    despacho_principal = pd.Series(cantidad_principal).groupby([principal, df_resultados['sku'].to_numpy(dtype=object)]).sum()
+    despacho_respaldo = pd.Series(cantidad_respaldo[filas]).groupby(
+        [respaldo[filas], df_resultados['sku'].to_numpy(dtype=object)[filas]]
+    ).sum() if len(filas) else pd.Series(dtype=np.int64)
+    stock_por_bodega = pd.DataFrame({
+        'stock_bodega': stock_inicial,
+        'despacho_principal': despacho_principal.reindex(stock_inicial.index, fill_value=0),
+        'despacho_respaldo': despacho_respaldo.reindex(stock_inicial.index, fill_value=0),
+        'stock_bodega_final': restante - despacho_respaldo.reindex(stock_inicial.index, fill_value=0)
+    }).astype(np.int64).reset_index()
+    stock_bodega_final = stock_por_bodega.groupby('sku', sort=False)['stock_bodega_final'].sum().to_dict()
+    progreso.actualizar(ETAPA_RESPALDO, 1, 1)
+    
+    return df_resultados, _resumen_completitud_tiendas(df_resultados), stock_bodega_final, stock_por_bodega
+
+def calcular_resumenes_multibodega(df_resultados, df_bodega, stock_bodega_final, stock_por_bodega):
+    """
+    calcular_resumenes sobre el stock de la red completa (Stock Antes y Después por SKU
+    son la suma de las bodegas) más la tabla por bodega como resumenes['por_bodega'].
+    """
+    df_bodega_total = stock_por_sku(df_bodega)
+    resumenes = calcular_resumenes(df_resultados, df_bodega_total, stock_bodega_final)
+    stock_inicial = df_bodega_total.set_index('sku')['stock_bodega']
+    resumenes['por_sku'] = resumenes['por_sku'].assign(
+        stock_bodega_disponible=lambda df: df['sku'].map(stock_inicial).fillna(0).astype(np.int64),
+        stock_bodega_despues=lambda df: df['sku'].map(stock_bodega_final).fillna(0).astype(np.int64)
+    )
+    resumenes['por_bodega'] = stock_por_bodega
+    return resumenes
@@ -0,0 +1,225 @@
+"""
+Cálculo del sugerido fuera de memoria (out-of-core), particionado por SKU.
+
+La asignación de cada SKU es independiente de los demás, así que 'Stock Tiendas'
+se reparte en particiones por rango de SKU que se escriben a disco y se procesan
+de a una. Los resultados se escriben en Parquet a medida que se calculan, por lo
+que la memoria queda acotada por el tamaño de una partición.
+
+Se usan rangos de SKU (y no un hash) porque así orden_carga se puede calcular
+igual que en la corrida completa sin ordenar todas las filas juntas: dentro de
+cada (prioridad, tienda) los SKU de una partición van después de los de las
+particiones anteriores.
+
+Antes de calcular, cada partición pasa por validar_entradas. Las filas repetidas
+de tienda+SKU caen en la misma partición (es la del SKU), así que se detectan
+sin juntar todas las filas; los errores se informan con la fila del archivo.
+"""
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from motor_sugerido import (
+    HOJA_BODEGA,
+    HOJA_TIENDAS,
+    NIVEL_ERROR,
+    TIPOS_LECTURA,
+    _tabla_errores,
+    agregar_resultados,
+    calcular_sugerido_con_prioridad,
+    combinar_agregados,
+    formatear_razon,
+    resumir_agregados,
+    resumir_errores,
+    validar_capacidades,
+    validar_entradas,
+)
+
+FILAS_POR_LOTE = 500_000
+N_PARTICIONES = 16
+# Posición de cada fila en el archivo de 'Stock Tiendas', guardada en las particiones para informar errores
+COLUMNA_FILA = '_fila_archivo'
+
+class ErrorValidacion(ValueError):
+    """Las entradas tienen errores (NIVEL_ERROR) y no se calcula; df_errores trae todos los problemas"""
+    
+    def __init__(self, df_errores):
+        resumen = resumir_errores(df_errores)
+        resumen = resumen[resumen['nivel'] == NIVEL_ERROR]
+        super().__init__('; '.join(f"{r.hoja}/{r.columna}: {r.error} ({r.filas:,} filas, primera {r.primera_fila})"
+                                   for r in resumen.itertuples()))
+        self.df_errores = df_errores
+
+def leer_por_lotes(ruta, columnas=None, filas_por_lote=FILAS_POR_LOTE):
+    """Lee un CSV o Parquet en lotes de filas con los tipos de lectura (enteros que admiten vacíos)"""
+    if ruta.lower().endswith('.parquet'):
+        archivo = pq.ParquetFile(ruta)
+        for lote in archivo.iter_batches(batch_size=filas_por_lote, columns=columnas):
+            df = lote.to_pandas()
+            yield df.astype({col: tipo for col, tipo in TIPOS_LECTURA.items() if col in df.columns})
+    else:
+        tipos = TIPOS_LECTURA if columnas is None else {col: TIPOS_LECTURA[col] for col in columnas if col in TIPOS_LECTURA}
+        yield from pd.read_csv(ruta, usecols=columnas, dtype=tipos, chunksize=filas_por_lote)
+
+def _limites_particiones(ruta_tiendas, n_particiones, filas_por_lote):
+    """
+    Primera pasada: cuenta filas por SKU y elige cortes de SKU (ordenados)
+    para que cada partición tenga un número similar de filas.
+    """
+    conteo = None
+    for lote in leer_por_lotes(ruta_tiendas, columnas=['sku'], filas_por_lote=filas_por_lote):
+        conteo_lote = lote['sku'].value_counts()
+        conteo = conteo_lote if conteo is None else conteo.add(conteo_lote, fill_value=0)
+    if conteo is None or len(conteo) == 0:
+        return np.array([], dtype=object)
+    
+    conteo = conteo.sort_index()
+    acumulado = conteo.cumsum().to_numpy()
+    objetivos = acumulado[-1] * np.arange(1, n_particiones) / n_particiones
+    posiciones = np.unique(np.searchsorted(acumulado, objetivos))
+    return np.asarray(conteo.index[posiciones[posiciones < len(conteo) - 1]], dtype=object)
+
+def _particionar(ruta_tiendas, limites, carpeta, filas_por_lote):
+    """
+    Segunda pasada: escribe cada fila en el Parquet de su partición y cuenta
+    filas por (prioridad, tienda, partición) para calcular orden_carga.
+    """
+    escritores = {}
+    conteos = None
+    filas_leidas = 0
+    try:
+        for lote in leer_por_lotes(ruta_tiendas, filas_por_lote=filas_por_lote):
+            lote[COLUMNA_FILA] = np.arange(filas_leidas, filas_leidas + len(lote), dtype=np.int64)
+            filas_leidas += len(lote)
+            particion = np.searchsorted(limites, lote['sku'].fillna('').to_numpy(dtype=object), side='left')
+            conteo_lote = lote.groupby([lote['prioridad_tienda'], lote['tienda_id'], particion]).size()
+            conteos = conteo_lote if conteos is None else conteos.add(conteo_lote, fill_value=0)
+            
+            for k, parte in lote.groupby(particion, sort=False):
+                tabla = pa.Table.from_pandas(parte, preserve_index=False)
+                if k not in escritores:
+                    ruta = os.path.join(carpeta, f"particion_{k:04d}.parquet")
+                    escritores[k] = pq.ParquetWriter(ruta, tabla.schema)
+                escritores[k].write_table(tabla.cast(escritores[k].schema))
+    finally:
+        for escritor in escritores.values():
+            escritor.close()
+    
+    if conteos is not None:
+        conteos.index = conteos.index.set_names(['prioridad', 'tienda_id', 'particion'])
+    return sorted(escritores), conteos
+
+def _desfases_orden(conteos):
+    """
+    Número de filas que preceden a cada (prioridad, tienda, partición) en el orden
+    global (prioridad_tienda, tienda_id, sku): al ordenar los conteos por esa clave,
+    es la suma acumulada de los conteos anteriores.
+    """
+    conteos = conteos.sort_index().astype('int64')
+    return conteos.cumsum() - conteos
+
+def _validar_particiones(particiones, carpeta, df_bodega):
+    """
+    Pasa cada partición por validar_entradas y la reescribe normalizada (sin la columna
+    de fila). 'Stock Bodega' se revisa con la primera. Retorna (df_bodega validada,
+    df_errores con las filas de 'Stock Tiendas' numeradas como en el archivo).
+    """
+    errores = []
+    for i, k in enumerate(particiones):
+        ruta = os.path.join(carpeta, f"particion_{k:04d}.parquet")
+        df_tiendas = pd.read_parquet(ruta)
+        fila_archivo = df_tiendas.pop(COLUMNA_FILA).to_numpy()
+        df_tiendas, df_bodega_validada, df_errores = validar_entradas(df_tiendas, df_bodega)
+        if i > 0:
+            df_errores = df_errores[df_errores['hoja'] == HOJA_TIENDAS]
+        else:
+            df_bodega_final = df_bodega_validada
+        en_tiendas = (df_errores['hoja'] == HOJA_TIENDAS).to_numpy()
+        filas = df_errores['fila'].to_numpy().copy()
+        filas[en_tiendas] = fila_archivo[filas[en_tiendas] - 2] + 2
+        errores.append(df_errores.assign(fila=filas))
+        df_tiendas.to_parquet(ruta, index=False)
+    if not errores:
+        return df_bodega, _tabla_errores([])
+    df_errores = pd.concat(errores, ignore_index=True)
+    df_errores = df_errores.astype({col: 'category' for col in df_errores.columns if col != 'fila'})
+    orden = np.lexsort((df_errores['fila'].to_numpy(), (df_errores['hoja'] == HOJA_BODEGA).to_numpy()))
+    return df_bodega_final, df_errores.take(orden).reset_index(drop=True)
+
+def _tabla_exportable(df_resultados):
+    """
+    Tabla Arrow de los resultados de una partición con la razón como texto y
+    las columnas categóricas como valores simples (mismo esquema en todas las particiones).
+    """
+    df = df_resultados.drop(columns='codigo_razon').assign(razon=formatear_razon(df_resultados))
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    esquema = pa.schema([
+        campo.with_type(campo.type.value_type) if pa.types.is_dictionary(campo.type) else campo
+        for campo in tabla.schema
+    ], metadata=tabla.schema.metadata)
+    return tabla.cast(esquema)
+
+def calcular_sugerido_particionado(ruta_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima,
+                                   ruta_salida, n_particiones=N_PARTICIONES, filas_por_lote=FILAS_POR_LOTE,
+                                   carpeta_temporal=None, **opciones):
+    """
+    Calcula el sugerido leyendo 'Stock Tiendas' (CSV o Parquet) por lotes y procesando
+    una partición de SKU a la vez. Los resultados (mismas columnas y orden_carga que
+    calcular_sugerido_con_prioridad) se escriben en ruta_salida (Parquet), agrupados por partición.
+    Las opciones (modo de demanda, reparto, excepciones y capacidades) se pasan a
+    calcular_sugerido_con_prioridad. La capacidad de cada tienda se llena en orden de
+    SKU, así que la que deja una partición pasa a la siguiente.
+    Las entradas se validan antes de calcular; con errores lanza ErrorValidacion.
+    Retorna (stock_bodega_final, resumenes, df_bodega validada, df_errores con los avisos).
+    """
+    capacidad = validar_capacidades(opciones.pop('capacidades', None))
+    agregados = []
+    escritor = None
+    
+    with tempfile.TemporaryDirectory(dir=carpeta_temporal) as carpeta:
+        limites = _limites_particiones(ruta_tiendas, n_particiones, filas_por_lote)
+        particiones, conteos = _particionar(ruta_tiendas, limites, carpeta, filas_por_lote)
+        df_bodega, df_errores = _validar_particiones(particiones, carpeta, df_bodega)
+        if (df_errores['nivel'] == NIVEL_ERROR).any():
+            raise ErrorValidacion(df_errores)
+        stock_bodega_final = df_bodega.set_index('sku')['stock_bodega'].to_dict()
+        desfases = _desfases_orden(conteos) if conteos is not None else None
+        
+        try:
+            for k in particiones:
+                df_tiendas = pd.read_parquet(os.path.join(carpeta, f"particion_{k:04d}.parquet"))
+                capacidades = capacidad.reset_index() if capacidad is not None else None
+                df_resultados, _, stock_particion = calcular_sugerido_con_prioridad(
+                    df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, capacidades=capacidades, **opciones
+                )
+                if capacidad is not None:
+                    capacidad.update(pd.Series(df_resultados.attrs['capacidad_restante'], dtype=np.float64))
+                
+                # orden_carga global: filas previas al grupo + posición dentro del grupo
+                clave = pd.MultiIndex.from_arrays([
+                    df_resultados['prioridad'].to_numpy(), df_resultados['tienda_id'].to_numpy(), np.full(len(df_resultados), k)
+                ])
+                posicion = df_resultados.groupby(['prioridad', 'tienda_id'], sort=False, observed=True).cumcount().to_numpy()
+                df_resultados['orden_carga'] = desfases.reindex(clave).to_numpy().astype('int64') + posicion + 1
+                
+                for sku in df_resultados['sku'].unique():
+                    stock_bodega_final[sku] = stock_particion[sku]
+                agregados.append(agregar_resultados(df_resultados))
+                
+                tabla = _tabla_exportable(df_resultados)
+                if escritor is None:
+                    escritor = pq.ParquetWriter(ruta_salida, tabla.schema)
+                escritor.write_table(tabla.cast(escritor.schema))
+                del df_tiendas, df_resultados, tabla
+        finally:
+            if escritor is not None:
+                escritor.close()
+    
+    if not agregados:
+        raise ValueError("'Stock Tiendas' no tiene filas")
+    resumenes = resumir_agregados(*combinar_agregados(agregados), df_bodega, stock_bodega_final)
+    return stock_bodega_final, resumenes, df_bodega, df_errores
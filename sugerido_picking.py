@@ -0,0 +1,141 @@
+"""
+Listas de picking por tienda: un CSV o XLSX por tienda_id con las líneas a
+despachar (cantidad_a_despachar > 0) en orden de carga, empaquetadas en un zip.
+
+Las tiendas se reparten en lotes entre procesos. Cada proceso escribe los
+archivos de su lote en una carpeta temporal y el proceso principal los va
+copiando al zip a medida que los lotes terminan, así que en memoria solo hay
+un lote por proceso y nunca todos los archivos a la vez.
+"""
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+FORMATOS_PICKING = ('csv', 'xlsx')
+
+COLUMNAS_PICKING = {
+    'orden_carga': 'Orden',
+    'tienda_id': 'Tienda',
+    'prioridad': 'Prioridad',
+    'sku': 'SKU',
+    'producto': 'Producto',
+    'cantidad_a_despachar': 'Cantidad',
+    'tipo_carga': 'Tipo'
+}
+
+LOTES_POR_PROCESO = 4
+
+def _nombre_archivo(posicion, tienda_id, formato, ancho):
+    """Nombre del archivo de una tienda: posición en el orden de carga y tienda_id sin caracteres inválidos"""
+    return f"{posicion:0{ancho}d}_{re.sub(r'[^0-9A-Za-z_.-]', '_', str(tienda_id))}.{formato}"
+
+def _lineas_picking(df_resultados):
+    """
+    Líneas a despachar con las columnas de picking, agrupadas por tienda (en el
+    orden en que se cargan) y en orden de carga dentro de cada tienda.
+    Retorna (df, cortes): las filas de la tienda i son df.iloc[cortes[i]:cortes[i + 1]].
+    """
+    columnas = [col for col in COLUMNAS_PICKING if col in df_resultados.columns]
+    df = df_resultados.loc[df_resultados['cantidad_a_despachar'].to_numpy() > 0, columnas]
+    if not df['orden_carga'].is_monotonic_increasing:
+        df = df.sort_values('orden_carga', kind='stable')
+    
+    # Códigos en orden de aparición: las tiendas quedan en el orden en que empiezan a cargarse
+    codigos, _ = pd.factorize(df['tienda_id'])
+    orden = np.argsort(codigos, kind='stable')
+    codigos = codigos[orden]
+    cortes = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1], True]) if len(codigos) else np.array([0])
+    return df.iloc[orden].rename(columns=COLUMNAS_PICKING).reset_index(drop=True), cortes
+
+def _escribir_csv(df, ruta):
+    """CSV con BOM, para que Excel lo abra con los acentos correctos"""
+    df.to_csv(ruta, index=False, encoding='utf-8-sig')
+
+def _escribir_xlsx(df, ruta):
+    """Una hoja 'Picking' escrita por columna con el tipo ya resuelto (más rápido que write_row por fila)"""
+    workbook = xlsxwriter.Workbook(ruta)
+    worksheet = workbook.add_worksheet('Picking')
+    worksheet.write_row(0, 0, list(df.columns), workbook.add_format({'bold': True, 'border': 1}))
+    for columna, nombre in enumerate(df.columns):
+        if pd.api.types.is_numeric_dtype(df[nombre]):
+            escribir, valores = worksheet.write_number, df[nombre].tolist()
+        else:
+            escribir, valores = worksheet.write_string, df[nombre].astype(str).tolist()
+        for fila, valor in enumerate(valores, start=1):
+            escribir(fila, columna, valor)
+    worksheet.set_column(0, len(df.columns) - 1, 14)
+    workbook.close()
+
+ESCRITORES = {'csv': _escribir_csv, 'xlsx': _escribir_xlsx}
+
+def _escribir_lote(df_lote, cortes, nombres, formato, carpeta):
+    """Escribe un archivo por tienda del lote en carpeta. Retorna las rutas en el mismo orden."""
+    escribir = ESCRITORES[formato]
+    rutas = []
+    for inicio, fin, nombre in zip(cortes[:-1], cortes[1:], nombres):
+        ruta = os.path.join(carpeta, nombre)
+        escribir(df_lote.iloc[inicio:fin], ruta)
+        rutas.append(ruta)
+    return rutas
+
+def _lotes(df, cortes, nombres, n_lotes):
+    """Divide las tiendas en n_lotes tramos contiguos: (filas del lote, cortes relativos, nombres)"""
+    limites = np.linspace(0, len(nombres), n_lotes + 1).astype(int)
+    for desde, hasta in zip(limites[:-1], limites[1:]):
+        if desde == hasta:
+            continue
+        cortes_lote = cortes[desde:hasta + 1]
+        yield df.iloc[cortes_lote[0]:cortes_lote[-1]], cortes_lote - cortes_lote[0], nombres[desde:hasta]
+
+def _agregar_al_zip(archivo_zip, rutas):
+    """Copia los archivos al zip (por bloques, sin leerlos enteros) y los borra de la carpeta temporal"""
+    for ruta in rutas:
+        archivo_zip.write(ruta, os.path.basename(ruta))
+        os.remove(ruta)
+
+def generar_listas_picking(df_resultados, formato='csv', destino=None, procesos=None):
+    """
+    Genera un zip con una lista de picking por tienda (solo líneas con despacho,
+    en orden de carga). Los archivos se escriben en paralelo con procesos
+    (procesos=1 los escribe en este proceso).
+    Si se indica destino (ruta) el zip se escribe directo a disco; si no, se retorna un BytesIO.
+    """
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato de picking desconocido: {formato} (usa {', '.join(FORMATOS_PICKING)})")
+    
+    df, cortes = _lineas_picking(df_resultados)
+    tiendas = df['Tienda'].iloc[cortes[:-1]].tolist()
+    ancho = len(str(len(tiendas)))
+    nombres = [_nombre_archivo(posicion, tienda, formato, ancho) for posicion, tienda in enumerate(tiendas, start=1)]
+    
+    procesos = min(procesos or os.cpu_count() or 1, max(len(tiendas), 1))
+    output = destino if destino is not None else BytesIO()
+    carpeta = tempfile.mkdtemp(prefix='picking_')
+    try:
+        # Los XLSX ya vienen comprimidos: se guardan tal cual en el zip
+        compresion = zipfile.ZIP_STORED if formato == 'xlsx' else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(output, 'w', compression=compresion) as archivo_zip:
+            lotes = list(_lotes(df, cortes, nombres, procesos * LOTES_POR_PROCESO))
+            if procesos == 1:
+                for lote in lotes:
+                    _agregar_al_zip(archivo_zip, _escribir_lote(*lote, formato, carpeta))
+            else:
+                # Se esperan los lotes en orden, así el zip queda en orden de carga
+                with ProcessPoolExecutor(max_workers=procesos) as pool:
+                    futuros = [pool.submit(_escribir_lote, *lote, formato, carpeta) for lote in lotes]
+                    for futuro in futuros:
+                        _agregar_al_zip(archivo_zip, futuro.result())
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    
+    if destino is None:
+        output.seek(0)
+    return output
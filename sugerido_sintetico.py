@@ -0,0 +1,171 @@
+"""
+Generador de datos sintéticos para 'Stock Tiendas' y 'Stock Bodega' a escala de cadena.
+
+Sirve para medir rendimiento (ver sugerido_benchmark.py) y para probar la app
+sin datos reales. Cada tienda tiene un surtido (no todas las tiendas venden
+todos los SKU), una prioridad, un tamaño y una proporción de filas de carga
+inicial; la bodega se dimensiona en semanas de venta, así que con una cobertura
+baja se generan escenarios de bodega escasa.
+
+Ejemplo:
+    python sugerido_sintetico.py --tiendas 500 --skus 2500 --salida datos/cd_sintetico/
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from motor_sugerido import TIPOS_ENTRADA
+
+PESOS_PRIORIDAD = (0.10, 0.20, 0.30, 0.25, 0.15)
+
+def _etiquetas(prefijo, n, codigos):
+    """Ids de texto ('T00001', 'SKU-00001', ...) para los códigos dados, sin formatear cada fila"""
+    ancho = max(len(str(n)), 5)
+    etiquetas = np.array([f"{prefijo}{i:0{ancho}d}" for i in range(1, n + 1)], dtype=object)
+    return pd.Categorical.from_codes(codigos, etiquetas)
+
+def generar_entradas(n_tiendas=100, n_skus=125, densidad=0.8, proporcion_inicial=0.1,
+                     cobertura_bodega=2.0, proporcion_sin_bodega=0.01, pesos_prioridad=PESOS_PRIORIDAD,
+                     semilla=0):
+    """
+    Genera (df_tiendas, df_bodega) con las columnas y tipos de las hojas de entrada.
+    
+    - densidad: fracción de SKU que vende cada tienda (filas ≈ n_tiendas * n_skus * densidad)
+    - proporcion_inicial: fracción de filas marcadas como 'inicial' (producto nuevo, sin stock ni venta)
+    - cobertura_bodega: semanas de venta que cubre el stock de bodega (< 1 para bodega escasa)
+    - proporcion_sin_bodega: fracción de SKU que no aparecen en 'Stock Bodega'
+    """
+    rng = np.random.default_rng(semilla)
+    
+    # Surtido de cada tienda: celdas de la grilla tienda x SKU que existen
+    celdas = np.flatnonzero(rng.random(n_tiendas * n_skus) < densidad)
+    tienda, sku = np.divmod(celdas, n_skus)
+    n_filas = len(celdas)
+    
+    # Prioridad y tamaño por tienda, popularidad por SKU
+    pesos = np.asarray(pesos_prioridad, dtype=float)
+    prioridad_tienda = rng.choice(np.arange(1, len(pesos) + 1), size=n_tiendas, p=pesos / pesos.sum())
+    tamano_tienda = rng.lognormal(0.0, 0.5, n_tiendas)
+    popularidad_sku = rng.lognormal(0.0, 1.0, n_skus)
+    
+    # Venta semanal esperada de cada fila y ventas observadas
+    tasa = tamano_tienda[tienda] * popularidad_sku[sku]
+    inicial = rng.random(n_filas) < proporcion_inicial
+    venta_4_semanas = np.where(inicial, 0, rng.poisson(4 * tasa))
+    venta_ultima_semana = rng.binomial(venta_4_semanas, 0.25)
+    stock_actual = np.where(inicial, 0, rng.poisson(tasa * rng.uniform(0.0, 2.0, n_filas)))
+    
+    df_tiendas = pd.DataFrame({
+        'tienda_id': _etiquetas('T', n_tiendas, tienda),
+        'sku': _etiquetas('SKU-', n_skus, sku),
+        'stock_actual': stock_actual,
+        'venta_ultima_semana': venta_ultima_semana,
+        'venta_4_semanas': venta_4_semanas,
+        'tipo_carga': np.where(inicial, 'inicial', 'reposicion'),
+        'prioridad_tienda': prioridad_tienda[tienda]
+    })
+    df_tiendas.insert(2, 'producto', 'Producto ' + df_tiendas['sku'].astype(str))
+    df_tiendas = df_tiendas.astype({col: TIPOS_ENTRADA[col] for col in df_tiendas.columns})
+    
+    # Bodega: semanas de venta del SKU en toda la cadena (más la carga de los productos nuevos)
+    venta_semanal_sku = np.bincount(sku, weights=tasa, minlength=n_skus)
+    iniciales_sku = np.bincount(sku, weights=inicial, minlength=n_skus)
+    stock_bodega = rng.poisson(cobertura_bodega * (venta_semanal_sku + iniciales_sku))
+    con_bodega = rng.random(n_skus) >= proporcion_sin_bodega
+    
+    codigos_sku = np.flatnonzero(con_bodega)
+    df_bodega = pd.DataFrame({
+        'sku': _etiquetas('SKU-', n_skus, codigos_sku),
+        'stock_bodega': stock_bodega[con_bodega]
+    })
+    df_bodega.insert(1, 'producto', 'Producto ' + df_bodega['sku'].astype(str))
+    df_bodega = df_bodega.astype({col: TIPOS_ENTRADA[col] for col in df_bodega.columns})
+    
+    return df_tiendas, df_bodega
+
+def generar_excepciones(df_tiendas, proporcion=0.05, semilla=0):
+    """
+    Tabla 'Excepciones' para df_tiendas: una fracción de las filas como excepciones
+    tienda+SKU (carga mínima y máximo propios), más una excepción de máximo por cada SKU
+    y una de carga mínima por cada tienda, para medir los tres niveles de resolución.
+    """
+    rng = np.random.default_rng(semilla)
+    filas = rng.choice(len(df_tiendas), size=int(len(df_tiendas) * proporcion), replace=False)
+    skus = df_tiendas['sku'].unique()
+    tiendas = df_tiendas['tienda_id'].unique()
+    partes = [
+        pd.DataFrame({
+            'tienda_id': df_tiendas['tienda_id'].to_numpy()[filas],
+            'sku': df_tiendas['sku'].to_numpy()[filas],
+            'carga_minima': rng.integers(1, 6, len(filas)),
+            'carga_maxima': rng.integers(10, 40, len(filas))
+        }),
+        pd.DataFrame({'tienda_id': None, 'sku': skus, 'carga_maxima': rng.integers(10, 40, len(skus))}),
+        pd.DataFrame({'tienda_id': tiendas, 'sku': None, 'carga_minima': rng.integers(1, 6, len(tiendas))})
+    ]
+    return pd.concat(partes, ignore_index=True).astype({'carga_minima': 'Int64', 'carga_maxima': 'Int64'})
+
+def generar_capacidades(df_tiendas, holgura=0.5, semilla=0):
+    """
+    Tabla 'Capacidad' para df_tiendas: cada tienda recibe como máximo `holgura` veces
+    su venta semanal (con holgura < 1 la capacidad limita el despacho).
+    """
+    rng = np.random.default_rng(semilla)
+    venta_semanal = df_tiendas.groupby('tienda_id', observed=True)['venta_4_semanas'].sum() / 4
+    capacidad = np.ceil(holgura * venta_semanal.to_numpy() * rng.uniform(0.5, 1.5, len(venta_semanal)))
+    return pd.DataFrame({'tienda_id': venta_semanal.index.to_numpy(), 'capacidad': capacidad})
+
+def dimensiones_para_filas(filas, densidad=0.8, skus_por_tienda=5.0):
+    """Número de tiendas y SKU para obtener aproximadamente `filas` filas en 'Stock Tiendas'"""
+    celdas = filas / densidad
+    n_tiendas = max(1, round((celdas / skus_por_tienda) ** 0.5))
+    n_skus = max(1, round(celdas / n_tiendas))
+    return n_tiendas, n_skus
+
+def guardar_entradas(df_tiendas, df_bodega, carpeta, formato='parquet'):
+    """
+    Escribe las entradas en una carpeta como stock_tiendas/stock_bodega (.parquet o .csv),
+    el formato que leen la app, la CLI y el modo por particiones. Retorna las rutas.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    rutas = []
+    for nombre, df in (('stock_tiendas', df_tiendas), ('stock_bodega', df_bodega)):
+        ruta = os.path.join(carpeta, f"{nombre}.{formato}")
+        if formato == 'parquet':
+            df.to_parquet(ruta, index=False)
+        else:
+            df.to_csv(ruta, index=False)
+        rutas.append(ruta)
+    return rutas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera entradas sintéticas para el Sugerido Automático")
+    parser.add_argument('--salida', required=True, help="Carpeta donde se escriben stock_tiendas y stock_bodega")
+    parser.add_argument('--filas', type=int, default=None, help="Filas aproximadas de 'Stock Tiendas' (define tiendas y SKU)")
+    parser.add_argument('--tiendas', type=int, default=100, help="Número de tiendas (default: 100)")
+    parser.add_argument('--skus', type=int, default=125, help="Número de SKU (default: 125)")
+    parser.add_argument('--densidad', type=float, default=0.8, help="Fracción de SKU que vende cada tienda (default: 0.8)")
+    parser.add_argument('--proporcion-inicial', type=float, default=0.1, help="Fracción de filas 'inicial' (default: 0.1)")
+    parser.add_argument('--cobertura-bodega', type=float, default=2.0,
+                        help="Semanas de venta en bodega; menos de 1 genera bodega escasa (default: 2.0)")
+    parser.add_argument('--formato', choices=['parquet', 'csv'], default='parquet', help="Formato de salida (default: parquet)")
+    parser.add_argument('--semilla', type=int, default=0, help="Semilla aleatoria (default: 0)")
+    args = parser.parse_args(argv)
+    
+    n_tiendas, n_skus = args.tiendas, args.skus
+    if args.filas:
+        n_tiendas, n_skus = dimensiones_para_filas(args.filas, args.densidad)
+    
+    df_tiendas, df_bodega = generar_entradas(
+        n_tiendas, n_skus, densidad=args.densidad, proporcion_inicial=args.proporcion_inicial,
+        cobertura_bodega=args.cobertura_bodega, semilla=args.semilla
+    )
+    rutas = guardar_entradas(df_tiendas, df_bodega, args.salida, args.formato)
+    print(f"✅ {len(df_tiendas):,} filas ({n_tiendas:,} tiendas x {n_skus:,} SKU) -> {', '.join(rutas)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
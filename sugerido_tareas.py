@@ -0,0 +1,239 @@
+"""
+Tareas en segundo plano para corridas grandes.
+
+Una Tarea corre en un hilo propio, fuera del ciclo de reejecución de Streamlit:
+los clics y el cambio de paso no la interrumpen, y el GestorTareas entrega la
+misma tarea a todas las ejecuciones que piden la misma clave (hash de entradas
+y parámetros), así que nunca se corre dos veces en paralelo. La tarea lleva las
+sesiones que esperan su resultado: cancelar desde una sesión solo la retira a
+ella, y la tarea se detiene cuando ya no la espera nadie.
+
+calcular_sugerido_por_bloques divide el cálculo en rangos de SKU para informar
+el avance (SKU procesados de un total) y revisar entre bloques si se pidió
+cancelar. Los bloques se procesan en orden de SKU, que dentro de cada tienda es
+el orden de carga, así que la capacidad por tienda que deja un bloque pasa al
+siguiente y el resultado es el mismo que el de la corrida completa.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from motor_sugerido import (
+    _resumen_completitud_tiendas,
+    calcular_sugerido_con_prioridad,
+    ordenar_para_particiones,
+    unir_particiones,
+    validar_capacidades,
+)
+
+EN_CURSO = 'en_curso'
+TERMINADA = 'terminada'
+CANCELADA = 'cancelada'
+ERROR = 'error'
+
+FILAS_POR_BLOQUE = 250_000
+MAX_BLOQUES = 40
+
+class TareaCancelada(Exception):
+    """Se pidió cancelar la tarea; se lanza en el siguiente punto de control"""
+
+class Progreso:
+    """
+    Avance de una tarea: lo actualiza el hilo de la tarea y lo lee la interfaz.
+    Cada actualización es un punto de control: si se pidió cancelar, lanza TareaCancelada.
+    """
+    
+    def __init__(self):
+        self.etapa = None
+        self.hechos = 0
+        self.total = 0
+        self._cancelar = threading.Event()
+    
+    def actualizar(self, etapa=None, hechos=0, total=0):
+        if self._cancelar.is_set():
+            raise TareaCancelada()
+        if etapa is not None:
+            self.etapa = etapa
+        self.hechos, self.total = hechos, total
+    
+    def cancelar(self):
+        self._cancelar.set()
+    
+    @property
+    def cancelado(self):
+        return self._cancelar.is_set()
+    
+    def fraccion(self):
+        """Fracción completada de la etapa actual (0 si no tiene total)"""
+        return min(self.hechos / self.total, 1.0) if self.total else 0.0
+
+class Tarea:
+    """
+    Ejecuta funcion(progreso) en un hilo y guarda su estado, resultado o error.
+    interesados son las sesiones que esperan el resultado.
+    """
+    
+    def __init__(self, funcion, interesado=None):
+        self.progreso = Progreso()
+        self.estado = EN_CURSO
+        self.resultado = None
+        self.error = None
+        self.inicio = time.perf_counter()
+        self.fin = None
+        self.interesados = set() if interesado is None else {interesado}
+        self._lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._correr, args=(funcion,), daemon=True)
+        self._hilo.start()
+    
+    def _correr(self, funcion):
+        try:
+            self.resultado = funcion(self.progreso)
+            self.estado = TERMINADA
+        except TareaCancelada:
+            self.estado = CANCELADA
+        except Exception as e:
+            self.error = e
+            self.estado = ERROR
+        finally:
+            self.fin = time.perf_counter()
+    
+    @property
+    def activa(self):
+        return self.estado == EN_CURSO
+    
+    def segundos(self):
+        """Tiempo transcurrido (o total, si ya terminó)"""
+        return (self.fin if self.fin is not None else time.perf_counter()) - self.inicio
+    
+    def unir(self, interesado):
+        """Agrega una sesión que espera el resultado"""
+        with self._lock:
+            self.interesados.add(interesado)
+    
+    def espera(self, interesado):
+        """True si la sesión sigue esperando el resultado (no canceló)"""
+        with self._lock:
+            return interesado in self.interesados
+    
+    def cancelar(self, interesado=None):
+        """
+        Pide cancelar; la tarea se detiene en su siguiente punto de control. Con interesado
+        solo esa sesión deja de esperarla, y la tarea se detiene si no queda otra esperando.
+        Retorna True si se pidió detener la tarea.
+        """
+        with self._lock:
+            if interesado is not None:
+                self.interesados.discard(interesado)
+                if self.interesados:
+                    return False
+        self.progreso.cancelar()
+        return True
+    
+    def esperar(self, timeout=None):
+        self._hilo.join(timeout)
+        return not self._hilo.is_alive()
+
+class GestorTareas:
+    """
+    Tareas por clave, compartidas entre ejecuciones y sesiones. Conserva las
+    activas y las max_tareas más recientes ya terminadas.
+    """
+    
+    def __init__(self, max_tareas=8):
+        self.max_tareas = max_tareas
+        self._tareas = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obtener(self, clave):
+        with self._lock:
+            return self._tareas.get(clave)
+    
+    def iniciar(self, clave, funcion, interesado=None):
+        """
+        Tarea de la clave: la existente (activa o terminada) o una nueva que corre funcion(progreso).
+        interesado (la sesión que la pide) queda entre los que esperan su resultado.
+        """
+        with self._lock:
+            tarea = self._tareas.get(clave)
+            if tarea is None:
+                tarea = Tarea(funcion, interesado)
+                self._tareas[clave] = tarea
+            elif interesado is not None:
+                tarea.unir(interesado)
+            self._tareas.move_to_end(clave)
+            terminadas = [c for c, t in self._tareas.items() if not t.activa and c != clave]
+            for c in terminadas[:max(0, len(self._tareas) - self.max_tareas)]:
+                del self._tareas[c]
+            return tarea
+    
+    def descartar(self, clave):
+        """Olvida la tarea de una clave (por ejemplo para reintentar una cancelada); cancela si sigue activa"""
+        with self._lock:
+            tarea = self._tareas.pop(clave, None)
+        if tarea is not None:
+            tarea.cancelar()
+    
+    def activas(self):
+        with self._lock:
+            return [tarea for tarea in self._tareas.values() if tarea.activa]
+
+def _bloques_por_sku(skus, n_bloques):
+    """Número de bloque de cada fila: rangos de SKU ordenados con un número similar de filas"""
+    codigos, unicos = pd.factorize(skus, sort=True)
+    conteo = np.bincount(codigos, minlength=len(unicos))
+    objetivos = conteo.sum() * np.arange(1, n_bloques) / n_bloques
+    limites = np.unique(np.searchsorted(np.cumsum(conteo), objetivos, side='right'))
+    return np.searchsorted(limites, codigos, side='right'), len(unicos)
+
+def calcular_sugerido_por_bloques(df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, progreso=None,
+                                  filas_por_bloque=FILAS_POR_BLOQUE, **opciones):
+    """
+    Igual que calcular_sugerido_con_prioridad (mismas opciones y resultados), pero
+    por rangos de SKU: después de cada bloque informa los SKU procesados en progreso
+    y se detiene (TareaCancelada) si se pidió cancelar.
+    """
+    if progreso is None:
+        progreso = Progreso()
+    n_bloques = int(np.clip(-(-len(df_tiendas) // filas_por_bloque), 1, MAX_BLOQUES))
+    if n_bloques == 1:
+        progreso.actualizar('calculo', 0, df_tiendas['sku'].nunique())
+        resultado = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, carga_minima, carga_inicial, carga_maxima, **opciones)
+        progreso.actualizar('calculo', progreso.total, progreso.total)
+        return resultado
+    
+    # Orden de carga global una vez; las filas de cada bloque mantienen ese orden
+    df = ordenar_para_particiones(df_tiendas)
+    bloque, n_skus = _bloques_por_sku(df['sku'], n_bloques)
+    capacidad = validar_capacidades(opciones.pop('capacidades', None))
+    
+    stock_bodega_final = df_bodega.set_index('sku')['stock_bodega'].to_dict()
+    partes, posiciones = [], []
+    skus_hechos = 0
+    progreso.actualizar('calculo', 0, n_skus)
+    for k in np.unique(bloque):
+        filas = np.flatnonzero(bloque == k)
+        df_bloque = df.iloc[filas]
+        df_resultados, _, stock_bloque = calcular_sugerido_con_prioridad(
+            df_bloque, df_bodega, carga_minima, carga_inicial, carga_maxima,
+            capacidades=capacidad.reset_index() if capacidad is not None else None, **opciones
+        )
+        if capacidad is not None:
+            capacidad.update(pd.Series(df_resultados.attrs['capacidad_restante'], dtype=np.float64))
+        
+        skus_bloque = df_bloque['sku'].unique()
+        stock_bodega_final.update((sku, stock_bloque[sku]) for sku in skus_bloque if sku in stock_bloque)
+        partes.append(df_resultados)
+        posiciones.append(filas)
+        skus_hechos += len(skus_bloque)
+        progreso.actualizar('calculo', skus_hechos, n_skus)
+    
+    # Cada fila vuelve a su posición en el orden de carga global
+    df_resultados = unir_particiones(partes, posiciones)
+    if capacidad is not None:
+        capacidad = capacidad[capacidad.index.isin(df_resultados['tienda_id'].unique())]
+        df_resultados.attrs['capacidad_restante'] = capacidad.to_dict()
+    
+    return df_resultados, _resumen_completitud_tiendas(df_resultados), stock_bodega_final
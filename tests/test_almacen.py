@@ -0,0 +1,66 @@
+"""
+Pruebas del almacén compartido (sugerido_almacen.py) y del recálculo incremental
+que guarda su corrida anterior en él.
+"""
+import pandas as pd
+
+from sugerido_almacen import AlmacenDatos
+from sugerido_incremental import RecalculoIncremental
+
+def entradas():
+    df_tiendas = pd.DataFrame({
+        'tienda_id': ['T1', 'T1', 'T2', 'T2'],
+        'sku': ['A', 'B', 'A', 'B'],
+        'stock_actual': [0, 1, 0, 5],
+        'tipo_carga': ['reposicion', 'inicial', 'reposicion', 'reposicion'],
+        'prioridad_tienda': [1, 1, 2, 2]
+    })
+    df_bodega = pd.DataFrame({'sku': ['A', 'B'], 'stock_bodega': [3, 20]})
+    return df_tiendas, df_bodega
+
+def test_guardar_es_por_contenido(tmp_path):
+    almacen = AlmacenDatos(max_mb=1, carpeta=str(tmp_path))
+    df_tiendas, _ = entradas()
+    
+    clave = almacen.guardar(df_tiendas)
+    
+    assert almacen.guardar(df_tiendas.copy()) == clave
+    assert almacen.estado()['en_memoria'] == 1
+    pd.testing.assert_frame_equal(almacen.obtener(clave), df_tiendas)
+
+def test_expulsada_se_recarga_desde_disco(tmp_path):
+    almacen = AlmacenDatos(max_mb=0, carpeta=str(tmp_path))
+    df_tiendas, df_bodega = entradas()
+    clave_tiendas = almacen.guardar(df_tiendas)
+    almacen.guardar(df_bodega)
+    
+    pd.testing.assert_frame_equal(almacen.obtener(clave_tiendas), df_tiendas)
+    assert almacen.estado()['recargas'] == 1
+    # Otra instancia sobre la misma carpeta encuentra lo que quedó en disco
+    assert clave_tiendas in AlmacenDatos(max_mb=0, carpeta=str(tmp_path))
+
+def test_recalculo_comparte_la_corrida_en_el_almacen(tmp_path):
+    almacen = AlmacenDatos(max_mb=64, carpeta=str(tmp_path))
+    sesiones = [RecalculoIncremental(almacen=almacen) for _ in range(3)]
+    
+    corridas = [sesion.calcular(*entradas(), 2, 8, 20) for sesion in sesiones]
+    
+    # Cada sesión retiene solo claves; las tablas de las tres corridas iguales están una vez
+    assert all(isinstance(clave, str) for sesion in sesiones for clave in sesion._estado.values())
+    assert len({tuple(sorted(sesion._estado.items())) for sesion in sesiones}) == 1
+    assert almacen.estado()['en_memoria'] == 4
+    for df_resultados, _, stock_final, _ in corridas[1:]:
+        pd.testing.assert_frame_equal(df_resultados, corridas[0][0])
+        assert stock_final == corridas[0][2]
+
+def test_recalculo_usa_las_claves_indicadas(tmp_path):
+    almacen = AlmacenDatos(max_mb=64, carpeta=str(tmp_path))
+    recalculo = RecalculoIncremental(almacen=almacen)
+    
+    df_resultados, _, _, _ = recalculo.calcular(*entradas(), 2, 8, 20, claves={'resultados': 'resultados-x'})
+    
+    assert almacen.obtener('resultados-x') is df_resultados
+    df_tiendas, df_bodega = entradas()
+    df_tiendas.loc[0, 'stock_actual'] = 2
+    _, _, _, skus_recalculados = recalculo.calcular(df_tiendas, df_bodega, 2, 8, 20)
+    assert skus_recalculados == 1
@@ -0,0 +1,125 @@
+"""
+Pruebas del servicio HTTP (sugerido_api.py): conexiones keep-alive cuando la
+respuesta sale antes de leer el cuerpo, y el pool de procesos después de perder un proceso.
+"""
+import http.client
+import io
+import json
+import os
+import socket
+import threading
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from motor_sugerido import validar_entradas
+from sugerido_api import ServidorSugerido
+from test_motor import generar_entradas
+
+# Solicitud completa escondida en el cuerpo: si el servidor no la lee como cuerpo,
+# la interpretaría como la siguiente solicitud de la conexión
+CONTRABANDO = b"GET /salud HTTP/1.1\r\nHost: x\r\n\r\n"
+
+@pytest.fixture
+def servidor():
+    servidor = ServidorSugerido(('127.0.0.1', 0), procesos=1, cola=1, max_cuerpo_mb=1)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+def _enviar_crudo(servidor, solicitud):
+    """Envía los bytes por un socket y lee hasta que el servidor cierra la conexión"""
+    with socket.create_connection(servidor.server_address, timeout=5) as sock:
+        sock.sendall(solicitud)
+        recibido = b''
+        while True:
+            try:
+                bloque = sock.recv(65536)
+            except ConnectionResetError:
+                break
+            if not bloque:
+                break
+            recibido += bloque
+    return recibido
+
+def _post(ruta, tipo, cuerpo, largo=None):
+    cabeceras = f"POST {ruta} HTTP/1.1\r\nHost: x\r\nContent-Type: {tipo}\r\nContent-Length: {len(cuerpo) if largo is None else largo}\r\n\r\n"
+    return cabeceras.encode() + cuerpo
+
+@pytest.mark.parametrize('ruta, tipo, estado', [
+    ('/sugerido', 'text/plain', 415),
+    ('/sugerido?modo=otro', 'application/zip', 400),
+    ('/desconocida', 'application/zip', 404),
+])
+def test_error_antes_del_cuerpo_cierra_la_conexion(servidor, ruta, tipo, estado):
+    recibido = _enviar_crudo(servidor, _post(ruta, tipo, CONTRABANDO))
+    
+    # Una sola respuesta, con el error, y la conexión cerrada: el cuerpo no se ejecuta como solicitud
+    assert recibido.count(b'HTTP/1.1 ') == 1
+    assert recibido.startswith(f"HTTP/1.1 {estado} ".encode())
+    assert b'Connection: close' in recibido
+
+def test_cuerpo_demasiado_grande_no_se_lee(servidor):
+    # Se anuncia más que el máximo y se envía solo la solicitud escondida
+    recibido = _enviar_crudo(servidor, _post('/sugerido', 'application/zip', CONTRABANDO, largo=2 * 1024 * 1024))
+    
+    assert recibido.count(b'HTTP/1.1 ') == 1
+    assert recibido.startswith(b"HTTP/1.1 413 ")
+    assert b'Connection: close' in recibido
+
+def test_conexion_sigue_utilizable_despues_de_cerrar(servidor):
+    conexion = http.client.HTTPConnection(*servidor.server_address, timeout=5)
+    conexion.request('POST', '/sugerido', body=CONTRABANDO, headers={'Content-Type': 'text/plain'})
+    respuesta = conexion.getresponse()
+    assert respuesta.status == 415
+    assert respuesta.will_close
+    respuesta.read()
+    
+    # http.client abre una conexión nueva; la respuesta es la del GET, no un 400 del cuerpo anterior
+    conexion.request('GET', '/salud')
+    respuesta = conexion.getresponse()
+    assert respuesta.status == 200
+    assert json.loads(respuesta.read())['estado'] == 'ok'
+    conexion.close()
+
+def test_salud_mantiene_la_conexion(servidor):
+    conexion = http.client.HTTPConnection(*servidor.server_address, timeout=5)
+    for _ in range(2):
+        conexion.request('GET', '/salud')
+        respuesta = conexion.getresponse()
+        assert respuesta.status == 200
+        assert not respuesta.will_close
+        respuesta.read()
+    conexion.close()
+
+def _zip_entradas():
+    df_tiendas, df_bodega, _ = validar_entradas(*generar_entradas(5, 4, 0, 50))
+    cuerpo = io.BytesIO()
+    with zipfile.ZipFile(cuerpo, 'w') as archivo:
+        archivo.writestr('stock_tiendas.csv', df_tiendas.to_csv(index=False))
+        archivo.writestr('stock_bodega.csv', df_bodega.to_csv(index=False))
+    return cuerpo.getvalue()
+
+def test_pool_roto_responde_503_y_se_recrea(servidor):
+    pool_roto = servidor.pool
+    # Un proceso del pool termina de golpe (como al quedarse sin memoria): el pool queda roto
+    with pytest.raises(BrokenProcessPool):
+        pool_roto.submit(os._exit, 1).result()
+    conexion = http.client.HTTPConnection(*servidor.server_address, timeout=30)
+    cuerpo = _zip_entradas()
+    
+    conexion.request('POST', '/sugerido?formato=csv', body=cuerpo, headers={'Content-Type': 'application/zip'})
+    respuesta = conexion.getresponse()
+    assert respuesta.status == 503
+    assert respuesta.getheader('Retry-After') == '1'
+    respuesta.read()
+    assert servidor.pool is not pool_roto
+    
+    conexion.request('POST', '/sugerido?formato=csv', body=cuerpo, headers={'Content-Type': 'application/zip'})
+    respuesta = conexion.getresponse()
+    assert respuesta.status == 200
+    assert respuesta.read().startswith(b'tienda_id,')
+    conexion.close()
@@ -0,0 +1,313 @@
+"""
+Pruebas del motor: el cálculo vectorizado (calcular_sugerido_con_prioridad) debe
+entregar lo mismo que la implementación de referencia fila a fila, y las corridas
+por particiones, por bloques e incrementales lo mismo que una corrida completa.
+"""
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from motor_sugerido import (
+    REPARTO_PROPORCIONAL,
+    calcular_resumenes,
+    calcular_sugerido_con_prioridad,
+    calcular_sugerido_referencia,
+    formatear_razon,
+    resolver_excepciones,
+    validar_entradas,
+)
+from sugerido_incremental import RecalculoIncremental
+from sugerido_particionado import calcular_sugerido_particionado
+from sugerido_tareas import Progreso, calcular_sugerido_por_bloques
+
+COLUMNAS_COMPARADAS = ['tienda_id', 'sku', 'orden_carga', 'estado', 'cantidad_a_despachar',
+                       'stock_bodega_disponible', 'stock_bodega_despues']
+
+def generar_entradas(n_tiendas, n_skus, semilla, stock_maximo):
+    """
+    Entradas aleatorias con stock de bodega cero o negativo, SKUs sin fila en bodega
+    (los dos últimos) y tipo_carga con mayúsculas y minúsculas mezcladas.
+    """
+    aleatorio = np.random.default_rng(semilla)
+    tiendas = [f"T{i:03d}" for i in range(n_tiendas)]
+    skus = [f"SKU-{i:04d}" for i in range(n_skus)]
+    tienda = np.repeat(tiendas, n_skus)
+    sku = np.tile(skus, n_tiendas)
+    presente = aleatorio.random(len(tienda)) < 0.8
+    tienda, sku = tienda[presente], sku[presente]
+    filas = len(tienda)
+    prioridad = dict(zip(tiendas, aleatorio.integers(1, 6, n_tiendas)))
+    
+    df_tiendas = pd.DataFrame({
+        'tienda_id': tienda,
+        'sku': sku,
+        'producto': ['Producto ' + s for s in sku],
+        'stock_actual': aleatorio.integers(0, 6, filas),
+        'venta_ultima_semana': aleatorio.integers(0, 10, filas),
+        'venta_4_semanas': aleatorio.integers(0, 40, filas),
+        'tipo_carga': aleatorio.choice(['reposicion', 'inicial', 'Inicial', 'REPOSICION', 'Reposicion'], filas),
+        'prioridad_tienda': [int(prioridad[t]) for t in tienda]
+    }).sample(frac=1, random_state=semilla).reset_index(drop=True)
+    
+    stock = aleatorio.integers(-3, stock_maximo, n_skus)
+    stock[:3] = [0, -1, 0]
+    df_bodega = pd.DataFrame({'sku': skus[:-2], 'producto': skus[:-2], 'stock_bodega': stock[:-2]})
+    return df_tiendas, df_bodega
+
+@pytest.mark.parametrize('semilla', range(4))
+@pytest.mark.parametrize('stock_maximo', [15, 5000], ids=['escaso', 'holgado'])
+@pytest.mark.parametrize('cargas', [(2, 8, 20), (5, 3, 4), (1, 30, 100)])
+def test_motor_igual_a_referencia(semilla, stock_maximo, cargas):
+    df_tiendas, df_bodega = generar_entradas(30, 25, semilla, stock_maximo)
+    
+    df_resultados, _, stock_final = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, *cargas)
+    df_referencia, _, stock_final_referencia = calcular_sugerido_referencia(df_tiendas, df_bodega, *cargas)
+    
+    obtenido = df_resultados[COLUMNAS_COMPARADAS].astype({'tienda_id': str, 'sku': str}).astype({
+        c: 'int64' for c in COLUMNAS_COMPARADAS[2:] if c != 'estado'
+    })
+    obtenido['estado'] = obtenido['estado'].astype(str)
+    esperado = df_referencia[COLUMNAS_COMPARADAS].astype({'tienda_id': str, 'sku': str, 'estado': str})
+    pd.testing.assert_frame_equal(obtenido, esperado, check_dtype=False)
+    
+    razon = formatear_razon(df_resultados)
+    assert razon.tolist() == df_referencia['razon'].tolist()
+    
+    assert {sku: int(stock) for sku, stock in stock_final.items()} == stock_final_referencia
+
+def assert_resumenes_iguales(obtenido, esperado):
+    """Mismas claves y valores en dos resultados de calcular_resumenes"""
+    assert obtenido.keys() == esperado.keys()
+    for clave, valor in esperado.items():
+        if isinstance(valor, pd.DataFrame):
+            pd.testing.assert_frame_equal(obtenido[clave], valor, obj=clave)
+        else:
+            assert obtenido[clave] == valor, clave
+
+OPCIONES_EQUIVALENCIA = {
+    'secuencial': {},
+    'proporcional': {'reparto': REPARTO_PROPORCIONAL},
+    'capacidad': {'capacidades': pd.DataFrame({'tienda_id': ['T000', 'T003', 'T007'], 'capacidad': [5, 12, 0]})},
+}
+
+@pytest.mark.parametrize('semilla', range(3))
+@pytest.mark.parametrize('stock_maximo', [15, 5000], ids=['escaso', 'holgado'])
+@pytest.mark.parametrize('opciones', OPCIONES_EQUIVALENCIA.values(), ids=OPCIONES_EQUIVALENCIA.keys())
+def test_particionado_igual_a_corrida_completa(tmp_path, semilla, stock_maximo, opciones):
+    df_tiendas, df_bodega, _ = validar_entradas(*generar_entradas(30, 25, semilla, stock_maximo))
+    df_esperado, _, stock_esperado = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, 2, 8, 20, **opciones)
+    ruta = tmp_path / 'stock_tiendas.csv'
+    df_tiendas.to_csv(ruta, index=False)
+    
+    stock_final, resumenes, _, _ = calcular_sugerido_particionado(
+        str(ruta), df_bodega, 2, 8, 20, str(tmp_path / 'resultados.parquet'),
+        n_particiones=4, filas_por_lote=100, **opciones
+    )
+    
+    assert stock_final == stock_esperado
+    assert_resumenes_iguales(resumenes, calcular_resumenes(df_esperado, df_bodega, stock_esperado))
+    obtenido = pd.read_parquet(tmp_path / 'resultados.parquet').sort_values('orden_carga', ignore_index=True)
+    esperado = df_esperado.drop(columns='codigo_razon').assign(razon=formatear_razon(df_esperado))
+    pd.testing.assert_frame_equal(obtenido, esperado[obtenido.columns].astype(obtenido.dtypes.to_dict()))
+
+@pytest.mark.parametrize('semilla', range(3))
+@pytest.mark.parametrize('stock_maximo', [15, 5000], ids=['escaso', 'holgado'])
+@pytest.mark.parametrize('opciones', OPCIONES_EQUIVALENCIA.values(), ids=OPCIONES_EQUIVALENCIA.keys())
+def test_por_bloques_igual_a_corrida_completa(semilla, stock_maximo, opciones):
+    df_tiendas, df_bodega, _ = validar_entradas(*generar_entradas(30, 25, semilla, stock_maximo))
+    progreso = Progreso()
+    
+    df_resultados, resumen_tiendas, stock_final = calcular_sugerido_por_bloques(
+        df_tiendas, df_bodega, 2, 8, 20, progreso=progreso, filas_por_bloque=100, **opciones
+    )
+    
+    df_esperado, resumen_esperado, stock_esperado = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, 2, 8, 20, **opciones)
+    pd.testing.assert_frame_equal(df_resultados, df_esperado)
+    pd.testing.assert_frame_equal(resumen_tiendas, resumen_esperado)
+    assert stock_final == stock_esperado
+    assert df_resultados.attrs == df_esperado.attrs
+    assert_resumenes_iguales(calcular_resumenes(df_resultados, df_bodega, stock_final),
+                             calcular_resumenes(df_esperado, df_bodega, stock_esperado))
+    assert progreso.total == df_tiendas['sku'].nunique()
+
+def cambiar_entradas(df_tiendas, df_bodega, cambio):
+    """Entradas de una segunda corrida: cambia o quita filas de 'Stock Tiendas', o cambia el stock de bodega"""
+    df_tiendas, df_bodega = df_tiendas.copy(), df_bodega.copy()
+    if cambio == 'stock_tiendas':
+        df_tiendas.loc[df_tiendas.index[:5], 'stock_actual'] += 3
+    elif cambio == 'quitar_filas':
+        df_tiendas = df_tiendas.drop(df_tiendas.index[10:20]).reset_index(drop=True)
+    else:
+        df_bodega.loc[df_bodega.index[[2, 5]], 'stock_bodega'] += [4, -df_bodega['stock_bodega'].iloc[5]]
+    return df_tiendas, df_bodega
+
+@pytest.mark.parametrize('semilla', range(3))
+@pytest.mark.parametrize('cambio', ['stock_tiendas', 'quitar_filas', 'stock_bodega'])
+@pytest.mark.parametrize('opciones', OPCIONES_EQUIVALENCIA.values(), ids=OPCIONES_EQUIVALENCIA.keys())
+def test_recalculo_incremental_igual_a_corrida_completa(semilla, cambio, opciones):
+    df_tiendas, df_bodega, _ = validar_entradas(*generar_entradas(30, 25, semilla, 15))
+    recalculo = RecalculoIncremental()
+    recalculo.calcular(df_tiendas, df_bodega, 2, 8, 20, **opciones)
+    df_tiendas, df_bodega = cambiar_entradas(df_tiendas, df_bodega, cambio)
+    
+    df_resultados, resumen_tiendas, stock_final, recalculados = recalculo.calcular(df_tiendas, df_bodega, 2, 8, 20, **opciones)
+    
+    df_esperado, resumen_esperado, stock_esperado = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, 2, 8, 20, **opciones)
+    pd.testing.assert_frame_equal(df_resultados, df_esperado)
+    pd.testing.assert_frame_equal(resumen_tiendas, resumen_esperado)
+    assert stock_final == stock_esperado
+    assert df_resultados.attrs == df_esperado.attrs
+    assert_resumenes_iguales(calcular_resumenes(df_resultados, df_bodega, stock_final),
+                             calcular_resumenes(df_esperado, df_bodega, stock_esperado))
+    # Con capacidad por tienda siempre se recalcula completo
+    n_skus = df_tiendas['sku'].nunique()
+    assert recalculados == n_skus if 'capacidades' in opciones else 0 < recalculados < n_skus
+
+def test_entradas_cubren_los_casos_limite():
+    df_tiendas, df_bodega = generar_entradas(30, 25, 0, 15)
+    df_resultados, _, _ = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, 2, 8, 20)
+    
+    assert (df_bodega['stock_bodega'] <= 0).any()
+    assert not df_tiendas['sku'].isin(df_bodega['sku']).all()
+    assert df_tiendas['tipo_carga'].str.islower().any() and not df_tiendas['tipo_carga'].str.islower().all()
+    assert {'Parcialmente cargada', 'Completa', 'Sin necesidad'} <= set(df_resultados['estado'].astype(str))
+    # Filas con necesidad que quedan en cero (bodega en cero o negativa, o agotada antes)
+    assert ((df_resultados['cantidad_a_despachar'] <= 0) & (df_resultados['cantidad_sugerida'] > 0)).any()
+
+def reparto_proporcional_referencia(df_resultados, df_bodega):
+    """
+    Reparto proporcional fila a fila: por SKU y prioridad, si el stock no alcanza
+    cada fila recibe la parte entera de su cuota exacta y las unidades sobrantes van
+    a los mayores restos; los empates se resuelven en orden de carga.
+    """
+    stock = dict(zip(df_bodega['sku'], df_bodega['stock_bodega']))
+    cantidades = {}
+    filas = df_resultados.sort_values('orden_carga')
+    for (sku, _), grupo in filas.groupby(['sku', 'prioridad'], sort=True, observed=True):
+        demanda = int(grupo['cantidad_sugerida'].sum())
+        disponible = min(stock.get(sku, 0), demanda)
+        cuotas = {fila: Fraction(int(sugerida) * disponible, max(demanda, 1))
+                  for fila, sugerida in zip(grupo.index, grupo['cantidad_sugerida'])}
+        asignado = {fila: int(cuota) for fila, cuota in cuotas.items()}
+        sobrantes = disponible - sum(asignado.values())
+        por_resto = sorted(cuotas, key=lambda fila: -(cuotas[fila] - asignado[fila]))  # estable: orden de carga
+        for fila in por_resto[:sobrantes]:
+            asignado[fila] += 1
+        cantidades.update(asignado)
+        stock[sku] = stock.get(sku, 0) - disponible
+    return pd.Series(cantidades).reindex(df_resultados.index)
+
+@pytest.mark.parametrize('semilla', range(4))
+@pytest.mark.parametrize('stock_maximo', [15, 60, 5000], ids=['escaso', 'justo', 'holgado'])
+def test_reparto_proporcional_igual_a_referencia(semilla, stock_maximo):
+    df_tiendas, df_bodega, _ = validar_entradas(*generar_entradas(30, 25, semilla, stock_maximo))
+    
+    df_resultados, _, stock_final = calcular_sugerido_con_prioridad(
+        df_tiendas, df_bodega, 2, 8, 20, reparto=REPARTO_PROPORCIONAL
+    )
+    
+    esperado = reparto_proporcional_referencia(df_resultados, df_bodega)
+    assert df_resultados['cantidad_a_despachar'].tolist() == esperado.tolist()
+    # Totales por SKU y prioridad: todo el stock que alcanza, sin pasar la demanda
+    por_grupo = df_resultados.groupby(['sku', 'prioridad'], observed=True)[['cantidad_a_despachar', 'cantidad_sugerida']].sum()
+    assert (por_grupo['cantidad_a_despachar'] <= por_grupo['cantidad_sugerida']).all()
+    despachado = df_resultados.groupby('sku', observed=True)['cantidad_a_despachar'].sum()
+    inicial = df_bodega.set_index('sku')['stock_bodega']
+    assert all(stock_final[sku] == inicial[sku] - despachado.get(sku, 0) >= 0 for sku in inicial.index)
+
+def test_reparto_proporcional_empates_en_orden_de_carga():
+    # Tres tiendas con la misma prioridad y demanda 4 para 5 unidades: cuota 5/3 para cada una
+    df_tiendas = pd.DataFrame({
+        'tienda_id': ['C', 'A', 'B', 'D'],
+        'sku': ['SKU-1'] * 4,
+        'stock_actual': [0, 0, 0, 0],
+        'tipo_carga': ['inicial'] * 4,
+        'prioridad_tienda': [1, 1, 1, 2]
+    })
+    df_bodega = pd.DataFrame({'sku': ['SKU-1'], 'stock_bodega': [5]})
+    
+    df_resultados, _, stock_final = calcular_sugerido_con_prioridad(
+        df_tiendas, df_bodega, 1, 4, 10, reparto=REPARTO_PROPORCIONAL
+    )
+    
+    despacho = df_resultados.set_index('tienda_id')['cantidad_a_despachar'].to_dict()
+    assert despacho == {'A': 2, 'B': 2, 'C': 1, 'D': 0}
+    assert stock_final == {'SKU-1': 0}
+
+def capacidad_referencia(df_resultados, df_bodega, capacidades):
+    """
+    Asignación con capacidad fila a fila en orden de carga: cada fila recibe lo que
+    permiten el stock del SKU y la capacidad que le queda a la tienda (unidades x
+    volumen); la primera fila que no cabe completa cierra la tienda.
+    """
+    stock = dict(zip(df_bodega['sku'], df_bodega['stock_bodega']))
+    volumen = dict(zip(df_bodega['sku'], df_bodega['volumen'])) if 'volumen' in df_bodega.columns else {}
+    restante = dict(zip(capacidades['tienda_id'], capacidades['capacidad'].astype(float)))
+    cantidades, limitadas = {}, {}
+    for fila in df_resultados.sort_values('orden_carga').itertuples():
+        deseada = min(int(fila.cantidad_sugerida), stock.get(fila.sku, 0))
+        cantidad = deseada
+        if fila.tienda_id in restante:
+            vol = volumen.get(fila.sku, 1)
+            cantidad = min(deseada, int(max(restante[fila.tienda_id], 0) // vol))
+            restante[fila.tienda_id] = 0.0 if cantidad < deseada else restante[fila.tienda_id] - cantidad * vol
+        cantidades[fila.Index], limitadas[fila.Index] = cantidad, cantidad < deseada
+        stock[fila.sku] = stock.get(fila.sku, 0) - cantidad
+    return pd.Series(cantidades), pd.Series(limitadas), stock, restante
+
+@pytest.mark.parametrize('semilla', range(4))
+@pytest.mark.parametrize('stock_maximo', [15, 5000], ids=['escaso', 'holgado'])
+@pytest.mark.parametrize('con_volumen', [False, True], ids=['unidades', 'volumen'])
+def test_capacidad_igual_a_referencia(semilla, stock_maximo, con_volumen):
+    df_tiendas, df_bodega, _ = validar_entradas(*generar_entradas(30, 25, semilla, stock_maximo))
+    aleatorio = np.random.default_rng(semilla)
+    if con_volumen:
+        # Volúmenes exactos en binario, para comparar la capacidad restante sin tolerancia
+        df_bodega['volumen'] = aleatorio.choice([0.5, 1.0, 2.5, 4.0], len(df_bodega))
+    tiendas = df_tiendas['tienda_id'].drop_duplicates().to_numpy()[::2]  # la mitad de las tiendas, sin límite el resto
+    capacidades = pd.DataFrame({'tienda_id': tiendas, 'capacidad': aleatorio.integers(0, 25, len(tiendas))})
+    
+    df_resultados, _, stock_final = calcular_sugerido_con_prioridad(
+        df_tiendas, df_bodega, 2, 8, 20, capacidades=capacidades
+    )
+    
+    cantidades, limitadas, stock_referencia, restante = capacidad_referencia(df_resultados, df_bodega, capacidades)
+    assert df_resultados['cantidad_a_despachar'].tolist() == cantidades.reindex(df_resultados.index).tolist()
+    assert df_resultados['por_capacidad'].tolist() == limitadas.reindex(df_resultados.index).tolist()
+    assert {sku: int(stock) for sku, stock in stock_final.items()} == {sku: int(stock_referencia[sku]) for sku in stock_final}
+    assert df_resultados.attrs['capacidad_restante'] == {
+        tienda: restante[tienda] for tienda in df_resultados.attrs['capacidad_restante']
+    }
+    if stock_maximo > 15:
+        assert df_resultados['por_capacidad'].any()  # con stock holgado limita la capacidad
+
+def test_excepciones_prioridad_tienda_sku_luego_sku_luego_tienda():
+    tiendas, skus = ['T1', 'T2', 'T3'], ['S1', 'S2', 'S3']
+    df_tiendas = pd.DataFrame({
+        'tienda_id': np.repeat(tiendas, 3),
+        'sku': np.tile(skus, 3),
+        'stock_actual': 0,
+        'tipo_carga': 'inicial',
+        'prioridad_tienda': 1
+    })
+    df_bodega = pd.DataFrame({'sku': skus, 'stock_bodega': 1000})
+    excepciones = pd.DataFrame({
+        'tienda_id': ['T1', None, None, 'T1', 'T2'],
+        'sku': [None, 'S1', 'S3', 'S1', 'S2'],
+        'carga_minima': [None, None, None, None, None],
+        'carga_inicial': [5, 7, 8, 9, None],  # T2+S2 no fija carga_inicial: rige el nivel siguiente
+        'carga_maxima': [None, None, None, None, 6]
+    })
+    
+    df_resultados, _, _ = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, 1, 3, 100, excepciones=excepciones)
+    
+    sugerida = df_resultados.set_index(['tienda_id', 'sku'])['cantidad_sugerida'].astype(int).to_dict()
+    assert sugerida == {
+        ('T1', 'S1'): 9, ('T1', 'S2'): 5, ('T1', 'S3'): 8,  # tienda+SKU, tienda, SKU antes que tienda
+        ('T2', 'S1'): 7, ('T2', 'S2'): 3, ('T2', 'S3'): 8,  # T2+S2 solo limita el máximo
+        ('T3', 'S1'): 7, ('T3', 'S2'): 3, ('T3', 'S3'): 8,  # sin excepción de tienda: SKU o el valor general
+    }
+    valores = resolver_excepciones(df_tiendas, excepciones)
+    assert valores['carga_maxima'][(df_tiendas['tienda_id'] == 'T2') & (df_tiendas['sku'] == 'S2')].tolist() == [6]
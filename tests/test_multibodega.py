@@ -0,0 +1,72 @@
+"""
+Pruebas de calcular_sugerido_multibodega: la bodega de respaldo cubre lo que la
+principal no alcanza y ninguna bodega queda con stock negativo.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from motor_sugerido import validar_entradas
+from sugerido_multibodega import calcular_sugerido_multibodega, validar_asignacion
+from test_motor import generar_entradas
+
+def test_respaldo_cubre_lo_que_falta_en_la_principal():
+    # Tres tiendas piden 3 unidades de SKU-1 a CD1, que tiene 5; CD2 (respaldo) tiene 4
+    df_tiendas = pd.DataFrame({
+        'tienda_id': ['A', 'B', 'C'],
+        'sku': ['SKU-1'] * 3,
+        'stock_actual': [0, 0, 0],
+        'tipo_carga': ['inicial'] * 3,
+        'prioridad_tienda': [1, 2, 3]
+    })
+    df_bodega = pd.DataFrame({'bodega_id': ['CD1', 'CD2', 'CD1'], 'sku': ['SKU-1', 'SKU-1', 'SKU-2'], 'stock_bodega': [5, 4, 1]})
+    df_asignacion = validar_asignacion(pd.DataFrame({
+        'tienda_id': ['A', 'B', 'C'], 'bodega_principal': ['CD1'] * 3, 'bodega_respaldo': ['CD2'] * 3
+    }))
+    df_tiendas, df_bodega, _ = validar_entradas(df_tiendas, df_bodega)
+    
+    df_resultados, _, stock_final, stock_por_bodega = calcular_sugerido_multibodega(
+        df_tiendas, df_bodega, df_asignacion, 1, 3, 10, procesos=1
+    )
+    
+    # CD1 alcanza para A y 2 de B; el respaldo completa B y carga C, en orden de carga
+    resultados = df_resultados.set_index('tienda_id')
+    assert resultados['cantidad_a_despachar'].to_dict() == {'A': 3, 'B': 3, 'C': 3}
+    assert resultados['cantidad_respaldo'].to_dict() == {'A': 0, 'B': 1, 'C': 3}
+    por_bodega = stock_por_bodega.set_index(['bodega_id', 'sku'])
+    assert por_bodega.loc[('CD1', 'SKU-1'), ['despacho_principal', 'despacho_respaldo', 'stock_bodega_final']].tolist() == [5, 0, 0]
+    assert por_bodega.loc[('CD2', 'SKU-1'), ['despacho_principal', 'despacho_respaldo', 'stock_bodega_final']].tolist() == [0, 4, 0]
+    assert por_bodega.loc[('CD1', 'SKU-2'), 'stock_bodega_final'] == 1
+    assert stock_final == {'SKU-1': 0, 'SKU-2': 1}
+
+@pytest.mark.parametrize('semilla', range(4))
+def test_stock_por_bodega_nunca_negativo(semilla):
+    df_tiendas, df_bodega = generar_entradas(30, 25, semilla, 15)
+    aleatorio = np.random.default_rng(semilla)
+    # Los mismos SKU en dos bodegas: CD1 escasa (se agota) y CD2 con stock para el respaldo
+    df_bodega = pd.concat([
+        df_bodega.assign(bodega_id='CD1', stock_bodega=aleatorio.integers(-2, 15, len(df_bodega))),
+        df_bodega.assign(bodega_id='CD2', stock_bodega=aleatorio.integers(-2, 80, len(df_bodega))),
+    ], ignore_index=True)
+    tiendas = df_tiendas['tienda_id'].drop_duplicates().to_numpy()
+    principal = aleatorio.choice(['CD1', 'CD2'], len(tiendas), p=[0.8, 0.2])
+    df_asignacion = validar_asignacion(pd.DataFrame({
+        'tienda_id': tiendas,
+        'bodega_principal': principal,
+        'bodega_respaldo': np.where(aleatorio.random(len(tiendas)) < 0.8, np.where(principal == 'CD1', 'CD2', 'CD1'), None)
+    }))
+    df_tiendas, df_bodega, _ = validar_entradas(df_tiendas, df_bodega)
+    
+    df_resultados, _, stock_final, stock_por_bodega = calcular_sugerido_multibodega(
+        df_tiendas, df_bodega, df_asignacion, 2, 8, 20, procesos=1
+    )
+    
+    assert (stock_por_bodega['stock_bodega_final'] >= 0).all()
+    despachado = stock_por_bodega['despacho_principal'] + stock_por_bodega['despacho_respaldo']
+    assert (stock_por_bodega['stock_bodega_final'] == stock_por_bodega['stock_bodega'] - despachado).all()
+    assert stock_por_bodega['despacho_respaldo'].sum() > 0
+    assert df_resultados['cantidad_respaldo'].sum() == stock_por_bodega['despacho_respaldo'].sum()
+    assert (df_resultados['cantidad_respaldo'] <= df_resultados['cantidad_a_despachar']).all()
+    assert (df_resultados['cantidad_a_despachar'] <= df_resultados['cantidad_sugerida']).all()
+    assert (df_resultados.loc[df_resultados['bodega_respaldo'].isna(), 'cantidad_respaldo'] == 0).all()
+    assert all(stock >= 0 for stock in stock_final.values())
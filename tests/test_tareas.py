@@ -0,0 +1,63 @@
+"""
+Pruebas de las tareas de fondo (sugerido_tareas.py): tareas compartidas por
+clave y cancelación por sesión.
+"""
+import threading
+
+from sugerido_tareas import CANCELADA, TERMINADA, GestorTareas
+
+def funcion_bloqueada(liberar):
+    """Tarea que corre hasta que se libera el evento, revisando si se pidió cancelar"""
+    def funcion(progreso):
+        while not liberar.wait(0.01):
+            progreso.actualizar('calculo')
+        return 'listo'
+    return funcion
+
+def test_misma_clave_entrega_la_misma_tarea():
+    gestor = GestorTareas()
+    liberar = threading.Event()
+    
+    tarea = gestor.iniciar('clave', funcion_bloqueada(liberar), interesado='A')
+    otra = gestor.iniciar('clave', funcion_bloqueada(liberar), interesado='B')
+    
+    assert otra is tarea
+    assert tarea.interesados == {'A', 'B'}
+    liberar.set()
+    assert tarea.esperar(5)
+    assert tarea.estado == TERMINADA and tarea.resultado == 'listo'
+
+def test_cancelar_desde_una_sesion_no_detiene_a_la_otra():
+    gestor = GestorTareas()
+    liberar = threading.Event()
+    tarea = gestor.iniciar('clave', funcion_bloqueada(liberar), interesado='A')
+    tarea.unir('B')
+    
+    assert not tarea.cancelar('B')
+    assert not tarea.espera('B') and tarea.espera('A')
+    assert not tarea.progreso.cancelado
+    
+    liberar.set()
+    assert tarea.esperar(5)
+    assert tarea.estado == TERMINADA
+
+def test_cancelar_la_ultima_sesion_detiene_la_tarea():
+    gestor = GestorTareas()
+    tarea = gestor.iniciar('clave', funcion_bloqueada(threading.Event()), interesado='A')
+    tarea.unir('B')
+    
+    assert not tarea.cancelar('A')
+    assert tarea.cancelar('B')
+    assert tarea.esperar(5)
+    assert tarea.estado == CANCELADA
+
+def test_descartar_cancela_para_todos():
+    gestor = GestorTareas()
+    tarea = gestor.iniciar('clave', funcion_bloqueada(threading.Event()), interesado='A')
+    tarea.unir('B')
+    
+    gestor.descartar('clave')
+    
+    assert tarea.esperar(5)
+    assert tarea.estado == CANCELADA
+    assert gestor.obtener('clave') is None
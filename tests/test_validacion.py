@@ -0,0 +1,101 @@
+"""
+Pruebas de validar_entradas: reglas por fila y normalización antes de calcular.
+"""
+import pandas as pd
+import pytest
+
+from motor_sugerido import (
+    NIVEL_AVISO,
+    NIVEL_ERROR,
+    REPARTO_PROPORCIONAL,
+    REPARTO_SECUENCIAL,
+    calcular_sugerido_con_prioridad,
+    validar_entradas,
+)
+from sugerido_multibodega import calcular_sugerido_multibodega, validar_asignacion
+from sugerido_particionado import ErrorValidacion, calcular_sugerido_particionado
+from test_motor import generar_entradas
+
+def entradas_stock_negativo():
+    """Un SKU con stock de bodega -3 pedido por dos tiendas"""
+    df_tiendas = pd.DataFrame({
+        'tienda_id': ['A', 'B'],
+        'sku': ['SKU-1', 'SKU-1'],
+        'stock_actual': [0, 0],
+        'tipo_carga': ['reposicion', 'reposicion'],
+        'prioridad_tienda': [1, 2]
+    })
+    df_bodega = pd.DataFrame({'sku': ['SKU-1'], 'stock_bodega': [-3]})
+    return df_tiendas, df_bodega
+
+def test_stock_bodega_negativo_se_toma_cero():
+    df_tiendas, df_bodega = entradas_stock_negativo()
+    
+    df_tiendas, df_bodega, df_errores = validar_entradas(df_tiendas, df_bodega)
+    
+    assert df_bodega['stock_bodega'].tolist() == [0]
+    negativos = df_errores[df_errores['columna'] == 'stock_bodega']
+    assert negativos['nivel'].astype(str).tolist() == [NIVEL_AVISO]
+    assert negativos['fila'].tolist() == [2]
+    assert not (df_errores['nivel'] == NIVEL_ERROR).any()
+
+@pytest.mark.parametrize('opciones', [
+    {'reparto': REPARTO_SECUENCIAL},
+    {'reparto': REPARTO_PROPORCIONAL},
+    {'capacidades': pd.DataFrame({'tienda_id': ['A'], 'capacidad': [10]})},
+], ids=['secuencial', 'proporcional', 'capacidad'])
+def test_stock_bodega_negativo_no_despacha_negativo(opciones):
+    df_tiendas, df_bodega, _ = validar_entradas(*entradas_stock_negativo())
+    
+    df_resultados, _, stock_final = calcular_sugerido_con_prioridad(df_tiendas, df_bodega, 2, 8, 20, **opciones)
+    
+    assert df_resultados['cantidad_a_despachar'].tolist() == [0, 0]
+    assert df_resultados['stock_despues'].tolist() == [0, 0]
+    assert (df_resultados['stock_bodega_despues'] >= 0).all()
+    assert stock_final == {'SKU-1': 0}
+
+def test_stock_bodega_negativo_con_varias_bodegas():
+    df_tiendas, df_bodega = entradas_stock_negativo()
+    df_bodega = pd.DataFrame({'bodega_id': ['CD1', 'CD2'], 'sku': ['SKU-1', 'SKU-1'], 'stock_bodega': [-3, 1]})
+    df_asignacion = validar_asignacion(pd.DataFrame({
+        'tienda_id': ['A', 'B'], 'bodega_principal': ['CD1', 'CD1'], 'bodega_respaldo': ['CD2', 'CD2']
+    }))
+    df_tiendas, df_bodega, _ = validar_entradas(df_tiendas, df_bodega)
+    
+    df_resultados, _, stock_final, stock_por_bodega = calcular_sugerido_multibodega(
+        df_tiendas, df_bodega, df_asignacion, 2, 8, 20, procesos=1
+    )
+    
+    # La tienda A recibe del respaldo la unidad de CD2; CD1 queda en 0, no en -3
+    assert df_resultados['cantidad_a_despachar'].tolist() == [1, 0]
+    assert stock_por_bodega.set_index('bodega_id')['stock_bodega_final'].to_dict() == {'CD1': 0, 'CD2': 0}
+    assert stock_final == {'SKU-1': 0}
+
+def test_stock_tienda_negativo_es_error():
+    df_tiendas, df_bodega = entradas_stock_negativo()
+    df_tiendas.loc[1, 'stock_actual'] = -1
+    
+    _, _, df_errores = validar_entradas(df_tiendas, df_bodega)
+    
+    errores = df_errores[df_errores['nivel'] == NIVEL_ERROR]
+    assert errores['columna'].astype(str).tolist() == ['stock_actual']
+    assert errores['fila'].tolist() == [3]
+
+def test_particionado_valida_con_las_filas_del_archivo(tmp_path):
+    df_tiendas, df_bodega = generar_entradas(30, 25, 0, 15)
+    df_tiendas.loc[5, 'tipo_carga'] = 'otra'
+    df_tiendas.loc[3, 'stock_actual'] = None
+    df_tiendas = pd.concat([df_tiendas, df_tiendas.iloc[[7]]], ignore_index=True)
+    ruta = tmp_path / 'stock_tiendas.csv'
+    df_tiendas.to_csv(ruta, index=False)
+    
+    with pytest.raises(ErrorValidacion) as error:
+        calcular_sugerido_particionado(str(ruta), df_bodega, 2, 8, 20, str(tmp_path / 'resultados.parquet'),
+                                       n_particiones=4, filas_por_lote=100)
+    
+    # Mismos problemas y filas que validar todo el archivo de una vez
+    _, _, esperado = validar_entradas(pd.read_csv(ruta, dtype={'stock_actual': 'Int64'}), df_bodega)
+    pd.testing.assert_frame_equal(error.value.df_errores.astype(str), esperado.astype(str))
+    errores = error.value.df_errores[error.value.df_errores['nivel'] == NIVEL_ERROR]
+    assert sorted(errores['fila'].tolist()) == [5, 7, 9, len(df_tiendas) + 1]
+    assert not (tmp_path / 'resultados.parquet').exists()